@@ -8,7 +8,7 @@ require('dotenv').config({ path: path.join(__dirname, '.env') });
 //const PYTHON_PATH = 'C:\\Users\\unnat\\venv\\Scripts\\python.exe';
 //const PYTHON_PATH = 'C:\\Users\\user\\venv\\Scripts\\python.exe';
 const PYTHON_PATH = 'C:\\Users\\user\\venv\\Scripts\\python.exe'
-const TEMP_DOWNLOADS_DIR = path.join(__dirname, '../../../processing/temp_downloads');
+const TEMP_DOWNLOADS_DIR = path.join(__dirname, '../../processing/temp_downloads');
 const { EMAIL_USER, ALERT_RECIPIENT } = process.env;
 
 
@@ -242,26 +242,11 @@ const sendAlertEmail = async (transporter, recipient, changeDetails) => {
 };
 
 
-const MONITORING_TASKS_FILE = path.join(__dirname, '../../processing/monitoring_tasks.json');
+// Monitoring tasks live in the scheduler's SQLite task store (processing/task_store.py).
+// Each change is a single-row transaction instead of a rewrite of the whole task list.
+const addMonitoringTask = (task) => runPythonScript('task_store.py', ['add', JSON.stringify(task)]);
 
-
-
-
-// Helper function to read monitoring tasks from a file
-const getMonitoringTasks = () => {
-    if (!fs.existsSync(MONITORING_TASKS_FILE)) {
-        return [];
-    }
-    const data = fs.readFileSync(MONITORING_TASKS_FILE, 'utf-8');
-    return JSON.parse(data);
-};
-
-
-
-// Helper function to save monitoring tasks to a file
-const saveMonitoringTasks = (tasks) => {
-    fs.writeFileSync(MONITORING_TASKS_FILE, JSON.stringify(tasks, null, 2));
-};
+const clearMonitoringTasks = () => runPythonScript('task_store.py', ['clear']);
 
 
 
@@ -403,56 +388,17 @@ exports.submitAOI = async (req, res) => {
         const t1_path = downloadResult.t1_path;
         const t2_path = downloadResult.t2_path;
         
-        let ndviResult, unetResult;
-        const promises = [];
-
-        if (detectionMethods.includes('vegetation')) {
-            promises.push(runPythonScript('gee_change_detection.py', [t1_path, t2_path, threshold]));
-        } else {
-            promises.push(Promise.resolve(null));
-        }
-
-        if (detectionMethods.includes('structural')) {
-            promises.push(runPythonScript('unet_inference.py', [t1_path, t2_path]));
-        } else {
-            promises.push(Promise.resolve(null));
-        }
-
-        [ndviResult, unetResult, cvaResult] = await Promise.all(promises);
-
-        const finalResponse = {
-            status: 'success',
-            message: "Change detection tasks completed.",
-            ndvi_summary: ndviResult ? ndviResult.summary : null,
-            unet_summary: unetResult ? {
-                message: unetResult.message,
-                percentage_change: unetResult.percentage_change,
-                total_change_pixels: unetResult.total_change_pixels,
-                change_mask_path: unetResult.change_mask_path
-            } : null,
-            cva_summary: cvaResult ? cvaResult.summary : null
-        };
-        
-        let combinedChange = 0;
-        let changeCount = 0;
-
-        if (finalResponse.ndvi_summary) {
-            combinedChange += finalResponse.ndvi_summary.percentage_change;
-            changeCount++;
-        }
-        if (finalResponse.unet_summary) {
-            combinedChange += finalResponse.unet_summary.percentage_change;
-            changeCount++;
-        }
-if (finalResponse.cva_summary) {
-        combinedChange += finalResponse.cva_summary.percentage_change;
-        changeCount++;
-    }
-        if (changeCount > 0) {
-            combinedChange = combinedChange / changeCount;
-        }
-
-        // Log the values for debugging
+        // One process decodes the pair once and runs every selected detector on it
+        const finalResponse = await runPythonScript('pair_analysis.py', [
+            t1_path,
+            t2_path,
+            threshold,
+            '--methods',
+            detectionMethods.join(',')
+        ]);
+        const combinedChange = finalResponse.combined_change;
+
+        // Log the values for debugging
         console.log(`Combined Change: ${combinedChange}%`);
         console.log(`Threshold: ${parseFloat(payload.threshold) * 100}%`);
         console.log(`Comparison result: ${combinedChange > parseFloat(payload.threshold) * 100}`);
@@ -504,9 +450,7 @@ exports.startMonitoring = async (req, res) => {
     };
 
     try {
-        const tasks = getMonitoringTasks();
-        tasks.push(newTask);
-        saveMonitoringTasks(tasks);
+        await addMonitoringTask(newTask);
 
         const pythonProcess = spawn(PYTHON_PATH, [path.join(__dirname, '../../processing/monitoring_scheduler.py')]);
 
@@ -526,10 +470,10 @@ exports.startMonitoring = async (req, res) => {
 };
 
 
-exports.stopMonitoring = (req, res) => {
+exports.stopMonitoring = async (req, res) => {
     try {
-        // Clear the monitoring tasks file by writing an empty array
-        saveMonitoringTasks([]);
+        // Remove every task from the task store
+        await clearMonitoringTasks();
         console.log('All monitoring tasks have been cleared.');
         res.status(200).json({ status: 'success', message: 'Monitoring has been stopped. No further alerts will be sent for previous tasks.' });
     } catch (err) {
@@ -539,13 +483,32 @@ exports.stopMonitoring = (req, res) => {
 };
 
 
-exports.downloadFile = (req, res) => {
+exports.downloadFile = async (req, res) => {
+    // A file name, or a path relative to temp_downloads as returned by the scheduler
+    // (e.g. "<aoi_id>/<file>.png", with the slash URL-encoded)
     const { filename } = req.params;
-    // Sanitize filename to prevent directory traversal attacks
-    const safeFilename = path.basename(filename);
-    const filePath = path.join(TEMP_DOWNLOADS_DIR, safeFilename);
+    const filePath = path.resolve(TEMP_DOWNLOADS_DIR, filename);
+    const safeFilename = path.relative(TEMP_DOWNLOADS_DIR, filePath);
+    // Prevent directory traversal attacks
+    if (!filePath.startsWith(TEMP_DOWNLOADS_DIR + path.sep)) {
+        return res.status(404).json({ status: 'error', message: 'File not found.' });
+    }
+
+    // Visualizations saved with --visualizations deferred are rendered on first request
+    const pendingPath = `${filePath}.pending.json`;
+    if (!fs.existsSync(filePath) && fs.existsSync(pendingPath)) {
+        try {
+            await runPythonScript('change_visualization.py', ['render', pendingPath]);
+        } catch (error) {
+            // A concurrent request may have rendered it first and removed the pending file
+            if (!fs.existsSync(filePath)) {
+                console.error(`Rendering of ${safeFilename} failed:`, error);
+                return res.status(500).json({ status: 'error', message: 'Error rendering the file.' });
+            }
+        }
+    }
 
-    if (!fs.existsSync(filePath) || !filePath.startsWith(TEMP_DOWNLOADS_DIR)) {
+    if (!fs.existsSync(filePath)) {
         return res.status(404).json({ status: 'error', message: 'File not found.' });
     }
 
@@ -579,50 +542,14 @@ exports.runLocalTest = async (req, res) => {
             });
         }
         
-        let ndviResult, unetResult;
-        const promises = [];
-
-        if (detectionMethods.includes('vegetation')) {
-            promises.push(runPythonScript('gee_change_detection.py', [t1_path, t2_path, threshold]));
-        } else {
-            promises.push(Promise.resolve(null));
-        }
-
-        if (detectionMethods.includes('structural')) {
-            promises.push(runPythonScript('unet_inference.py', [t1_path, t2_path]));
-        } else {
-            promises.push(Promise.resolve(null));
-        }
-        // Add the new CVA promise
-    if (detectionMethods.includes('cva')) {
-        // CVA uses a different script and needs the same paths and threshold
-        promises.push(runPythonScript('cva_change_detection.py', [t1_path, t2_path, threshold]));
-    } else {
-        promises.push(Promise.resolve(null));
-    }
-
-        [ndviResult, unetResult, cvaResult] = await Promise.all(promises);
-
-        const finalResponse = {
-            status: 'success',
-            message: "Local test change detection completed.",
-            ndvi_summary: ndviResult ? {
-                message: ndviResult.message,
-                total_aoi_area_ha: ndviResult.total_aoi_area_ha,
-                gain_area_ha: ndviResult.gain_area_ha,
-                loss_area_ha: ndviResult.loss_area_ha,
-                percentage_change: ndviResult.percentage_change
-            } : null,
-            unet_summary: unetResult ? {
-                message: unetResult.message,
-                percentage_change: unetResult.percentage_change,
-                total_change_pixels: unetResult.total_change_pixels,
-                change_mask_path: unetResult.change_mask_path,
-                change_overlay_png: unetResult.change_overlay_png,
-                change_only_png: unetResult.change_only_png
-            } : null,
-            cva_summary: cvaResult ? cvaResult.summary : null
-        };
+        const finalResponse = await runPythonScript('pair_analysis.py', [
+            t1_path,
+            t2_path,
+            threshold,
+            '--methods',
+            detectionMethods.join(',')
+        ]);
+        finalResponse.message = "Local test change detection completed.";
 
         // You can add the email alert logic here as well if needed.
 
@@ -0,0 +1,77 @@
+# processing/baseline_cache.py
+#
+# LRU store of U-Net baseline (T1) encoder features for incremental monitoring, used
+# when the scheduler runs with --incremental. The T1 encoder features a U-Net run
+# computes anyway are kept, keyed by everything that determines the baseline pixels
+# (AOI geometry, scene id, export size) and by the checkpoint. A later check that
+# selects the same baseline scene (mostly the retry of a failed check) skips the T1
+# encoder and the baseline read. Features of a T2 scene cannot serve as the next
+# baseline, since the two encoders have separate weights. Features are stored at half
+# precision (unet_inference.BASELINE_FEATURE_DTYPE), about 250 MB per 1024x1024 scene,
+# and the cache is bounded by MAX_FEATURE_CACHE_BYTES.
+#
+#   python baseline_cache.py stats
+#   python baseline_cache.py clear
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+from imagery_cache import ImageryCache, cache_cli, geometry_hash
+from change_map_cache import checkpoint_fingerprint
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FEATURE_DIR = os.path.join(BASE_DIR, 'baseline_features')
+# About eight 1024x1024 baselines (unet_inference.MAX_BASELINE_FEATURE_BYTES each).
+MAX_FEATURE_CACHE_BYTES = 2 * 1024 ** 3
+
+
+def baseline_key(geojson, scene_id, dimensions, model_path=None):
+    """
+    Key of the baseline features of one scene of an AOI. A different geometry, scene,
+    export size or checkpoint (by size and modification time) gives a new key.
+    """
+    description = {'geometry': geometry_hash(geojson), 'scene_id': scene_id, 'dimensions': dimensions,
+                   'model': checkpoint_fingerprint(model_path)}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class BaselineFeatureCache(ImageryCache):
+    """
+    ImageryCache holding the T1 encoder features of one baseline scene per .npz, with
+    feature-level load/save on top of fetch/store. fp16 activations barely compress, so
+    the archives are stored uncompressed; the size bound evicts the least recently used.
+    """
+    FILE_SUFFIX = '.npz'
+
+    def __init__(self, cache_dir=FEATURE_DIR, max_bytes=MAX_FEATURE_CACHE_BYTES):
+        super(BaselineFeatureCache, self).__init__(cache_dir, max_bytes)
+
+    def load(self, key):
+        """The cached feature levels for key, or None on a miss."""
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.npz.out')
+        os.close(fd)
+        try:
+            if not self.fetch(key, temp_path):
+                return None
+            with np.load(temp_path) as data:
+                return [data[f'level{level}'] for level in range(int(data['levels']))]
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def save(self, key, levels):
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.npz.in')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, levels=np.array(len(levels)),
+                         **{f'level{level}': features for level, features in enumerate(levels)})
+            self.store(key, temp_path)
+        finally:
+            os.remove(temp_path)
+
+
+if __name__ == '__main__':
+    cache_cli(BaselineFeatureCache(), "Baseline feature cache")
@@ -0,0 +1,398 @@
+# processing/benchmark.py
+#
+# Offline benchmarks of the processing pipeline on synthetic georeferenced 4-band
+# (B4, B3, B2, B8) uint8 pairs shaped like the gee_drive_download.py exports, at
+# sizes from 512x512 to 8192x8192. Every case runs in a fresh subprocess, so the
+# peak RSS it reports is its own; throughput is in megapixels of one scene per second.
+#
+#   python benchmark.py run --sizes 512,1024,2048 --output results.json
+#   python benchmark.py compare baseline.json results.json
+#   python benchmark.py list
+#   python benchmark.py startup
+#
+# compare exits with status 1 when a benchmark got slower or uses more memory than
+# the tolerances allow, so it can gate a change against a stored baseline. startup
+# runs the command-line entry points in fresh interpreters and exits with status 1
+# when one of them misses the startup budget or imports a heavy library before it
+# needs to.
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from importlib import metadata
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+import stage_metrics
+from startup_check import STARTUP_BUDGET_SECONDS, STARTUP_REPEATS, check_startup
+from cog_writer import CogWriter
+from synthetic_scenes import BAND_COUNT, synthetic_block
+
+DEFAULT_SIZES = (512, 1024, 2048, 4096, 8192)
+# The U-Net needs minutes per 4096x4096 scene on a CPU; larger scenes only run with --unet-max-size
+UNET_MAX_SIZE = 2048
+REPEATS = 3
+CASE_TIMEOUT_SECONDS = 3600
+# compare: a benchmark regresses when its throughput drops or its peak RSS grows by more than these fractions
+THROUGHPUT_TOLERANCE = 0.10
+MEMORY_TOLERANCE = 0.10
+
+SEED = 0
+CRS = 'EPSG:32643'
+PIXEL_SIZE_M = 10
+NDVI_THRESHOLD = 0.2
+CVA_THRESHOLD = 40
+
+
+class BenchmarkSkipped(Exception):
+    """A benchmark that cannot run here (missing runtime or model file)."""
+
+
+def pair_paths(data_dir, size):
+    return os.path.join(data_dir, f't1_{size}.tif'), os.path.join(data_dir, f't2_{size}.tif')
+
+
+def write_synthetic_pair(data_dir, size, seed=SEED):
+    """
+    Writes (or reuses) the T1/T2 COGs of one size: the same scene twice with fresh noise,
+    and about 5% of the T2 pixels changed in rectangular patches. Returns their paths.
+    """
+    t1_path, t2_path = pair_paths(data_dir, size)
+    if os.path.exists(t1_path) and os.path.exists(t2_path):
+        return t1_path, t2_path
+
+    rng = np.random.default_rng(seed)
+    patch = max(16, size // 16)
+    changed = [(int(rng.integers(0, size - patch)), int(rng.integers(0, size - patch)), patch, patch)
+               for _ in range(int(0.05 * size * size / (patch * patch)) or 1)]
+    transform = from_origin(500000, 2000000, PIXEL_SIZE_M, PIXEL_SIZE_M)
+    with CogWriter(t1_path, size, size, BAND_COUNT, rasterio.uint8, CRS, transform) as dst_t1, \
+            CogWriter(t2_path, size, size, BAND_COUNT, rasterio.uint8, CRS, transform) as dst_t2:
+        for window in dst_t1.block_windows():
+            t1, t2 = synthetic_block(window, seed, changed)
+            dst_t1.write(t1, window)
+            dst_t2.write(t2, window)
+    return t1_path, t2_path
+
+
+# ==============================================================================
+# BENCHMARKS
+# Each takes (t1_path, t2_path, size, work_dir), does its untimed setup and returns
+# the function that is timed. Pipeline modules are imported here, so a missing
+# runtime only skips the benchmarks that need it.
+# ==============================================================================
+
+def bench_ndvi_calculate(t1_path, t2_path, size, work_dir):
+    import gee_change_detection
+    return lambda: gee_change_detection.calculate_ndvi(t2_path)
+
+
+def bench_ndvi_difference(t1_path, t2_path, size, work_dir):
+    import gee_change_detection
+    return lambda: gee_change_detection.stream_ndvi_change(t1_path, t2_path, NDVI_THRESHOLD)
+
+
+def bench_cva_calculate(t1_path, t2_path, size, work_dir):
+    import cva_change_detection
+    from gee_change_detection import CVA_BANDS
+
+    def run():
+        t1_bands = cva_change_detection.read_bands(t1_path, CVA_BANDS)[0]
+        t2_bands = cva_change_detection.read_bands(t2_path, CVA_BANDS)[0]
+        return cva_change_detection.calculate_cva(t1_bands, t2_bands)
+    return run
+
+
+def bench_cva_stream(t1_path, t2_path, size, work_dir):
+    import cva_change_detection
+    from gee_change_detection import CVA_BANDS
+    return lambda: cva_change_detection.count_cva_changes(t1_path, t2_path, CVA_BANDS, CVA_THRESHOLD)
+
+
+def unet_benchmark(name, fuse=True, int8=False):
+    """U-Net forward over the whole scene (tiled like unet_inference.py) on one execution backend."""
+    def bench(t1_path, t2_path, size, work_dir):
+        try:
+            import unet_inference
+            if name == 'torch' and not int8 and not os.path.exists(unet_inference.MODEL_PATH):
+                # Timing does not depend on the weights; run an untrained network
+                from siamese_unet import SiameseUNet, fuse_for_inference
+                device = unet_inference.get_device()
+                model = SiameseUNet(in_channels=3, out_channels=1).to(device).eval()
+                backend = unet_inference.TorchBackend(fuse_for_inference(model) if fuse else model, device)
+            else:
+                backend = unet_inference.load_backend(name, fuse=fuse, int8=int8)
+        except (ImportError, FileNotFoundError) as e:
+            raise BenchmarkSkipped(str(e))
+        return lambda: unet_inference.predict_change_logits(backend, backend.device, t1_path, t2_path, size, size)
+    return bench
+
+
+def change_logits(t1_path, t2_path):
+    """Stand-in change logits: |NDVI difference| shifted so that NDVI_THRESHOLD maps to 0."""
+    import gee_change_detection
+    with rasterio.open(t1_path) as src_t1, rasterio.open(t2_path) as src_t2:
+        difference = gee_change_detection.ndvi_difference(
+            src_t1.read(gee_change_detection.RED_BAND), src_t1.read(gee_change_detection.NIR_BAND),
+            src_t2.read(gee_change_detection.RED_BAND), src_t2.read(gee_change_detection.NIR_BAND))
+    return np.nan_to_num(np.abs(difference) - NDVI_THRESHOLD, nan=-1.0)
+
+
+def bench_visualizations(t1_path, t2_path, size, work_dir):
+    import change_visualization
+    with rasterio.open(t2_path) as src_t2:
+        t2_rgb = src_t2.read([1, 2, 3])
+    change_mask = change_logits(t1_path, t2_path) > 0
+    return lambda: change_visualization.save_visualizations(t2_rgb, change_mask, work_dir, os.path.basename(t2_path))
+
+
+def bench_mask_write(t1_path, t2_path, size, work_dir):
+    import unet_inference
+    logits = change_logits(t1_path, t2_path)
+    with rasterio.open(t2_path) as src_t2:
+        crs, transform = src_t2.crs, src_t2.transform
+    # Deferred visualizations: only the 1-bit mask COG is written
+    return lambda: unet_inference.save_change_outputs(logits, t2_path, crs, transform, work_dir,
+                                                      visualizations='deferred')
+
+
+def bench_imagery_write(t1_path, t2_path, size, work_dir):
+    from cog_writer import convert_to_cog
+    return lambda: convert_to_cog(t2_path, os.path.join(work_dir, 'imagery.tif'), kind='imagery')
+
+
+BENCHMARKS = {
+    'ndvi_calculate': bench_ndvi_calculate,
+    'ndvi_difference': bench_ndvi_difference,
+    'cva_calculate': bench_cva_calculate,
+    'cva_stream': bench_cva_stream,
+    'unet_eager': unet_benchmark('torch', fuse=False),
+    'unet_fused': unet_benchmark('torch'),
+    'unet_int8': unet_benchmark('torch', int8=True),
+    'unet_torchscript': unet_benchmark('torchscript'),
+    'unet_onnxruntime': unet_benchmark('onnxruntime'),
+    'visualizations': bench_visualizations,
+    'mask_write': bench_mask_write,
+    'imagery_write': bench_imagery_write
+}
+
+
+def run_case(name, size, data_dir, repeats=REPEATS):
+    """
+    Runs one benchmark in this process (see the 'case' command) and returns its result:
+    the best and median wall time over `repeats` runs, the CPU time of the best run and
+    the peak RSS before (setup) and after the timed runs.
+    """
+    t1_path, t2_path = pair_paths(data_dir, size)
+    work_dir = tempfile.mkdtemp(dir=data_dir, prefix=f'{name}_{size}_')
+    try:
+        try:
+            timed = BENCHMARKS[name](t1_path, t2_path, size, work_dir)
+        except BenchmarkSkipped as e:
+            return {"status": "skipped", "reason": str(e)}
+        setup_peak = stage_metrics.peak_rss_bytes()
+
+        runs = []
+        for _ in range(repeats):
+            start = stage_metrics.snapshot()
+            timed()
+            end = stage_metrics.snapshot()
+            runs.append((end.wall - start.wall, end.cpu - start.cpu))
+        wall, cpu = min(runs)
+        return {
+            "status": "success",
+            "wall_s": round(wall, 6),
+            "wall_s_median": round(statistics.median(run[0] for run in runs), 6),
+            "cpu_s": round(cpu, 6),
+            "mpx_per_s": round(size * size / 1e6 / wall, 3) if wall > 0 else None,
+            "setup_peak_rss_bytes": setup_peak,
+            "peak_rss_bytes": stage_metrics.peak_rss_bytes()
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def spawn_case(name, size, data_dir, repeats, timeout=CASE_TIMEOUT_SECONDS):
+    """Runs one benchmark in a fresh interpreter and returns its result dict."""
+    command = [sys.executable, os.path.abspath(__file__), 'case', name, str(size), data_dir, str(repeats)]
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"status": "error", "message": f"Timed out after {timeout} seconds."}
+    lines = [line for line in process.stdout.splitlines() if line.startswith('{')]
+    if process.returncode != 0 or not lines:
+        return {"status": "error", "message": (process.stderr.strip().splitlines() or ['No output.'])[-1]}
+    return json.loads(lines[-1])
+
+
+def package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def host_info():
+    """What the numbers depend on besides the code."""
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "packages": {name: package_version(name) for name in ('numpy', 'rasterio', 'Pillow', 'torch', 'onnxruntime')},
+        "gdal": rasterio.__gdal_version__
+    }
+
+
+def run_benchmarks(sizes, names, output_path, data_dir=None, repeats=REPEATS, unet_max_size=UNET_MAX_SIZE):
+    """Generates the synthetic pairs, runs every benchmark at every size and writes the results file."""
+    own_data_dir = data_dir is None
+    data_dir = data_dir or tempfile.mkdtemp(prefix='benchmark_data_')
+    os.makedirs(data_dir, exist_ok=True)
+    results = []
+    try:
+        for size in sizes:
+            start = time.perf_counter()
+            write_synthetic_pair(data_dir, size)
+            print(f"{size}x{size}: synthetic pair ready ({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+            for name in names:
+                if name.startswith('unet_') and size > unet_max_size:
+                    continue
+                result = dict(spawn_case(name, size, data_dir, repeats), benchmark=name, size=size)
+                results.append(result)
+                if result['status'] == 'success':
+                    print(f"  {name}: {result['wall_s']:.3f}s, {result['mpx_per_s']} Mpx/s, "
+                          f"peak RSS {result['peak_rss_bytes'] / 2 ** 20:.0f} MB", file=sys.stderr)
+                else:
+                    print(f"  {name}: {result['status']} ({result.get('reason') or result.get('message')})",
+                          file=sys.stderr)
+    finally:
+        if own_data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "host": host_info(),
+        "repeats": repeats,
+        "results": results
+    }
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def compare_results(baseline, current, throughput_tolerance=THROUGHPUT_TOLERANCE,
+                    memory_tolerance=MEMORY_TOLERANCE):
+    """
+    Compares two results files benchmark by benchmark. Returns one entry per benchmark
+    and size that succeeded in both, with the relative throughput and peak RSS change
+    and whether it is a regression.
+    """
+    def successful(report):
+        return {(result['benchmark'], result['size']): result for result in report['results']
+                if result['status'] == 'success'}
+
+    baseline_results, current_results = successful(baseline), successful(current)
+    comparisons = []
+    for key in sorted(baseline_results.keys() & current_results.keys()):
+        before, after = baseline_results[key], current_results[key]
+        throughput_change = after['mpx_per_s'] / before['mpx_per_s'] - 1
+        memory_change = (after['peak_rss_bytes'] / before['peak_rss_bytes'] - 1
+                         if before.get('peak_rss_bytes') and after.get('peak_rss_bytes') else None)
+        slower = throughput_change < -throughput_tolerance
+        larger = memory_change is not None and memory_change > memory_tolerance
+        comparisons.append({
+            "benchmark": key[0],
+            "size": key[1],
+            "mpx_per_s": [before['mpx_per_s'], after['mpx_per_s']],
+            "throughput_change": round(throughput_change, 4),
+            "peak_rss_change": None if memory_change is None else round(memory_change, 4),
+            "regression": slower or larger
+        })
+    return comparisons
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Synthetic-data benchmarks of the processing pipeline.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run the benchmarks and write a results file.")
+    run_parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                            help="Comma-separated scene sizes in pixels (default: 512 to 8192).")
+    run_parser.add_argument('--benchmarks', default=','.join(BENCHMARKS),
+                            help="Comma-separated benchmarks to run (default: all; see the list command).")
+    run_parser.add_argument('--output', default='benchmark_results.json', help="Results file to write.")
+    run_parser.add_argument('--data-dir', help="Keep the synthetic pairs here and reuse them on later runs.")
+    run_parser.add_argument('--repeats', type=int, default=REPEATS, help="Timed runs per case; the best counts.")
+    run_parser.add_argument('--unet-max-size', type=int, default=UNET_MAX_SIZE,
+                            help=f"Largest size the U-Net benchmarks run at (default: {UNET_MAX_SIZE}).")
+
+    compare_parser = commands.add_parser('compare', help="Flag regressions between two results files.")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--throughput-tolerance', type=float, default=THROUGHPUT_TOLERANCE)
+    compare_parser.add_argument('--memory-tolerance', type=float, default=MEMORY_TOLERANCE)
+
+    commands.add_parser('list', help="List the benchmarks.")
+
+    startup_parser = commands.add_parser('startup', help="Check the startup time of the command-line entry points.")
+    startup_parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS,
+                                help=f"Seconds each case may take (default: {STARTUP_BUDGET_SECONDS}).")
+    startup_parser.add_argument('--repeats', type=int, default=STARTUP_REPEATS,
+                                help="Fresh interpreters per case; the fastest counts.")
+
+    # Internal: one benchmark in this process, run by spawn_case
+    case_parser = commands.add_parser('case')
+    case_parser.add_argument('name', choices=list(BENCHMARKS))
+    case_parser.add_argument('size', type=int)
+    case_parser.add_argument('data_dir')
+    case_parser.add_argument('repeats', type=int)
+
+    args = parser.parse_args(argv)
+    if args.command == 'list':
+        print(json.dumps({"status": "success", "benchmarks": list(BENCHMARKS)}))
+    elif args.command == 'startup':
+        results = check_startup(args.budget, args.repeats)
+        violations = [result for result in results if result['violation']]
+        print(json.dumps({"status": "regression" if violations else "success", "budget_s": args.budget,
+                          "cases": results, "violations": len(violations)}))
+        if violations:
+            sys.exit(1)
+    elif args.command == 'case':
+        print(json.dumps(run_case(args.name, args.size, args.data_dir, args.repeats)))
+    elif args.command == 'run':
+        names = [name for name in args.benchmarks.split(',') if name]
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise ValueError(f"Unknown benchmark(s) {unknown}. Choose from: {', '.join(BENCHMARKS)}.")
+        sizes = [int(size) for size in args.sizes.split(',') if size]
+        report = run_benchmarks(sizes, names, args.output, args.data_dir, args.repeats, args.unet_max_size)
+        print(json.dumps({"status": "success", "output": args.output, "results": len(report['results'])}))
+    else:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r') as f:
+            current = json.load(f)
+        comparisons = compare_results(baseline, current, args.throughput_tolerance, args.memory_tolerance)
+        regressions = [comparison for comparison in comparisons if comparison['regression']]
+        print(json.dumps({"status": "regression" if regressions else "success", "comparisons": comparisons,
+                          "regressions": len(regressions)}))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv[1:])
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": f"Benchmark error: {e}"}), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,76 @@
+# processing/change_map_cache.py
+#
+# LRU cache of the continuous per-pixel maps behind every change summary: the U-Net
+# change logits, the NDVI difference and the CVA magnitude. Maps are keyed by the
+# SHA-256 of both input rasters and by whatever else determines them (bands, model,
+# tiling), but never by the threshold. Re-submitting the same pair with another
+# threshold or method mix is answered from these maps without decoding the rasters
+# or running the network.
+#
+#   python change_map_cache.py stats
+#   python change_map_cache.py clear
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+from imagery_cache import ImageryCache, cache_cli, file_sha256
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MAP_CACHE_DIR = os.path.join(BASE_DIR, 'change_map_cache')
+# A 1024x1024 float32 map is 4 MB, so this holds the maps of a few hundred pairs.
+MAX_MAP_CACHE_BYTES = 1024 ** 3
+
+
+def checkpoint_fingerprint(model_path):
+    """Identifies a model file by name, size and modification time (None when it does not exist)."""
+    if not model_path or not os.path.exists(model_path):
+        return None
+    stat = os.stat(model_path)
+    return [os.path.basename(model_path), stat.st_size, int(stat.st_mtime)]
+
+
+def pair_hashes(t1_path, t2_path):
+    """SHA-256 of both input rasters."""
+    return file_sha256(t1_path), file_sha256(t2_path)
+
+
+def map_key(kind, hashes, **params):
+    """Key of one map ('ndvi_difference', 'cva_magnitude' or 'unet_logits') of the pair with `hashes`."""
+    description = {'kind': kind, 't1': hashes[0], 't2': hashes[1], 'params': params}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ChangeMapCache(ImageryCache):
+    """ImageryCache holding .npy maps, with array-level load/save on top of fetch/store."""
+    FILE_SUFFIX = '.npy'
+
+    def __init__(self, cache_dir=MAP_CACHE_DIR, max_bytes=MAX_MAP_CACHE_BYTES):
+        super(ChangeMapCache, self).__init__(cache_dir, max_bytes)
+
+    def load(self, key):
+        """The cached map for key, or None on a miss."""
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.npy.out')
+        os.close(fd)
+        try:
+            if not self.fetch(key, temp_path):
+                return None
+            return np.load(temp_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def save(self, key, array, metadata=None):
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.npy.in')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, array)
+            self.store(key, temp_path, metadata)
+        finally:
+            os.remove(temp_path)
+
+
+if __name__ == '__main__':
+    cache_cli(ChangeMapCache(), "Change map cache")
@@ -0,0 +1,195 @@
+# processing/change_visualization.py
+#
+# PNG visualizations of a change mask: the T2 image with a red overlay on changed
+# pixels and a changes-only image. The overlay is blended through 256-entry uint8
+# lookup tables into one preallocated buffer, so no float copy of the image is made
+# and the red blend is only evaluated on changed pixels. The changes-only image is a
+# 1-bit palette PNG.
+#
+# Rendering can also be taken off the inference path: 'background' renders on a
+# worker thread, 'deferred' only writes a <png>.pending.json next to each PNG name,
+# and the PNGs are rendered from the T2 raster and the mask COG on first request:
+#
+#   python change_visualization.py render <output.png.pending.json>
+#
+# numpy, Pillow and rasterio are imported by the functions that need them, so importing
+# this module for VISUALIZATION_MODES keeps command-line startup fast.
+
+import os
+import sys
+import json
+import tempfile
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+VISUALIZATION_MODES = ('sync', 'background', 'deferred')
+PENDING_SUFFIX = '.pending.json'
+
+OVERLAY_COLOR = (255, 0, 0)
+# Weights of the T2 pixel and the overlay color in the blended image
+IMAGE_WEIGHT = 0.7
+OVERLAY_WEIGHT = 0.3
+# zlib level of both PNGs; 6 is Pillow's default, lower trades size for speed
+PNG_COMPRESS_LEVEL = 6
+
+CHANGE_ONLY_PALETTE = [0, 0, 0] + list(OVERLAY_COLOR)
+
+# Single worker for 'background' mode; renders queue up rather than compete with inference
+render_pool = None
+render_pool_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def blend_luts():
+    """
+    (unchanged LUT, per-channel changed LUTs): the blended value of every uint8 input,
+    computed with the same float expression as before so the output is unchanged.
+    Unchanged pixels are only darkened, changed pixels get the overlay color mixed
+    into each channel.
+    """
+    import numpy as np
+    values = np.arange(256, dtype=np.float64)
+    unchanged = (values * IMAGE_WEIGHT + 0 * OVERLAY_WEIGHT).astype(np.uint8)
+    changed = [(values * IMAGE_WEIGHT + value * OVERLAY_WEIGHT).astype(np.uint8) for value in OVERLAY_COLOR]
+    return unchanged, changed
+
+
+def visualization_filenames(t2_filename):
+    """(overlay, changes-only) PNG names for a T2 file name."""
+    base_filename = os.path.splitext(t2_filename)[0]
+    return f"{base_filename}_change_overlay.png", f"{base_filename}_changes_only.png"
+
+
+def as_uint8_mask(change_mask):
+    """0/1 uint8 view of a boolean mask (no copy) or of a 0/1 uint8 mask."""
+    import numpy as np
+    if change_mask.dtype == np.bool_:
+        return change_mask.view(np.uint8)
+    return change_mask.astype(np.uint8, copy=False)
+
+
+def render_overlay(t2_rgb, change_mask, out=None):
+    """
+    Blends the red overlay into a (3, H, W) uint8 T2 array and returns an (H, W, 3)
+    uint8 image, written into `out` when given.
+    """
+    import numpy as np
+    unchanged_lut, changed_luts = blend_luts()
+    height, width = change_mask.shape
+    if out is None:
+        out = np.empty((height, width, 3), dtype=np.uint8)
+    t2_rgb = np.asarray(t2_rgb, dtype=np.uint8)
+    for channel in range(3):
+        np.take(unchanged_lut, t2_rgb[channel], out=out[..., channel])
+
+    changed = np.flatnonzero(change_mask)
+    if changed.size:
+        flat_out = out.reshape(-1, 3)
+        for channel, lut in enumerate(changed_luts):
+            if np.array_equal(lut, unchanged_lut):
+                continue
+            flat_out[changed, channel] = lut[t2_rgb[channel].reshape(-1)[changed]]
+    return out
+
+
+def render_change_only(change_mask):
+    """Palette image with black background and overlay-colored changes."""
+    from PIL import Image
+    image = Image.fromarray(as_uint8_mask(change_mask))
+    image.putpalette(CHANGE_ONLY_PALETTE)
+    return image
+
+
+def remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def save_png(image, path, **options):
+    """Saves a PNG atomically, so concurrent renders of a deferred request never serve a partial file."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.png.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, format='PNG', **options)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def save_visualizations(t2_rgb, change_mask, output_dir, t2_filename, compress_level=PNG_COMPRESS_LEVEL):
+    """
+    Renders and writes both PNGs for a (3, H, W) T2 array and an (H, W) mask, replacing
+    any pending render request for them. Returns (overlay filename, changes-only filename).
+    """
+    from PIL import Image
+    blended_filename, change_only_filename = visualization_filenames(t2_filename)
+    save_png(Image.fromarray(render_overlay(t2_rgb, change_mask)), os.path.join(output_dir, blended_filename),
+             compress_level=compress_level)
+    save_png(render_change_only(change_mask), os.path.join(output_dir, change_only_filename),
+             bits=1, compress_level=compress_level)
+    for filename in (blended_filename, change_only_filename):
+        remove_file(os.path.join(output_dir, filename + PENDING_SUFFIX))
+    return blended_filename, change_only_filename
+
+
+def submit_visualizations(t2_rgb, change_mask, output_dir, t2_filename, compress_level=PNG_COMPRESS_LEVEL):
+    """
+    save_visualizations() on the background worker. Returns the file names right away
+    together with the Future of the render; the arrays must not be modified until it is done.
+    """
+    global render_pool
+    with render_pool_lock:
+        if render_pool is None:
+            render_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='visualization')
+    future = render_pool.submit(save_visualizations, t2_rgb, change_mask, output_dir, t2_filename, compress_level)
+    return visualization_filenames(t2_filename), future
+
+
+def defer_visualizations(t2_path, change_mask_path, output_dir, t2_filename):
+    """
+    Writes a render request next to each PNG name instead of the PNGs, dropping PNGs of an
+    earlier run under the same names. The mask COG and the T2 raster must stay in place
+    until the PNGs are rendered. Returns (overlay filename, changes-only filename).
+    """
+    filenames = visualization_filenames(t2_filename)
+    request = {"t2_path": os.path.abspath(t2_path), "change_mask_path": os.path.abspath(change_mask_path),
+               "output_dir": os.path.abspath(output_dir), "t2_filename": t2_filename}
+    for filename in filenames:
+        remove_file(os.path.join(output_dir, filename))
+        with open(os.path.join(output_dir, filename + PENDING_SUFFIX), 'w') as f:
+            json.dump(request, f)
+    return filenames
+
+
+def render_pending(pending_path, compress_level=PNG_COMPRESS_LEVEL):
+    """
+    Renders the PNGs of a deferred request (either of its two pending files) and returns
+    their file names.
+    """
+    import rasterio
+
+    with open(pending_path, 'r') as f:
+        request = json.load(f)
+    with rasterio.open(request['t2_path']) as src_t2:
+        t2_rgb = src_t2.read([1, 2, 3])
+    with rasterio.open(request['change_mask_path']) as src_mask:
+        change_mask = src_mask.read(1)
+
+    return save_visualizations(t2_rgb, change_mask, request['output_dir'], request['t2_filename'], compress_level)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != 'render':
+        print(json.dumps({"status": "error", "message": "Usage: change_visualization.py render <pending.json>"}),
+              file=sys.stderr)
+        sys.exit(1)
+    try:
+        blended_filename, change_only_filename = render_pending(sys.argv[2])
+        print(json.dumps({"status": "success", "change_overlay_png": blended_filename,
+                          "change_only_png": change_only_filename}))
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": f"Visualization rendering failed: {e}"}), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,151 @@
+# processing/cog_writer.py
+#
+# Cloud-Optimized GeoTIFF output for every raster the pipeline writes. Data is written
+# window by window into an internally tiled working file, overviews are built from it,
+# and the result is copied into COG layout (overviews first, tiles in order), so a
+# client can range-read just the blocks and zoom level it shows.
+#
+#   python cog_writer.py <input.tif> [output.tif] [--kind imagery|mask|float]
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+
+COG_BLOCK_SIZE = 512
+# Overviews are added until the smallest one fits in this many pixels.
+MIN_OVERVIEW_SIZE = 256
+
+# Creation options and overview resampling per kind of raster. Masks are stored with
+# 1 bit per pixel; imagery and float maps are analysis inputs and stay lossless.
+KINDS = {
+    'mask': {'options': {'compress': 'DEFLATE', 'nbits': 1}, 'resampling': Resampling.nearest},
+    'imagery': {'options': {'compress': 'DEFLATE', 'predictor': 2}, 'resampling': Resampling.average},
+    'float': {'options': {'compress': 'DEFLATE', 'predictor': 3}, 'resampling': Resampling.average}
+}
+
+
+def overview_factors(height, width, min_size=MIN_OVERVIEW_SIZE):
+    """Power-of-two decimation factors down to the last level at least min_size across."""
+    factors = []
+    factor = 2
+    while max(height, width) // factor >= min_size:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+class CogWriter:
+    """
+    Writable COG. Use as a context manager, write windows with write(), and the COG
+    appears at `path` when the block closes without an error:
+
+        with CogWriter(path, height, width, 1, 'uint8', crs, transform, kind='mask') as dst:
+            for window in dst.block_windows():
+                dst.write(data_for(window), window)
+    """
+    def __init__(self, path, height, width, count, dtype, crs, transform, kind='imagery', nodata=None):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown COG kind '{kind}'. Choose one of: {', '.join(KINDS)}.")
+        self.path = path
+        self.kind = kind
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, self.work_path = tempfile.mkstemp(dir=directory, suffix='.work.tif')
+        os.close(fd)
+        # The working file only has to be tiled; cheap compression keeps it small
+        self.dataset = rasterio.open(self.work_path, 'w', driver='GTiff', height=height, width=width, count=count,
+                                     dtype=dtype, crs=crs, transform=transform, nodata=nodata, tiled=True,
+                                     blockxsize=COG_BLOCK_SIZE, blockysize=COG_BLOCK_SIZE,
+                                     compress='DEFLATE', zlevel=1)
+
+    def block_windows(self):
+        """Windows of the internal tiles, the cheapest unit to write."""
+        return [window for _, window in self.dataset.block_windows(1)]
+
+    def write(self, data, window):
+        """Writes a (count, h, w) or (h, w) array into window."""
+        if data.ndim == 2:
+            self.dataset.write(data, 1, window=window)
+        else:
+            self.dataset.write(data, window=window)
+
+    def close(self):
+        """Builds the overviews and copies the working file into COG layout at path."""
+        try:
+            factors = overview_factors(self.dataset.height, self.dataset.width)
+            if factors:
+                self.dataset.build_overviews(factors, KINDS[self.kind]['resampling'])
+            self.dataset.close()
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, final_path = tempfile.mkstemp(dir=directory, suffix='.cog.tif')
+            os.close(fd)
+            try:
+                # No .aux.xml sidecar for the temporary name
+                with rasterio.Env(GDAL_PAM_ENABLED='NO'):
+                    rasterio.shutil.copy(self.work_path, final_path, driver='GTiff', tiled=True,
+                                         blockxsize=COG_BLOCK_SIZE, blockysize=COG_BLOCK_SIZE,
+                                         copy_src_overviews=True, **KINDS[self.kind]['options'])
+                # Replaces rather than writes through path, which may be a hard link into a cache
+                os.replace(final_path, self.path)
+            except BaseException:
+                if os.path.exists(final_path):
+                    os.remove(final_path)
+                raise
+        finally:
+            self.abort()
+
+    def abort(self):
+        if not self.dataset.closed:
+            self.dataset.close()
+        if os.path.exists(self.work_path):
+            os.remove(self.work_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def convert_to_cog(src_path, dst_path=None, kind='imagery'):
+    """Rewrites a GeoTIFF as a COG block by block (in place when dst_path is omitted) and returns its path."""
+    dst_path = dst_path or src_path
+    with rasterio.open(src_path) as src:
+        with CogWriter(dst_path, src.height, src.width, src.count, src.dtypes[0], src.crs, src.transform,
+                       kind=kind, nodata=src.nodata) as dst:
+            for window in dst.block_windows():
+                dst.write(src.read(window=window), window)
+    return dst_path
+
+
+def is_cog(path):
+    """Whether a GeoTIFF is internally tiled and has overviews (or is too small to need them)."""
+    with rasterio.open(path) as src:
+        # Square multi-row blocks are tiles (rasterio reports a single-tile image as untiled)
+        block_height, block_width = src.block_shapes[0]
+        tiled = block_height == block_width and block_height > 1
+        needs_overviews = bool(overview_factors(src.height, src.width))
+        return tiled and (bool(src.overviews(1)) or not needs_overviews)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a GeoTIFF into a Cloud-Optimized GeoTIFF.")
+    parser.add_argument('input')
+    parser.add_argument('output', nargs='?')
+    parser.add_argument('--kind', choices=list(KINDS), default='imagery')
+    args = parser.parse_args()
+    try:
+        output = convert_to_cog(args.input, args.output, args.kind)
+        print(json.dumps({"status": "success", "path": output, "cog": is_cog(output)}))
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": f"COG conversion failed: {e}"}), file=sys.stderr)
+        sys.exit(1)
@@ -1,9 +1,16 @@
 import sys
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import stage_metrics
 import rasterio
 import numpy as np
 
+from raster_windows import strip_windows
+from gee_change_detection import CVA_BANDS
+
+
 def read_bands(image_path, bands):
     """
     Reads a specified list of bands from a local GeoTIFF file.
@@ -24,6 +31,33 @@ def read_bands(image_path, bands):
         raise ValueError(f"Could not open or read GeoTIFF file: {image_path}. Error: {e}")
 
 
+def cva_magnitude(t1_bands, t2_bands, out=None, scratch=None):
+    """
+    Computes the CVA magnitude of one window in float32, one band at a time.
+    Args:
+        t1_bands, t2_bands (sequence of np.array): Per-band 2D arrays of the same shape,
+            e.g. a (bands, h, w) array or a list of views.
+        out (np.array, optional): Preallocated float32 array for the result.
+        scratch (np.array, optional): Preallocated float32 array of the same shape.
+    
+    Returns:
+        np.array: `out`, holding the Euclidean norm of the per-pixel difference vector.
+    """
+    shape = t1_bands[0].shape
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    if scratch is None:
+        scratch = np.empty(shape, dtype=np.float32)
+
+    out.fill(0)
+    for band_t1, band_t2 in zip(t1_bands, t2_bands):
+        np.subtract(band_t2, band_t1, out=scratch, dtype=np.float32)
+        np.multiply(scratch, scratch, out=scratch)
+        np.add(out, scratch, out=out)
+    np.sqrt(out, out=out)
+    return out
+
+
 def calculate_cva(t1_bands, t2_bands):
     """
     Calculates the Change Vector Analysis (CVA) magnitude image.
@@ -32,71 +66,119 @@ def calculate_cva(t1_bands, t2_bands):
         t2_bands (np.array): Stacked numpy array of bands for the second image.
     
     Returns:
-        np.array: A 2D numpy array representing the CVA magnitude for each pixel.
+        np.array: A 2D float32 numpy array representing the CVA magnitude for each pixel.
     """
     # Ensure arrays have the same shape
     if t1_bands.shape != t2_bands.shape:
         raise ValueError("Input images for CVA must have the same dimensions.")
     
-    # Calculate the difference vector for each pixel
-    # np.seterr ignores potential warnings during calculation
-    np.seterr(divide='ignore', invalid='ignore')
-    difference_vector = t2_bands.astype(float) - t1_bands.astype(float)
+    # The magnitude of the change vector is the Euclidean distance in the
+    # multi-spectral space, accumulated band by band in float32.
+    band_count = t1_bands.shape[-1]
+    return cva_magnitude([t1_bands[..., b] for b in range(band_count)],
+                         [t2_bands[..., b] for b in range(band_count)])
 
-    # Calculate the magnitude of the change vector for each pixel
-    # This is the Euclidean distance in the multi-spectral space
-    cva_magnitude = np.sqrt(np.sum(difference_vector**2, axis=-1))
 
-    return cva_magnitude
+def count_cva_changes(t1_path, t2_path, bands, threshold, workers=None):
+    """
+    Streams both images window by window and counts pixels whose CVA magnitude
+    exceeds the threshold. Windows are spread over a thread pool (GDAL decoding and
+    the numpy kernels release the GIL); each thread keeps its own dataset handles
+    and float32 buffers, so memory stays constant in the scene size.
+    
+    Returns:
+        tuple: (change_pixel_count, transform, crs, width, height) of the second image.
+    """
+    try:
+        with rasterio.open(t1_path) as src_t1, rasterio.open(t2_path) as src_t2:
+            if (src_t1.height, src_t1.width) != (src_t2.height, src_t2.width):
+                raise ValueError("Input images for CVA must have the same dimensions.")
+            for src, path in ((src_t1, t1_path), (src_t2, t2_path)):
+                missing = [band for band in bands if not 1 <= band <= src.count]
+                if missing:
+                    raise ValueError(f"Band(s) {missing} not found in {path} ({src.count} bands).")
+            windows = strip_windows(src_t2)
+            transform, crs, width, height = src_t2.transform, src_t2.crs, src_t2.width, src_t2.height
+    except rasterio.errors.RasterioIOError as e:
+        raise ValueError(f"Could not open or read GeoTIFF file. Error: {e}")
 
+    local = threading.local()
+    opened = []
+    opened_lock = threading.Lock()
+
+    def count_window(window):
+        if not hasattr(local, 'sources'):
+            local.sources = (rasterio.open(t1_path), rasterio.open(t2_path))
+            with opened_lock:
+                opened.extend(local.sources)
+        shape = (window.height, window.width)
+        if getattr(local, 'shape', None) != shape:
+            local.shape = shape
+            local.magnitude = np.empty(shape, dtype=np.float32)
+            local.scratch = np.empty(shape, dtype=np.float32)
+
+        src_t1, src_t2 = local.sources
+        t1_window = src_t1.read(bands, window=window)
+        t2_window = src_t2.read(bands, window=window)
+        cva_magnitude(t1_window, t2_window, out=local.magnitude, scratch=local.scratch)
+        return int(np.count_nonzero(local.magnitude > threshold))
 
-def main(t1_path, t2_path, threshold):
-    """Performs CVA change detection on local GeoTIFF files."""
     try:
-        # Define the bands to use for CVA. Sentinel-2 bands are a good choice.
-        # B2=Blue, B3=Green, B4=Red, B8=NIR
-        # Using a fixed list here, but in a robust system this would be dynamic.
-        bands_to_use = [2, 3, 4, 8]
-        
-        # Read the specified bands from both images
-        t1_bands, _, _, _, _ = read_bands(t1_path, bands_to_use)
-        t2_bands, transform, crs, width, height = read_bands(t2_path, bands_to_use)
-        
-        # Calculate the CVA magnitude
-        cva_magnitude = calculate_cva(t1_bands, t2_bands)
-        
-        # Apply the threshold to find pixels with significant change
-        change_mask = np.where(cva_magnitude > threshold, 1, 0)
+        # Decoding and the CVA overlap across the threads, so they are timed as one stage
+        with stage_metrics.stage('cva'), ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            change_pixels = sum(pool.map(count_window, windows))
+    finally:
+        for src in opened:
+            src.close()
 
-        # Calculate areas (assuming a 10m scale from Sentinel-2)
-        pixel_area_sqm = 10 * 10
-        change_area_sqm = np.sum(change_mask) * pixel_area_sqm
-        change_area_ha = change_area_sqm / 10000
+    return change_pixels, transform, crs, width, height
+
+
+def summarize_cva_change(change_pixels, bands, width, height):
+    """Converts a changed pixel count into the CVA summary reported to the backend."""
+    # Calculate areas (assuming a 10m scale from Sentinel-2)
+    pixel_area_sqm = 10 * 10
+    change_area_sqm = change_pixels * pixel_area_sqm
+    change_area_ha = change_area_sqm / 10000
+
+    total_pixels = width * height
+    total_aoi_area_ha = (total_pixels * pixel_area_sqm) / 10000
+    
+    percentage_change = (change_area_ha / total_aoi_area_ha) * 100
+    
+    return {
+        "method": "Change Vector Analysis (CVA)",
+        "bands_used": list(bands),
+        "total_aoi_area_ha": total_aoi_area_ha,
+        "total_change_area_ha": change_area_ha,
+        "percentage_change": percentage_change
+    }
+
+
+def main(t1_path, t2_path, threshold, workers=None):
+    """Performs CVA change detection on local GeoTIFF files."""
+    metrics = stage_metrics.StageMetrics()
+    metrics.record_import()
+    try:
+        # Stream both images and count pixels with significant change
+        with stage_metrics.collect(metrics):
+            change_pixels, transform, crs, width, height = count_cva_changes(
+                t1_path, t2_path, CVA_BANDS, threshold, workers)
 
-        total_pixels = width * height
-        total_aoi_area_ha = (total_pixels * pixel_area_sqm) / 10000
-        
-        percentage_change = (change_area_ha / total_aoi_area_ha) * 100
-        
         response = {
             "status": "success",
-            "summary": {
-                "method": "Change Vector Analysis (CVA)",
-                "bands_used": bands_to_use,
-                "total_aoi_area_ha": total_aoi_area_ha,
-                "total_change_area_ha": change_area_ha,
-                "percentage_change": percentage_change
-            }
+            "summary": summarize_cva_change(change_pixels, CVA_BANDS, width, height),
+            "metrics": metrics.as_dict()
         }
         
         print(json.dumps(response, indent=4))
 
     except ValueError as ve:
-        response = {"status": "error", "message": f"CVA Processing Error: {ve}"}
+        response = {"status": "error", "message": f"CVA Processing Error: {ve}", "metrics": metrics.as_dict()}
         print(json.dumps(response, indent=4), file=sys.stderr)
         sys.exit(1)
     except Exception as e:
-        response = {"status": "error", "message": f"An unexpected error occurred: {e}"}
+        response = {"status": "error", "message": f"An unexpected error occurred: {e}", "metrics": metrics.as_dict()}
         print(json.dumps(response, indent=4), file=sys.stderr)
         sys.exit(1)
 
@@ -116,5 +198,15 @@ if __name__ == "__main__":
         response = {"status": "error", "message": "Threshold must be a valid number."}
         print(json.dumps(response, indent=4), file=sys.stderr)
         sys.exit(1)
+
+    # Optional 4th argument: number of worker threads (default: one per CPU)
+    try:
+        workers = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        if workers is not None and workers < 1:
+            raise ValueError
+    except ValueError:
+        response = {"status": "error", "message": "Worker count must be a positive integer."}
+        print(json.dumps(response, indent=4), file=sys.stderr)
+        sys.exit(1)
         
-    main(t1_path, t2_path, threshold)
\ No newline at end of file
+    main(t1_path, t2_path, threshold, workers)
@@ -0,0 +1,511 @@
+# processing/fake_earth_engine.py
+#
+# Local stand-ins for Earth Engine (the `ee` module) and the Google Drive client used by
+# gee_drive_download.py, for load tests of the monitoring scheduler without network
+# access or quota. Scenes are synthetic 4-band uint8 GeoTIFFs of the AOI; export
+# latency, failed exports and cloud-occluded scenes are drawn at configurable rates.
+#
+# Runs in place of gee_drive_download.py with the same arguments. The configuration is
+# a JSON object (see DEFAULT_CONFIG) in the FAKE_EE_CONFIG environment variable:
+#
+#   FAKE_EE_CONFIG='{"work_dir": "/tmp/load", "failure_rate": 0.05}' \
+#       python fake_earth_engine.py '<geojson>' 2024-01-01 2024-02-01 1024x1024 <aoi_id>
+#
+# Only the parts of the APIs that gee_drive_download.py calls are implemented. Every
+# server-side computation is evaluated locally when it is built, so getInfo() only
+# unwraps values. Scenes are deterministic per AOI and date (a cloudy scene stays
+# cloudy); export latency and failures are drawn anew for every request.
+
+import os
+import atexit
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import tempfile
+import threading
+import functools
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+from rasterio.windows import Window
+
+from synthetic_scenes import synthetic_block, CHANGED_PIXEL
+
+CONFIG_ENV = 'FAKE_EE_CONFIG'
+DEFAULT_CONFIG = {
+    # Scenes, the simulated Drive and the downloads live here
+    'work_dir': os.path.join(tempfile.gettempdir(), 'fake_earth_engine'),
+    # Seconds from start until a batch export completes, drawn uniformly from [min, max]
+    'export_latency_s': [30, 120],
+    # Seconds a direct download URL takes to compute
+    'direct_latency_s': [2, 10],
+    # Fraction of exports (or direct downloads) that fail
+    'failure_rate': 0.02,
+    # Fraction of direct downloads that fail, when it should differ from failure_rate
+    'direct_failure_rate': None,
+    # Fraction of scenes with no cloud-free pixel over the AOI
+    'occlusion_rate': 0.1,
+    # Days between two Sentinel-2 acquisitions of an AOI
+    'revisit_days': 5,
+    # Drive download speed in bytes per second; None downloads at disk speed
+    'drive_bytes_per_s': None,
+    # Multiplies every simulated latency and gee_drive_download's poll intervals, to
+    # compress time in load tests (0.05 turns a 60 s export into 3 s)
+    'time_scale': 1.0,
+    'seed': 0
+}
+
+# Metres per degree of latitude, for AOI sizes at native resolution
+METRES_PER_DEGREE = 111320
+# Side of the texture block that synthetic scenes repeat
+TEXTURE_TILE = 256
+
+# The FakeEarthEngine behind the installed modules; set by install()
+engine = None
+
+
+def load_config(environ=os.environ):
+    """DEFAULT_CONFIG updated with the FAKE_EE_CONFIG JSON object."""
+    config = dict(DEFAULT_CONFIG)
+    config.update(json.loads(environ.get(CONFIG_ENV) or '{}'))
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown {CONFIG_ENV} settings: {', '.join(sorted(unknown))}.")
+    return config
+
+
+def stable_fraction(*parts):
+    """Deterministic number in [0, 1) derived from parts."""
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return int(digest[:12], 16) / 16 ** 12
+
+
+def stable_seed(*parts):
+    return int(stable_fraction(*parts) * 2 ** 32)
+
+
+def evaluate(value):
+    """Unwraps Computed values, also inside lists and dicts."""
+    if isinstance(value, Computed):
+        return evaluate(value.value)
+    if isinstance(value, dict):
+        return {key: evaluate(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [evaluate(item) for item in value]
+    return value
+
+
+class EEException(Exception):
+    pass
+
+
+class Computed:
+    """A server-side value (ee.Number, ee.String, ee.Dictionary, ee.List)."""
+    def __init__(self, value):
+        self.value = value
+
+    def getInfo(self):
+        return evaluate(self.value)
+
+    def get(self, key):
+        return Computed(evaluate(self.value)[key])
+
+    def gt(self, other):
+        return Computed(evaluate(self.value) > evaluate(other))
+
+    def format(self, pattern):
+        """Joda-style date pattern; only the fields gee_drive_download.py uses."""
+        for joda, strftime in (('YYYY', '%Y'), ('MM', '%m'), ('dd', '%d')):
+            pattern = pattern.replace(joda, strftime)
+        date = evaluate(self.value)
+        return Computed(date and date.strftime(pattern))
+
+
+class Geometry:
+    def __init__(self, coordinates):
+        self.coordinates = coordinates
+
+    @staticmethod
+    def Polygon(coordinates):
+        return Geometry(coordinates)
+
+    @property
+    def bbox(self):
+        """(west, south, east, north) in degrees."""
+        points = [point for ring in self.coordinates for point in ring]
+        longitudes, latitudes = [point[0] for point in points], [point[1] for point in points]
+        return min(longitudes), min(latitudes), max(longitudes), max(latitudes)
+
+    def bounds(self):
+        west, south, east, north = self.bbox
+        return Geometry([[[west, south], [east, south], [east, north], [west, north], [west, south]]])
+
+    def toGeoJSONString(self):
+        return json.dumps({'type': 'Polygon', 'coordinates': self.coordinates})
+
+    def size_pixels(self, scale):
+        """(width, height) of the bounding box at `scale` metres per pixel."""
+        west, south, east, north = self.bbox
+        latitude = math.radians((south + north) / 2)
+        width = (east - west) * METRES_PER_DEGREE * math.cos(latitude) / scale
+        height = (north - south) * METRES_PER_DEGREE / scale
+        return max(1, math.ceil(width)), max(1, math.ceil(height))
+
+
+class FakeEarthEngine:
+    """State behind the fake `ee` module: the configuration, the scenes and the running exports."""
+    def __init__(self, config):
+        self.config = config
+        self.scene_dir = os.path.join(config['work_dir'], 'served')
+        self.drive_dir = os.path.join(config['work_dir'], 'drive')
+        self.tasks = {}
+        self.lock = threading.Lock()
+        self.rng = random.Random()
+        # Scenes written for direct downloads by this process
+        self.served = []
+        atexit.register(self.cleanup)
+        os.makedirs(self.scene_dir, exist_ok=True)
+        os.makedirs(self.drive_dir, exist_ok=True)
+
+    def latency(self, key):
+        low, high = self.config[key]
+        return self.rng.uniform(low, high) * self.config['time_scale']
+
+    def fails(self, key='failure_rate'):
+        rate = self.config[key]
+        if rate is None:
+            rate = self.config['failure_rate']
+        return self.rng.random() < rate
+
+    def scenes(self, aoi, start_date, end_date):
+        """Acquisitions over the AOI between the dates (end exclusive), one every revisit_days."""
+        aoi_key = aoi.toGeoJSONString()
+        revisit = self.config['revisit_days']
+        day = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        day += timedelta(days=-day.toordinal() % revisit)
+        scenes = []
+        while day < end:
+            seed = stable_seed(self.config['seed'], aoi_key, day.date())
+            scenes.append({
+                'id': f"{day:%Y%m%d}T000000_SIM_{seed:08x}",
+                'date': day,
+                'aoi_seed': stable_seed(self.config['seed'], aoi_key),
+                'seed': seed,
+                'cloud_percentage': round(100 * stable_fraction('cloud', seed), 2),
+                'occluded': stable_fraction('occluded', seed) < self.config['occlusion_rate']
+            })
+            day += timedelta(days=revisit)
+        return scenes
+
+    def write_scene(self, scene, aoi, path, dimensions=None, scale=None):
+        """
+        Writes the synthetic GeoTIFF of a scene to path (atomically). The AOI's texture is
+        one TEXTURE_TILE block repeated over the image, with a few changed patches per scene.
+        """
+        if dimensions:
+            sizes = [int(size) for size in str(dimensions).lower().split('x')]
+            width, height = (sizes[0], sizes[0]) if len(sizes) == 1 else sizes
+        else:
+            width, height = aoi.size_pixels(scale or 10)
+        rng = random.Random(scene['seed'])
+        patch = max(8, min(width, height) // 16)
+        changed = [(rng.randrange(max(1, height - patch)), rng.randrange(max(1, width - patch)), patch, patch)
+                   for _ in range(rng.randrange(4))]
+        tile, _ = synthetic_block(Window(0, 0, TEXTURE_TILE, TEXTURE_TILE), scene['aoi_seed'], [])
+        pixels = np.tile(tile, (1, -(-height // TEXTURE_TILE), -(-width // TEXTURE_TILE)))[:, :height, :width]
+        for y, x, patch_height, patch_width in changed:
+            pixels[:, y:y + patch_height, x:x + patch_width] = np.array(CHANGED_PIXEL, dtype=np.uint8)[:, None, None]
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tif.tmp')
+        os.close(fd)
+        try:
+            with rasterio.open(temp_path, 'w', driver='GTiff', height=height, width=width, count=len(pixels),
+                               dtype=rasterio.uint8, crs='EPSG:4326',
+                               transform=from_bounds(*aoi.bbox, width, height)) as dst:
+                dst.write(pixels)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return path
+
+    def serve_scene(self, scene, aoi, dimensions=None, scale=None):
+        """Writes a scene for a direct download; the file is removed when the process exits."""
+        fd, path = tempfile.mkstemp(dir=self.scene_dir, prefix=f"{scene['id']}_", suffix='.tif')
+        os.close(fd)
+        with self.lock:
+            self.served.append(path)
+        return self.write_scene(scene, aoi, path, dimensions, scale)
+
+    def cleanup(self):
+        with self.lock:
+            served, self.served = self.served, []
+        for path in served:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def start_task(self, task):
+        with self.lock:
+            self.tasks[task.id] = {'task': task, 'done_at': time.monotonic() + self.latency('export_latency_s'),
+                                   'failed': self.fails()}
+
+    def task_status(self, task_id):
+        """Status dict of one export; a completed export is written into the Drive folder first."""
+        with self.lock:
+            entry = self.tasks[task_id]
+        if time.monotonic() < entry['done_at']:
+            return {'id': task_id, 'state': 'RUNNING'}
+        if entry['failed']:
+            return {'id': task_id, 'state': 'FAILED', 'error_message': 'Simulated export failure.'}
+        task = entry['task']
+        if not task.delivered:
+            folder = os.path.join(self.drive_dir, task.folder)
+            os.makedirs(folder, exist_ok=True)
+            self.write_scene(task.image.scene, task.image.aoi, os.path.join(folder, f"{task.prefix}.tif"),
+                             task.dimensions, task.scale)
+            task.delivered = True
+        return {'id': task_id, 'state': 'COMPLETED'}
+
+
+class Image:
+    """
+    ee.Image of one scene (None for the first image of an empty collection). Band math
+    and masking do not change what is served.
+    """
+    def __init__(self, source=None, aoi=None):
+        if isinstance(source, Image):
+            source, aoi = source.scene, source.aoi
+        self.scene = source
+        self.aoi = aoi
+
+    def get(self, name):
+        if self.scene is None:
+            return Computed(None)
+        return Computed({'system:index': self.scene['id'],
+                         'CLOUDY_PIXEL_PERCENTAGE': self.scene['cloud_percentage']}[name])
+
+    def date(self):
+        return Computed(self.scene and self.scene['date'])
+
+    def identity(self, *args, **kwargs):
+        return self
+
+    select = eq = Or = Not = updateMask = resample = visualize = addBands = identity
+
+    def clip(self, aoi):
+        return Image(self.scene, aoi)
+
+    def reduceRegion(self, reducer, geometry, scale, maxPixels=None):
+        width, height = geometry.size_pixels(scale)
+        return Computed({'B4': 0 if self.scene is None or self.scene['occluded'] else width * height})
+
+    def getDownloadURL(self, params):
+        time.sleep(engine.latency('direct_latency_s'))
+        if engine.fails('direct_failure_rate'):
+            raise EEException("Simulated download failure.")
+        path = engine.serve_scene(self.scene, self.aoi, params.get('dimensions'), params.get('scale'))
+        return Path(path).as_uri()
+
+
+class ImageCollection:
+    def __init__(self, name, aoi=None, dates=None, sort_property=None):
+        self.name = name
+        self.aoi = aoi
+        self.dates = dates
+        self.sort_property = sort_property
+
+    def filterBounds(self, aoi):
+        return ImageCollection(self.name, aoi, self.dates, self.sort_property)
+
+    def filterDate(self, start, end):
+        return ImageCollection(self.name, self.aoi, (start, end), self.sort_property)
+
+    def sort(self, name):
+        return ImageCollection(self.name, self.aoi, self.dates, name)
+
+    def list_scenes(self):
+        scenes = engine.scenes(self.aoi, *self.dates)
+        if self.sort_property == 'CLOUDY_PIXEL_PERCENTAGE':
+            scenes.sort(key=lambda scene: scene['cloud_percentage'])
+        return scenes
+
+    def first(self):
+        scenes = self.list_scenes()
+        return Image(scenes[0] if scenes else None, self.aoi)
+
+    def size(self):
+        return Computed(len(self.list_scenes()))
+
+
+class Task:
+    """Batch export task."""
+    def __init__(self, image, folder, prefix, dimensions=None, scale=None):
+        self.id = uuid.uuid4().hex
+        self.image = image
+        self.folder = folder
+        self.prefix = prefix
+        self.dimensions = dimensions
+        self.scale = scale
+        self.delivered = False
+
+    def start(self):
+        engine.start_task(self)
+
+
+def export_image_to_drive(image, description=None, folder=None, fileNamePrefix=None, region=None,
+                          fileFormat=None, maxPixels=None, dimensions=None, scale=None):
+    """ee.batch.Export.image.toDrive"""
+    return Task(image, folder or '', fileNamePrefix or description, dimensions, scale)
+
+
+def make_ee_module():
+    """The fake `ee` module."""
+    ee = ModuleType('ee')
+    ee.EEException = EEException
+    ee.Initialize = lambda *args, **kwargs: None
+    ee.Geometry = Geometry
+    ee.Image = Image
+    ee.ImageCollection = ImageCollection
+    ee.Dictionary = Computed
+    ee.List = Computed
+    ee.Reducer = SimpleNamespace(count=lambda: 'count')
+    ee.Algorithms = SimpleNamespace(If=lambda condition, true_case, false_case:
+                                    true_case if evaluate(condition) else false_case)
+    ee.batch = SimpleNamespace(Export=SimpleNamespace(image=SimpleNamespace(toDrive=export_image_to_drive)))
+    ee.data = SimpleNamespace(getTaskStatus=lambda task_ids: [engine.task_status(task_id) for task_id in task_ids])
+    return ee
+
+
+# ==============================================================================
+# GOOGLE DRIVE
+# The Drive is a directory: folders are subdirectories, file ids are paths in it.
+# ==============================================================================
+
+class DriveRequest:
+    def __init__(self, result=None, path=None):
+        self.result = result
+        self.path = path
+
+    def execute(self):
+        return self.result
+
+
+class DriveFiles:
+    def list(self, q, spaces='drive', fields=None):
+        name = re.search(r"name='([^']*)'", q).group(1)
+        parent = re.search(r"'([^']*)' in parents", q)
+        if 'application/vnd.google-apps.folder' in q:
+            path = os.path.join(engine.drive_dir, name)
+            found = os.path.isdir(path)
+        else:
+            path = os.path.join(engine.drive_dir, parent.group(1) if parent else '', name)
+            found = os.path.isfile(path)
+        files = [{'id': os.path.relpath(path, engine.drive_dir)}] if found else []
+        return DriveRequest({'files': files})
+
+    def get_media(self, fileId):
+        return DriveRequest(path=os.path.join(engine.drive_dir, fileId))
+
+
+class DriveService:
+    def files(self):
+        return DriveFiles()
+
+
+def build(service_name, version, credentials=None, cache_discovery=True):
+    """googleapiclient.discovery.build for Drive v3."""
+    return DriveService()
+
+
+class MediaIoBaseDownload:
+    """googleapiclient.http.MediaIoBaseDownload, throttled to drive_bytes_per_s."""
+    def __init__(self, fd, request, chunksize=100 * 1024 * 1024):
+        self.fd = fd
+        self.source = open(request.path, 'rb')
+        self.chunksize = chunksize
+
+    def next_chunk(self, num_retries=0):
+        chunk = self.source.read(self.chunksize)
+        self.fd.write(chunk)
+        bytes_per_s = engine.config['drive_bytes_per_s']
+        if bytes_per_s:
+            time.sleep(len(chunk) / bytes_per_s * engine.config['time_scale'])
+        done = len(chunk) < self.chunksize
+        if done:
+            self.source.close()
+        return None, done
+
+
+class Unavailable:
+    """OAuth classes; gee_drive_download.get_gdrive_credentials is replaced, so they are never used."""
+    def __init__(self, *args, **kwargs):
+        raise RuntimeError("OAuth is not available with the fake Earth Engine.")
+
+
+def make_google_modules():
+    """The fake google-auth, google-auth-oauthlib and google-api-python-client modules."""
+    contents = {
+        'google': {}, 'google.auth': {}, 'google.auth.transport': {},
+        'google.auth.transport.requests': {'Request': Unavailable},
+        'google.oauth2': {}, 'google.oauth2.credentials': {'Credentials': Unavailable},
+        'google_auth_oauthlib': {}, 'google_auth_oauthlib.flow': {'InstalledAppFlow': Unavailable},
+        'googleapiclient': {}, 'googleapiclient.discovery': {'build': build},
+        'googleapiclient.http': {'MediaIoBaseDownload': MediaIoBaseDownload}
+    }
+    modules = {}
+    for name, attributes in contents.items():
+        module = modules[name] = ModuleType(name)
+        module.__path__ = []
+        module.__dict__.update(attributes)
+    for name, module in modules.items():
+        if '.' in name:
+            parent, child = name.rsplit('.', 1)
+            setattr(modules[parent], child, module)
+    return modules
+
+
+def install(config):
+    """
+    Puts the fakes into sys.modules in place of ee and the Google client libraries.
+    Must run before gee_drive_download is imported.
+    """
+    global engine
+    engine = FakeEarthEngine(config)
+    sys.modules['ee'] = make_ee_module()
+    sys.modules.update(make_google_modules())
+    return engine
+
+
+def configure_download(gee_drive_download, config):
+    """Points gee_drive_download at the work directory and scales its poll intervals with time_scale."""
+    from imagery_cache import ImageryCache
+
+    gee_drive_download.get_gdrive_credentials = lambda: None
+    gee_drive_download.DOWNLOAD_DIR = os.path.join(config['work_dir'], 'downloads')
+    gee_drive_download.ImageryCache = functools.partial(ImageryCache, os.path.join(config['work_dir'],
+                                                                                   'imagery_cache'))
+    for name in ('POLL_INITIAL_SECONDS', 'POLL_MAX_SECONDS'):
+        setattr(gee_drive_download, name, getattr(gee_drive_download, name) * config['time_scale'])
+
+
+if __name__ == '__main__':
+    try:
+        config = load_config()
+        install(config)
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": f"Fake Earth Engine setup failed: {e}"}), file=sys.stderr)
+        sys.exit(1)
+
+    import gee_drive_download
+    configure_download(gee_drive_download, config)
+    gee_drive_download.cli(sys.argv[1:])
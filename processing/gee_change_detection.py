@@ -1,9 +1,49 @@
 import sys
 import json
 import os
+import stage_metrics
 import rasterio
 import numpy as np
 
+from cog_writer import CogWriter
+from raster_windows import strip_windows
+
+# Band indexes of B4 (Red) and B8 (NIR) in the exported B4, B3, B2, B8 stack.
+RED_BAND = 1
+NIR_BAND = 4
+# CVA runs over the whole stack (Red, Green, Blue, NIR)
+CVA_BANDS = [1, 2, 3, 4]
+
+
+class NdviCancelled(Exception):
+    """Raised between windows once the caller's `cancelled` event is set."""
+
+
+def ndvi_window(red, nir, out=None, scratch=None):
+    """
+    Computes NDVI for one window in float32 without temporary full-size copies.
+    Args:
+        red, nir (np.array): 2D arrays of the B4 and B8 reflectances.
+        out (np.array, optional): Preallocated float32 array for the result.
+        scratch (np.array, optional): Preallocated float32 array of the same shape.
+    
+    Returns:
+        np.array: `out`, holding (nir - red) / (nir + red). Pixels where both bands
+                  are zero are NaN and never count as change.
+    """
+    if out is None:
+        out = np.empty(red.shape, dtype=np.float32)
+    if scratch is None:
+        scratch = np.empty(red.shape, dtype=np.float32)
+
+    np.subtract(nir, red, out=out, dtype=np.float32)
+    np.add(nir, red, out=scratch, dtype=np.float32)
+    # Avoid division by zero warnings; 0/0 yields NaN as before
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(out, scratch, out=out)
+    return out
+
+
 def calculate_ndvi(image_path):
     """
     Calculates NDVI from a local GeoTIFF file.
@@ -15,61 +55,168 @@ def calculate_ndvi(image_path):
         # Let's assume rasterio reads them in the order they were exported.
         # Check the metadata or assume B4 is band 1, B8 is band 4
         # (This may vary, so a more robust check is needed, but this is a good start)
-        red = src.read(1)  # B4 (Red)
-        nir = src.read(4)  # B8 (NIR)
+        red = src.read(RED_BAND)  # B4 (Red)
+        nir = src.read(NIR_BAND)  # B8 (NIR)
         
-        # Avoid division by zero
-        np.seterr(divide='ignore', invalid='ignore')
-        ndvi = (nir.astype(float) - red.astype(float)) / (nir.astype(float) + red.astype(float))
+        ndvi = ndvi_window(red, nir)
         
         return ndvi, src.transform, src.crs, src.width, src.height
 
-def main(t1_path, t2_path, threshold):
+
+def ndvi_difference(red_t1, nir_t1, red_t2, nir_t2, difference=None, ndvi_t1=None, scratch=None):
+    """
+    Computes NDVI(t2) - NDVI(t1) of one window in place.
+    Args:
+        red_t1, nir_t1, red_t2, nir_t2 (np.array): 2D B4/B8 arrays (or views) of both dates.
+        difference, ndvi_t1, scratch (np.array, optional): Preallocated float32 buffers.
+    
+    Returns:
+        np.array: `difference`.
+    """
+    shape = red_t1.shape
+    if difference is None:
+        difference = np.empty(shape, dtype=np.float32)
+    if ndvi_t1 is None:
+        ndvi_t1 = np.empty(shape, dtype=np.float32)
+    if scratch is None:
+        scratch = np.empty(shape, dtype=np.float32)
+
+    ndvi_window(red_t1, nir_t1, out=ndvi_t1, scratch=scratch)
+    ndvi_window(red_t2, nir_t2, out=difference, scratch=scratch)
+    np.subtract(difference, ndvi_t1, out=difference)
+    return difference
+
+
+def count_ndvi_difference(difference, threshold):
+    """Returns (gain_pixels, loss_pixels) of an NDVI difference map; NaN pixels count as neither."""
+    gain_pixels = int(np.count_nonzero(difference > threshold))
+    loss_pixels = int(np.count_nonzero(difference < -threshold))
+    return gain_pixels, loss_pixels
+
+
+def count_ndvi_change(red_t1, nir_t1, red_t2, nir_t2, threshold, difference=None, ndvi_t1=None, scratch=None):
+    """
+    Computes the NDVI difference of one window in place and counts gain and loss pixels.
+    Args:
+        red_t1, nir_t1, red_t2, nir_t2 (np.array): 2D B4/B8 arrays (or views) of both dates.
+        difference, ndvi_t1, scratch (np.array, optional): Preallocated float32 buffers.
+    
+    Returns:
+        tuple: (gain_pixels, loss_pixels, difference) where difference is NDVI(t2) - NDVI(t1).
+    """
+    difference = ndvi_difference(red_t1, nir_t1, red_t2, nir_t2, difference, ndvi_t1, scratch)
+    gain_pixels, loss_pixels = count_ndvi_difference(difference, threshold)
+    return gain_pixels, loss_pixels, difference
+
+
+def stream_ndvi_change(t1_path, t2_path, threshold, difference_path=None, cancelled=None):
+    """
+    Streams B4/B8 of both dates window by window and counts NDVI gain and loss
+    pixels. The difference is computed in place in reused float32 buffers and no
+    full-scene array or mask is ever kept, so memory stays constant in the scene size.
+    Args:
+        difference_path (str, optional): If given, the NDVI difference is written to
+            this Cloud-Optimized GeoTIFF window by window.
+        cancelled (threading.Event, optional): Once set, NdviCancelled is raised before
+            the next window, so a timed-out run frees its worker.
+    
+    Returns:
+        tuple: (gain_pixels, loss_pixels, width, height) of the second image.
+    """
+    with rasterio.open(t1_path) as src_t1, rasterio.open(t2_path) as src_t2:
+        if (src_t1.height, src_t1.width) != (src_t2.height, src_t2.width):
+            raise ValueError("Input images for NDVI must have the same dimensions.")
+        for src, path in ((src_t1, t1_path), (src_t2, t2_path)):
+            if src.count < max(RED_BAND, NIR_BAND):
+                raise ValueError(f"Expected B4 and B8 at bands {RED_BAND} and {NIR_BAND} in {path} ({src.count} bands).")
+
+        dst = None
+        if difference_path:
+            dst = CogWriter(difference_path, src_t2.height, src_t2.width, 1, rasterio.float32,
+                            src_t2.crs, src_t2.transform, kind='float')
+
+        gain_pixels = 0
+        loss_pixels = 0
+        shape = None
+        try:
+            for window in strip_windows(src_t2):
+                if cancelled is not None and cancelled.is_set():
+                    raise NdviCancelled("NDVI change detection was cancelled.")
+                if (window.height, window.width) != shape:
+                    shape = (window.height, window.width)
+                    ndvi_t1 = np.empty(shape, dtype=np.float32)
+                    difference = np.empty(shape, dtype=np.float32)
+                    scratch = np.empty(shape, dtype=np.float32)
+
+                with stage_metrics.stage('decode'):
+                    red_t1, nir_t1 = src_t1.read([RED_BAND, NIR_BAND], window=window)
+                    red_t2, nir_t2 = src_t2.read([RED_BAND, NIR_BAND], window=window)
+                with stage_metrics.stage('ndvi'):
+                    gain, loss, _ = count_ndvi_change(red_t1, nir_t1, red_t2, nir_t2, threshold,
+                                                      difference=difference, ndvi_t1=ndvi_t1, scratch=scratch)
+                gain_pixels += gain
+                loss_pixels += loss
+
+                if dst is not None:
+                    with stage_metrics.stage('difference_write'):
+                        dst.write(difference, window)
+        except BaseException:
+            if dst is not None:
+                dst.abort()
+            raise
+        else:
+            if dst is not None:
+                with stage_metrics.stage('difference_write'):
+                    dst.close()
+
+        return gain_pixels, loss_pixels, src_t2.width, src_t2.height
+
+
+def summarize_ndvi_change(gain_pixels, loss_pixels, width, height):
+    """Converts gain/loss pixel counts into the NDVI summary reported to the backend."""
+    # Calculate areas (assuming a 10m scale from Sentinel-2)
+    pixel_area_sqm = 10 * 10
+    gain_area_sqm = gain_pixels * pixel_area_sqm
+    loss_area_sqm = loss_pixels * pixel_area_sqm
+
+    gain_area_ha = gain_area_sqm / 10000
+    loss_area_ha = loss_area_sqm / 10000
+    total_change_area_ha = gain_area_ha + loss_area_ha
+    total_pixels = width * height
+    
+    percentage_change = (total_change_area_ha / (total_pixels * pixel_area_sqm / 10000)) * 100
+
+    return {
+        "total_aoi_area_ha": (width * height * pixel_area_sqm) / 10000,
+        "gain_area_ha": gain_area_ha,
+        "loss_area_ha": loss_area_ha,
+        "total_change_area_ha": total_change_area_ha,
+        "percentage_change": percentage_change
+    }
+
+
+def main(t1_path, t2_path, threshold, difference_path=None):
     """Performs NDVI change detection on local GeoTIFF files."""
+    metrics = stage_metrics.StageMetrics()
+    metrics.record_import()
     try:
-        ndvi_t1, _, _, _, _ = calculate_ndvi(t1_path)
-        ndvi_t2, transform, crs, width, height = calculate_ndvi(t2_path)
-        
-        # Calculate the NDVI difference
-        ndvi_difference = ndvi_t2 - ndvi_t1
-        
-        # Apply the threshold
-        gain_mask = np.where(ndvi_difference > threshold, 1, 0)
-        loss_mask = np.where(ndvi_difference < -threshold, 1, 0)
-
-        # Calculate areas (assuming a 10m scale from Sentinel-2)
-        pixel_area_sqm = 10 * 10
-        gain_area_sqm = np.sum(gain_mask) * pixel_area_sqm
-        loss_area_sqm = np.sum(loss_mask) * pixel_area_sqm
-
-        gain_area_ha = gain_area_sqm / 10000
-        loss_area_ha = loss_area_sqm / 10000
-        total_change_area_ha = gain_area_ha + loss_area_ha
-        total_pixels = width * height
-        
-        percentage_change = (total_change_area_ha / (total_pixels * pixel_area_sqm / 10000)) * 100
-        
-        # Save the difference map (optional, for visualization later)
-        # with rasterio.open(os.path.join(os.path.dirname(t1_path), 'ndvi_difference.tif'), 'w', driver='GTiff',
-        #                     height=height, width=width, count=1, dtype=ndvi_difference.dtype,
-        #                     crs=crs, transform=transform) as dst:
-        #     dst.write(ndvi_difference.astype(rasterio.float32), 1)
+        # Stream both dates and count gain/loss pixels without full-scene masks
+        with stage_metrics.collect(metrics):
+            gain_pixels, loss_pixels, width, height = stream_ndvi_change(
+                t1_path, t2_path, threshold, difference_path)
 
         response = {
             "status": "success",
-            "summary": {
-                "total_aoi_area_ha": (width * height * pixel_area_sqm) / 10000,
-                "gain_area_ha": gain_area_ha,
-                "loss_area_ha": loss_area_ha,
-                "total_change_area_ha": total_change_area_ha,
-                "percentage_change": percentage_change
-            }
+            "summary": summarize_ndvi_change(gain_pixels, loss_pixels, width, height),
+            "metrics": metrics.as_dict()
         }
+        if difference_path:
+            response["difference_path"] = difference_path
         
         print(json.dumps(response))
 
     except Exception as e:
-        response = {"status": "error", "message": f"NDVI Processing Error: {e}"}
+        response = {"status": "error", "message": f"NDVI Processing Error: {e}", "metrics": metrics.as_dict()}
         print(json.dumps(response), file=sys.stderr)
         sys.exit(1)
 
@@ -83,5 +230,7 @@ if __name__ == "__main__":
     t1_path = sys.argv[1]
     t2_path = sys.argv[2]
     threshold = float(sys.argv[3])
+    # Optional 4th argument: path of a float32 GeoTIFF to save the NDVI difference to
+    difference_path = sys.argv[4] if len(sys.argv) > 4 else None
     
-    main(t1_path, t2_path, threshold)
\ No newline at end of file
+    main(t1_path, t2_path, threshold, difference_path)
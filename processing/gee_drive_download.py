@@ -1,26 +1,75 @@
-import ee
+import stage_metrics
 import json
 import os
 import sys
 from datetime import datetime, timedelta
 import time
 import io
-import tempfile
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 import zipfile
+import shutil
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from imagery_cache import ImageryCache, cache_key
+
+# Earth Engine (ee), the Google API client and OAuth libraries, and rasterio (through
+# cog_writer) are imported inside the functions that need them. The command line checks
+# its arguments before any of them is loaded, direct downloads never load the Drive
+# stack, and their import time counts towards the stage that first uses them.
 
 # Define paths to credentials and token files
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CREDENTIALS_FILE = os.path.join(BASE_DIR, 'credentials.json')
 TOKEN_FILE = os.path.join(BASE_DIR, 'token.json')
 SCOPES = ['https://www.googleapis.com/auth/drive']
+# Downloads land here, in a subfolder per job id
+DOWNLOAD_DIR = os.path.join(BASE_DIR, 'temp_downloads')
+
+# Default export size. Pass dimensions=None (or 'native' on the command line) to
+# export at the native 10 m resolution instead; unet_inference.py tiles large scenes.
+EXPORT_DIMENSIONS = '1024x1024'
+NATIVE_SCALE_M = 10
+
+# Define all bands for export: B4, B3, B2 for U-Net, and B8 for NDVI.
+# B4 is included in both, so we export it once.
+EXPORT_BANDS = ['B4', 'B3', 'B2', 'B8']
+# Visualization stretch of the RGB bands (B4, B3, B2)
+# The min/max values are based on typical Sentinel-2 reflectances
+RGB_VIS_PARAMS = {
+    'bands': ['B4', 'B3', 'B2'],
+    'min': 0,
+    'max': 3000,  # A typical max value to stretch the contrast
+    'gamma': 1.4  # A slight gamma adjustment for better visual appearance
+}
+NIR_VIS_PARAMS = {'min': 0, 'max': 5000, 'palette': ['black', 'white']}
+
+DRIVE_FOLDER = 'GEE_Image_Exports'
+# Export status polling starts fast and backs off while tasks are still running.
+POLL_INITIAL_SECONDS = 2
+POLL_MAX_SECONDS = 30
+POLL_BACKOFF = 1.5
+# Drive downloads: a typical export fits in one chunk, and a failed chunk is retried
+# from the last received offset instead of restarting the file.
+DOWNLOAD_CHUNK_BYTES = 64 * 1024 * 1024
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_WORKERS = 4
+
+# Transports: 'drive' exports through the batch queue and Google Drive, 'direct' fetches
+# the pixels straight from Earth Engine with a download URL, and 'auto' uses direct
+# whenever the request fits in DIRECT_MAX_BYTES and Drive otherwise. A direct download
+# that fails is retried as a Drive export.
+TRANSPORTS = ('auto', 'direct', 'drive')
+# Earth Engine rejects synchronous downloads above 32 MB.
+DIRECT_MAX_BYTES = 32 * 1024 * 1024
+DIRECT_TIMEOUT_SECONDS = 300
+
+def get_gdrive_credentials():
+    """Loads (and refreshes or creates) the Google Drive OAuth credentials."""
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
 
-def authenticate_gdrive():
-    """Handles GDrive authentication for the backend."""
     creds = None
     if os.path.exists(TOKEN_FILE):
         creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
@@ -33,22 +82,32 @@ def authenticate_gdrive():
             creds = flow.run_local_server(port=8080)
         with open(TOKEN_FILE, 'w') as token:
             token.write(creds.to_json())
-            
+    return creds
+
+def authenticate_gdrive(creds=None):
+    """Handles GDrive authentication for the backend."""
+    from googleapiclient.discovery import build
+
+    creds = creds or get_gdrive_credentials()
     try:
         service = build('drive', 'v3', credentials=creds)
         return service
     except Exception as e:
         raise Exception(f"Could not create Google Drive service: {e}")
 
-def get_image_collection(target_date, aoi):
-    """Finds the best Sentinel-2 images in a date range for a given AOI."""
+def find_scenes(target_date, aoi):
+    """Sentinel-2 scenes within 15 days of target_date over the AOI, least cloudy first."""
+    import ee
     start_date = (target_date - timedelta(days=15)).strftime('%Y-%m-%d')
     end_date = (target_date + timedelta(days=15)).strftime('%Y-%m-%d')
-    collection = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
-                  .filterBounds(aoi)
-                  .filterDate(start_date, end_date)
-                  .sort('CLOUDY_PIXEL_PERCENTAGE'))
-    return collection.first()
+    return (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
+            .filterBounds(aoi)
+            .filterDate(start_date, end_date)
+            .sort('CLOUDY_PIXEL_PERCENTAGE'))
+
+def get_image_collection(target_date, aoi):
+    """Finds the best Sentinel-2 images in a date range for a given AOI."""
+    return find_scenes(target_date, aoi).first()
 
 def mask_s2_clouds(image):
     """Masks clouds and shadows from a Sentinel-2 image."""
@@ -57,11 +116,62 @@ def mask_s2_clouds(image):
     mask = (scl.eq(1).Or(scl.eq(3)).Or(scl.eq(8)).Or(scl.eq(9)).Or(scl.eq(10))).Not()
     return image.updateMask(mask)
 
-def export_and_download(image, aoi, drive_service, filename_prefix, temp_dir):
+def count_valid_pixels(masked_image, aoi):
+    """Server-side count of cloud-free B4 pixels in the AOI."""
+    import ee
+    return masked_image.select('B4').reduceRegion(
+        reducer=ee.Reducer.count(),
+        geometry=aoi,
+        scale=10,
+        maxPixels=1e9
+    ).get('B4')
+
+def plan_scenes(requests):
     """
-    Exports a multi-band GeoTIFF from GEE to Google Drive, waits for completion, and downloads it.
-    The exported image has a fixed dimension of 1024x1024 pixels and contains all bands needed for
-    both U-Net (B4, B3, B2) and NDVI (B8, B4) processing.
+    Selects the scene for every (target_date, aoi, filename_prefix) request, for any number
+    of dates and AOIs, and evaluates the scene metadata and cloud-masked valid-pixel counts of
+    all of them in a single Earth Engine round trip.
+    
+    Returns:
+        list: One plan dict per request with the ee.Image to export and its 'scene_id',
+              'date', 'cloud_percentage' and 'valid_pixels' (all None when no scene was found).
+              The export stage consumes these plans without further metadata requests.
+    """
+    import ee
+
+    images, summaries = [], []
+    for target_date, aoi, _ in requests:
+        scenes = find_scenes(target_date, aoi)
+        image = ee.Image(scenes.first())
+        images.append(image)
+        summaries.append(ee.Algorithms.If(scenes.size().gt(0), ee.Dictionary({
+            'scene_id': image.get('system:index'),
+            'date': image.date().format('YYYY-MM-dd'),
+            'cloud_percentage': image.get('CLOUDY_PIXEL_PERCENTAGE'),
+            'valid_pixels': count_valid_pixels(mask_s2_clouds(image), aoi)
+        }), None))
+
+    infos = ee.List(summaries).getInfo()
+    plans = []
+    for (_, aoi, filename_prefix), image, info in zip(requests, images, infos):
+        info = info or {}
+        plans.append({
+            'image': image if info else None,
+            'aoi': aoi,
+            'filename_prefix': filename_prefix,
+            'scene_id': info.get('scene_id'),
+            'date': info.get('date'),
+            'cloud_percentage': info.get('cloud_percentage'),
+            'valid_pixels': info.get('valid_pixels')
+        })
+    return plans
+
+def prepare_export_image(image, aoi, valid_pixels=None):
+    """
+    Builds the 4-band 8-bit image that is exported for an AOI, or returns None when the AOI
+    has no valid pixels after cloud masking. It contains all bands needed for
+    both U-Net (B4, B3, B2) and NDVI (B8, B4) processing. `valid_pixels` comes from
+    plan_scenes; it is requested from Earth Engine here only when not given.
     """
     if image is None:
         return None
@@ -69,149 +179,434 @@ def export_and_download(image, aoi, drive_service, filename_prefix, temp_dir):
     masked_image = mask_s2_clouds(image)
 
     # Check for valid pixels to prevent errors with fully occluded AOIs
-    valid_pixels = masked_image.select('B4').reduceRegion(
-        reducer=ee.Reducer.count(),
-        geometry=aoi,
-        scale=10,
-        maxPixels=1e9
-    ).get('B4').getInfo()
+    if valid_pixels is None:
+        valid_pixels = count_valid_pixels(masked_image, aoi).getInfo()
     
     if valid_pixels is None or valid_pixels == 0:
         return None # No valid pixels, so we cannot proceed
 
-    # Define all bands for export: B4, B3, B2 for U-Net, and B8 for NDVI.
-    # B4 is included in both, so we export it once.
-    bands_to_export = ['B4', 'B3', 'B2', 'B8']
-    
     # Resample all bands to a consistent 10m resolution before export for consistency.
-    export_image = masked_image.select(bands_to_export).resample('bicubic').clip(aoi)
+    export_image = masked_image.select(EXPORT_BANDS).resample('bicubic').clip(aoi)
     
     # --- IMPORTANT CHANGE FOR UNET INFERENCE ---
     # Convert the 16-bit satellite imagery to a more standard 8-bit RGB image.
     # This also applies a simple visualization stretch, which helps with the "low light" issue.
     # We will export the full 4 bands, but with the first 3 (B4, B3, B2) scaled to 0-255.
     
-    # Define a visualization function for the RGB bands (B4, B3, B2)
-    # The min/max values are based on typical Sentinel-2 reflectances
-    vis_params = {
-        'bands': ['B4', 'B3', 'B2'],
-        'min': 0,
-        'max': 3000,  # A typical max value to stretch the contrast
-        'gamma': 1.4  # A slight gamma adjustment for better visual appearance
-    }
-    
     # Create the RGB visualization image (3 bands)
-    rgb_image = export_image.visualize(**vis_params)
+    rgb_image = export_image.visualize(**RGB_VIS_PARAMS)
     
     # Add the NIR band (B8) as a fourth band, scaled to 0-255 as well.
     # This keeps the original band data for the NDVI calculation.
-    b8_image = export_image.select('B8').visualize(min=0, max=5000, palette=['black', 'white'])
+    b8_image = export_image.select('B8').visualize(**NIR_VIS_PARAMS)
     
     # Combine the RGB and NIR bands back into a single image for export.
     # The order will be B4, B3, B2 (as a visual RGB), and then B8.
-    final_export_image = rgb_image.addBands(b8_image)
+    return rgb_image.addBands(b8_image)
+
+def size_params_for(dimensions):
+    """Either enforce a fixed pixel size (e.g. 1024x1024) or keep the native 10m grid."""
+    if dimensions:
+        return {'dimensions': dimensions}
+    return {'scale': NATIVE_SCALE_M}
+
+def start_export(image, aoi, filename_prefix, dimensions=EXPORT_DIMENSIONS, valid_pixels=None):
+    """
+    Starts a GEE export of a multi-band GeoTIFF to Google Drive and returns the running task,
+    or None when the AOI has no valid pixels after cloud masking.
+    The exported image is resampled to `dimensions` (1024x1024 pixels by default), or kept at the
+    native 10m resolution when dimensions is None.
+    """
+    import ee
 
-    # The 'dimensions' parameter is critical to enforce the 1024x1024 pixel size
-    image_dimensions = '1024x1024'
+    final_export_image = prepare_export_image(image, aoi, valid_pixels)
+    if final_export_image is None:
+        return None
     
-    drive_folder = 'GEE_Image_Exports'
     export_task = ee.batch.Export.image.toDrive(
         image=final_export_image,
         description=f"Export_{filename_prefix}",
-        folder=drive_folder,
+        folder=DRIVE_FOLDER,
         fileNamePrefix=filename_prefix,
-        dimensions=image_dimensions,
         region=aoi.bounds(), 
         fileFormat='GeoTIFF', 
-        maxPixels=1e13
+        maxPixels=1e13,
+        **size_params_for(dimensions)
     )
     export_task.start()
+    return export_task
 
-    # Wait for the task to complete
-    while export_task.active():
-        time.sleep(10)
+def wait_for_exports(export_tasks, on_complete):
+    """
+    Polls several running export tasks together, with one status request per round, and
+    calls on_complete(index) as soon as each task completes. The poll interval starts at
+    POLL_INITIAL_SECONDS and backs off to POLL_MAX_SECONDS while tasks are still running.
+    """
+    import ee
 
-    task_status = export_task.status()
-    if task_status['state'] != 'COMPLETED':
-        raise Exception(f"GEE export task failed: {task_status.get('error_message', 'No error message.')}")
+    pending = {task.id: index for index, task in enumerate(export_tasks)}
+    interval = POLL_INITIAL_SECONDS
+    while pending:
+        for status in ee.data.getTaskStatus(list(pending)):
+            state = status.get('state')
+            if state in ('READY', 'RUNNING', 'UNSUBMITTED'):
+                continue
+            index = pending.pop(status['id'])
+            if state != 'COMPLETED':
+                raise Exception(f"GEE export task failed: {status.get('error_message', 'No error message.')}")
+            on_complete(index)
+        if pending:
+            time.sleep(interval)
+            interval = min(interval * POLL_BACKOFF, POLL_MAX_SECONDS)
 
-    # Find the file in Google Drive and download it
+def find_drive_folder(drive_service, drive_folder=DRIVE_FOLDER):
+    """Returns the id of the Drive folder that exports are written to."""
     folder_query = f"mimeType='application/vnd.google-apps.folder' and name='{drive_folder}' and trashed=false"
     folder_response = drive_service.files().list(q=folder_query, spaces='drive', fields='files(id)').execute()
     
     if not folder_response.get('files'):
         raise Exception(f"Could not find Google Drive folder: '{drive_folder}'.")
-    folder_id = folder_response.get('files')[0].get('id')
+    return folder_response.get('files')[0].get('id')
+
+def download_export(drive_service, folder_id, filename_prefix, temp_dir):
+    """Downloads one finished export from the Drive folder in large, resumable chunks."""
+    from googleapiclient.http import MediaIoBaseDownload
 
     filename = f"{filename_prefix}.tif"
     file_query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
     file_response = drive_service.files().list(q=file_query, spaces='drive', fields='files(id)').execute()
     
     if not file_response.get('files'):
-        raise Exception(f"Could not find file '{filename}' in Drive folder '{drive_folder}'.")
+        raise Exception(f"Could not find file '{filename}' in Drive folder '{DRIVE_FOLDER}'.")
     file_id = file_response.get('files')[0].get('id')
     
     request = drive_service.files().get_media(fileId=file_id)
 
     filepath = os.path.join(temp_dir, filename)
+    if os.path.exists(filepath):
+        os.remove(filepath)  # May be a hard link into the imagery cache; never write through it
     with io.FileIO(filepath, 'wb') as fh:
-        downloader = MediaIoBaseDownload(fh, request)
+        downloader = MediaIoBaseDownload(fh, request, chunksize=DOWNLOAD_CHUNK_BYTES)
         done = False
         while not done:
-            status, done = downloader.next_chunk()
+            status, done = downloader.next_chunk(num_retries=DOWNLOAD_RETRIES)
 
     return filepath
 
-def main(geojson_str, start_date_str, end_date_str):
-    """Main function to perform the full backend download workflow."""
-    try:
+def estimated_export_bytes(dimensions):
+    """Size of an uncompressed 8-bit export, or None when it is not known in advance (native scale)."""
+    if not dimensions:
+        return None
+    sizes = [int(size) for size in str(dimensions).lower().split('x')]
+    width, height = (sizes[0], sizes[0]) if len(sizes) == 1 else sizes
+    return width * height * len(EXPORT_BANDS)
+
+def resolve_transport(transport, dimensions):
+    """Picks 'direct' or 'drive' for one request; oversize or unknown-size requests always use Drive."""
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport '{transport}'. Choose one of: {', '.join(TRANSPORTS)}.")
+    if transport == 'drive':
+        return 'drive'
+    size = estimated_export_bytes(dimensions)
+    if size is None or size > DIRECT_MAX_BYTES:
+        return 'drive'
+    return 'direct'
+
+def fetch_to_file(url, filepath, timeout=DIRECT_TIMEOUT_SECONDS):
+    """
+    Streams a download URL to filepath. Earth Engine may answer with a zip holding the
+    GeoTIFF; its first .tif member is extracted in place.
+    """
+    if os.path.exists(filepath):
+        os.remove(filepath)  # May be a hard link into the imagery cache; never write through it
+    with urllib.request.urlopen(url, timeout=timeout) as response, open(filepath, 'wb') as fh:
+        shutil.copyfileobj(response, fh, DOWNLOAD_CHUNK_BYTES)
+
+    if zipfile.is_zipfile(filepath):
+        with zipfile.ZipFile(filepath) as archive:
+            members = [name for name in archive.namelist() if name.lower().endswith('.tif')]
+            if not members:
+                raise Exception("Direct download did not contain a GeoTIFF.")
+            data = archive.read(members[0])
+        with open(filepath, 'wb') as fh:
+            fh.write(data)
+    return filepath
+
+def download_direct(image, aoi, filename_prefix, temp_dir, dimensions=EXPORT_DIMENSIONS, valid_pixels=None):
+    """
+    Fetches the export image straight from Earth Engine into temp_dir, without the batch
+    queue or Google Drive. Returns the local path, or None when the AOI has no valid pixels.
+    """
+    final_export_image = prepare_export_image(image, aoi, valid_pixels)
+    if final_export_image is None:
+        return None
+    url = final_export_image.getDownloadURL(dict(
+        name=filename_prefix,
+        region=aoi.bounds(),
+        format='GEO_TIFF',
+        **size_params_for(dimensions)
+    ))
+    return fetch_to_file(url, os.path.join(temp_dir, f"{filename_prefix}.tif"))
+
+def export_cache_key(aoi, scene_id, dimensions):
+    """Imagery cache key of one export: AOI, scene and every parameter that shapes its pixels."""
+    return cache_key(aoi.toGeoJSONString(), scene_id, EXPORT_BANDS,
+                     {'rgb': RGB_VIS_PARAMS, 'nir': NIR_VIS_PARAMS}, dimensions)
+
+def export_and_download_many(plans, creds, temp_dir, dimensions=EXPORT_DIMENSIONS, cache=None, transport='auto'):
+    """
+    Exports several images at once and downloads each file as soon as its export completes.
+    Args:
+        plans (list): Scene plans from plan_scenes.
+        creds: Google Drive credentials; every download thread builds its own Drive
+               service from them, because the client is not thread-safe.
+        cache (ImageryCache, optional): Consulted before any export is started; scenes
+               found there are not exported again, and fresh downloads are added to it.
+        transport (str): 'auto', 'direct' or 'drive' (see TRANSPORTS). Scenes whose direct
+               download fails are exported through Drive instead; creds may then be
+               None, and are loaded on demand.
+    
+    Returns:
+        list: The local path of each job's GeoTIFF, or None for a job without valid pixels.
+    """
+    from cog_writer import convert_to_cog
+
+    transport = resolve_transport(transport, dimensions)
+    paths = [None] * len(plans)
+    keys = [None] * len(plans)
+    # Scenes that do not exist or are fully occluded are never exported
+    missing = [index for index, plan in enumerate(plans) if plan['image'] is not None and plan['valid_pixels']]
+    if cache is not None:
+        with stage_metrics.stage('cache_lookup'):
+            for index in list(missing):
+                plan = plans[index]
+                keys[index] = export_cache_key(plan['aoi'], plan['scene_id'], dimensions)
+                target_path = os.path.join(temp_dir, f"{plan['filename_prefix']}.tif")
+                if cache.fetch(keys[index], target_path):
+                    paths[index] = target_path
+                    missing.remove(index)
+    if not missing:
+        return paths
+
+    def job(index):
+        plan = plans[index]
+        return plan['image'], plan['aoi'], plan['filename_prefix']
+
+    def store(index):
+        # Downloads are rewritten as Cloud-Optimized GeoTIFFs before they are cached or used
+        if paths[index] is not None:
+            with stage_metrics.stage('cog_convert'):
+                convert_to_cog(paths[index], kind='imagery')
+        if cache is not None and keys[index] is not None and paths[index] is not None:
+            with stage_metrics.stage('cache_store'):
+                cache.store(keys[index], paths[index], metadata={key: plans[index][key] for key in
+                                                                 ('filename_prefix', 'scene_id', 'date')})
+
+    if transport == 'direct':
+        fallback = []
+
+        def fetch(index):
+            try:
+                with stage_metrics.stage('direct_download'):
+                    paths[index] = download_direct(*job(index), temp_dir, dimensions, plans[index]['valid_pixels'])
+            except Exception as e:
+                # The size estimate can be wrong (Earth Engine rejects the request) and the
+                # fetch can fail; the scene is exported through Drive below instead
+                print(f"Direct download of {plans[index]['filename_prefix']} failed ({e}); "
+                      f"exporting it through Drive.", file=sys.stderr)
+                fallback.append(index)
+                return
+            store(index)
+
+        fetch = stage_metrics.propagate(fetch)
+        with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS, len(missing))) as pool:
+            for future in [pool.submit(fetch, index) for index in missing]:
+                future.result()
+        if not fallback:
+            return paths
+        missing = sorted(fallback)
+        if creds is None:
+            with stage_metrics.stage('drive_auth'):
+                creds = get_gdrive_credentials()
+
+    with stage_metrics.stage('export_start'):
+        export_tasks = {index: start_export(*job(index), dimensions, plans[index]['valid_pixels'])
+                        for index in missing}
+    running = [(index, task) for index, task in export_tasks.items() if task is not None]
+    if not running:
+        return paths
+
+    local = threading.local()
+    folder = {}
+    folder_lock = threading.Lock()
+
+    def download(index):
+        if not hasattr(local, 'drive_service'):
+            from googleapiclient.discovery import build
+            local.drive_service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        with folder_lock:
+            if 'id' not in folder:
+                folder['id'] = find_drive_folder(local.drive_service)
+        with stage_metrics.stage('drive_download'):
+            paths[index] = download_export(local.drive_service, folder['id'], plans[index]['filename_prefix'],
+                                           temp_dir)
+        store(index)
+
+    download = stage_metrics.propagate(download)
+    with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS, len(running))) as pool:
+        downloads = []
+        # Downloads of finished exports overlap with waiting for the rest
+        with stage_metrics.stage('export_wait'):
+            wait_for_exports([task for _, task in running],
+                             lambda position: downloads.append(pool.submit(download, running[position][0])))
+        for future in downloads:
+            future.result()
+    return paths
+
+def export_and_download(image, aoi, drive_service, filename_prefix, temp_dir, dimensions=EXPORT_DIMENSIONS):
+    """
+    Exports a multi-band GeoTIFF from GEE to Google Drive, waits for completion, and downloads it.
+    Returns the local path, or None when the AOI has no valid pixels after cloud masking.
+    """
+    from cog_writer import convert_to_cog
+
+    with stage_metrics.stage('export_start'):
+        export_task = start_export(image, aoi, filename_prefix, dimensions)
+    if export_task is None:
+        return None
+    with stage_metrics.stage('export_wait'):
+        wait_for_exports([export_task], lambda index: None)
+    with stage_metrics.stage('drive_download'):
+        filepath = download_export(drive_service, find_drive_folder(drive_service), filename_prefix, temp_dir)
+    with stage_metrics.stage('cog_convert'):
+        return convert_to_cog(filepath, kind='imagery')
+
+def download_pair(geojson_str, start_date_str, end_date_str, dimensions=EXPORT_DIMENSIONS, job_id=None,
+                  use_cache=True, transport='auto'):
+    """The download workflow of main(); returns the success response or raises."""
+    with stage_metrics.stage('ee_initialize'):
+        import ee
         ee.Initialize(project='areaofinterest')
-        drive_service = authenticate_gdrive()
+    # Direct downloads never touch Drive, so only authenticate when Drive may be used
+    with stage_metrics.stage('drive_auth'):
+        creds = get_gdrive_credentials() if resolve_transport(transport, dimensions) == 'drive' else None
+
+    geojson_data = json.loads(geojson_str)
+    aoi = ee.Geometry.Polygon(geojson_data['coordinates'])
+    date_t1 = datetime.strptime(start_date_str, '%Y-%m-%d')
+    date_t2 = datetime.strptime(end_date_str, '%Y-%m-%d')
+    
+    suffix = f"_{job_id}" if job_id else ''
+    # Scene selection and valid-pixel checks for both dates in one round trip
+    with stage_metrics.stage('scene_planning'):
+        plans = plan_scenes([(date_t1, aoi, f'image_t1{suffix}'), (date_t2, aoi, f'image_t2{suffix}')])
 
+    # Create the download folder (temp_downloads in the processing directory) if it doesn't exist
+    temp_downloads_dir = DOWNLOAD_DIR
+    if job_id:
+        temp_downloads_dir = os.path.join(temp_downloads_dir, job_id)
+    if not os.path.exists(temp_downloads_dir):
+        os.makedirs(temp_downloads_dir)
+    
+    # Both exports run at the same time; each file is downloaded as soon as it is ready
+    cache = ImageryCache() if use_cache else None
+    t1_path, t2_path = export_and_download_many(plans, creds, temp_downloads_dir, dimensions, cache, transport)
+
+    if not t1_path or not t2_path:
+        raise Exception("Failed to download one or both images after cloud masking. The AOI may be fully occluded by clouds.")
+
+    response = {
+        "status": "success",
+        "t1_path": t1_path,
+        "t2_path": t2_path,
+        "temp_dir": temp_downloads_dir,
+        "transport": resolve_transport(transport, dimensions),
+        "scenes": [{key: plan[key] for key in ('scene_id', 'date', 'cloud_percentage', 'valid_pixels')}
+                   for plan in plans]
+    }
+    if cache:
+        response["cache"] = {"hits": cache.session_hits, "misses": cache.session_misses}
+    return response
+
+def validate_arguments(geojson_str, start_date_str, end_date_str, dimensions, transport):
+    """
+    Checks the command-line arguments before Earth Engine or the Google API client is
+    loaded, so malformed requests fail fast. Raises ValueError with a readable message.
+    """
+    try:
         geojson_data = json.loads(geojson_str)
-        aoi = ee.Geometry.Polygon(geojson_data['coordinates'])
-        date_t1 = datetime.strptime(start_date_str, '%Y-%m-%d')
-        date_t2 = datetime.strptime(end_date_str, '%Y-%m-%d')
-        
-        image_t1 = get_image_collection(date_t1, aoi)
-        image_t2 = get_image_collection(date_t2, aoi)
+    except ValueError as e:
+        raise ValueError(f"AOI is not valid GeoJSON: {e}")
+    if not isinstance(geojson_data, dict) or 'coordinates' not in geojson_data:
+        raise ValueError("AOI GeoJSON must be a geometry with 'coordinates'.")
+    for date_str in (start_date_str, end_date_str):
+        try:
+            datetime.strptime(date_str, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"Invalid date '{date_str}'; expected YYYY-MM-DD.")
+    if dimensions:
+        try:
+            sizes = [int(size) for size in str(dimensions).lower().split('x')]
+        except ValueError:
+            sizes = []
+        if len(sizes) not in (1, 2) or min(sizes) < 1:
+            raise ValueError(f"Invalid dimensions '{dimensions}'; expected N, WxH or 'native'.")
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport '{transport}'. Choose one of: {', '.join(TRANSPORTS)}.")
 
-        # Create the temp_downloads folder inside the processing directory if it doesn't exist
-        temp_downloads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_downloads')
-        if not os.path.exists(temp_downloads_dir):
-            os.makedirs(temp_downloads_dir)
-        
-        t1_path = export_and_download(image_t1, aoi, drive_service, 'image_t1', temp_downloads_dir)
-        t2_path = export_and_download(image_t2, aoi, drive_service, 'image_t2', temp_downloads_dir)
-
-        if not t1_path or not t2_path:
-            raise Exception("Failed to download one or both images after cloud masking. The AOI may be fully occluded by clouds.")
-
-        response = {
-            "status": "success",
-            "t1_path": t1_path,
-            "t2_path": t2_path,
-            "temp_dir": temp_downloads_dir
-        }
+def main(geojson_str, start_date_str, end_date_str, dimensions=EXPORT_DIMENSIONS, job_id=None, use_cache=True,
+         transport='auto'):
+    """
+    Main function to perform the full backend download workflow.
+    With a job_id (e.g. the AOI id) the exports are named image_t1_<job_id>/image_t2_<job_id>
+    and downloaded into temp_downloads/<job_id>, so concurrent jobs do not overwrite each other.
+    Scenes already in the local imagery cache are not exported again unless use_cache is False.
+    `transport` selects how pixels are fetched (see TRANSPORTS). The response carries the
+    per-stage metrics of the run.
+    """
+    metrics = stage_metrics.StageMetrics()
+    metrics.record_import()
+    try:
+        with stage_metrics.collect(metrics):
+            response = download_pair(geojson_str, start_date_str, end_date_str, dimensions, job_id, use_cache,
+                                     transport)
+        response["metrics"] = metrics.as_dict()
         print(json.dumps(response))
 
-    except ee.EEException as e:
-        print(json.dumps({"status": "error", "message": f"Earth Engine Error: {e}"}), file=sys.stderr)
-        sys.exit(1)
     except Exception as e:
-        print(json.dumps({"status": "error", "message": f"Processing Error: {e}"}), file=sys.stderr)
+        # ee is only loaded once the workflow has started
+        ee = sys.modules.get('ee')
+        prefix = "Earth Engine Error" if ee is not None and isinstance(e, ee.EEException) else "Processing Error"
+        print(json.dumps({"status": "error", "message": f"{prefix}: {e}", "metrics": metrics.as_dict()}),
+              file=sys.stderr)
         sys.exit(1)
 
-if __name__ == "__main__":
-    if len(sys.argv) < 4:
+def cli(argv):
+    """Command-line entry point: <geojson> <start_date> <end_date> [dimensions] [job_id]."""
+    if len(argv) < 3:
         print(json.dumps({"status": "error", "message": "Missing command-line arguments."}), file=sys.stderr)
         sys.exit(1)
     
-    geojson_str = sys.argv[1]
-    start_date = sys.argv[2]
-    end_date = sys.argv[3]
-
-    main(geojson_str, start_date, end_date)
-
+    geojson_str = argv[0]
+    start_date = argv[1]
+    end_date = argv[2]
+    # Optional 4th argument: export size such as '2048x2048', or 'native' for 10m resolution
+    dimensions = argv[3] if len(argv) > 3 else EXPORT_DIMENSIONS
+    if dimensions == 'native':
+        dimensions = None
+    # Optional 5th argument: job id that keeps concurrent downloads apart
+    job_id = argv[4] if len(argv) > 4 else None
+    # Set GEE_IMAGERY_CACHE=0 to always export fresh scenes
+    use_cache = os.environ.get('GEE_IMAGERY_CACHE', '1') != '0'
+    # GEE_TRANSPORT=direct|drive|auto selects how pixels are fetched (default: auto)
+    transport = os.environ.get('GEE_TRANSPORT', 'auto')
+    try:
+        validate_arguments(geojson_str, start_date, end_date, dimensions, transport)
+    except ValueError as e:
+        print(json.dumps({"status": "error", "message": f"Processing Error: {e}"}), file=sys.stderr)
+        sys.exit(1)
 
+    main(geojson_str, start_date, end_date, dimensions, job_id, use_cache, transport)
 
+if __name__ == "__main__":
+    cli(sys.argv[1:])
@@ -0,0 +1,241 @@
+# processing/imagery_cache.py
+#
+# Content-addressed local cache for exported Sentinel-2 scenes. An export is identified
+# by everything that determines its pixels (AOI geometry, scene id, band set,
+# visualization parameters and export size); gee_drive_download.py looks the key up
+# before it starts an export and stores every fresh download afterwards.
+#
+#   python imagery_cache.py stats
+#   python imagery_cache.py clear
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, 'imagery_cache')
+INDEX_FILENAME = 'index.json'
+LOCK_FILENAME = 'index.lock'
+# Least recently used scenes are evicted once the cache grows past this size.
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+# A lock file older than this is left over from a crashed process and is broken.
+STALE_LOCK_SECONDS = 60
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def geometry_hash(geojson):
+    """Stable hash of an AOI geometry given as a GeoJSON dict or string."""
+    if isinstance(geojson, str):
+        geojson = json.loads(geojson)
+    return hashlib.sha256(json.dumps(geojson, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def cache_key(geometry, scene_id, bands, vis_params, dimensions):
+    """Content key of one export; any change to what determines its pixels gives a new key."""
+    description = {
+        'geometry': geometry_hash(geometry),
+        'scene_id': scene_id,
+        'bands': list(bands),
+        'vis_params': vis_params,
+        'dimensions': dimensions
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def place_file(source_path, target_path):
+    """Hard-links source_path to target_path (copying when links are not possible)."""
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+
+class ImageryCache:
+    """
+    Size-bounded LRU cache of GeoTIFFs under cache_dir. The index (entries and hit
+    metrics) lives in index.json and is only changed under a lock file, so concurrent
+    download processes of the monitoring scheduler can share one cache.
+    """
+    # Extension of the cached files
+    FILE_SUFFIX = '.tif'
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self.lock_path = os.path.join(cache_dir, LOCK_FILENAME)
+        self.thread_lock = threading.Lock()
+        # Lookups made through this instance, for per-run reporting
+        self.session_hits = 0
+        self.session_misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # --- index handling -------------------------------------------------------
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        while True:
+            try:
+                os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > STALE_LOCK_SECONDS:
+                        os.remove(self.lock_path)
+                        continue
+                except OSError:
+                    continue  # Released in the meantime
+                time.sleep(0.05)
+
+    def release(self):
+        try:
+            os.remove(self.lock_path)
+        finally:
+            self.thread_lock.release()
+
+    def read_index(self):
+        if not os.path.exists(self.index_path):
+            return {'entries': {}, 'metrics': {'hits': 0, 'misses': 0, 'evictions': 0, 'corrupt': 0}}
+        with open(self.index_path, 'r') as f:
+            return json.load(f)
+
+    def write_index(self, index):
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f, indent=4)
+        os.replace(temp_path, self.index_path)
+
+    def remove_entry(self, index, key):
+        entry = index['entries'].pop(key, None)
+        if entry:
+            path = os.path.join(self.cache_dir, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+
+    # --- public API -----------------------------------------------------------
+
+    def fetch(self, key, target_path):
+        """
+        Places the cached file for key at target_path and returns True, or returns False
+        on a miss. Entries whose file is missing or fails its checksum are dropped.
+        """
+        self.acquire()
+        try:
+            index = self.read_index()
+            entry = index['entries'].get(key)
+            if entry is not None:
+                path = os.path.join(self.cache_dir, entry['file'])
+                if os.path.exists(path) and os.path.getsize(path) == entry['size'] and file_sha256(path) == entry['sha256']:
+                    place_file(path, target_path)
+                    entry['last_used'] = time.time()
+                    index['metrics']['hits'] += 1
+                    self.session_hits += 1
+                    self.write_index(index)
+                    return True
+                self.remove_entry(index, key)
+                index['metrics']['corrupt'] += 1
+            index['metrics']['misses'] += 1
+            self.session_misses += 1
+            self.write_index(index)
+            return False
+        finally:
+            self.release()
+
+    def store(self, key, source_path, metadata=None):
+        """Adds a downloaded file to the cache and evicts least recently used entries over the size limit."""
+        size = os.path.getsize(source_path)
+        if size > self.max_bytes:
+            return
+        filename = f"{key}{self.FILE_SUFFIX}"
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=f'{self.FILE_SUFFIX}.tmp')
+        os.close(fd)
+        shutil.copyfile(source_path, temp_path)
+        sha256 = file_sha256(temp_path)
+
+        self.acquire()
+        try:
+            index = self.read_index()
+            os.replace(temp_path, os.path.join(self.cache_dir, filename))
+            now = time.time()
+            index['entries'][key] = {
+                'file': filename,
+                'size': size,
+                'sha256': sha256,
+                'created': now,
+                'last_used': now,
+                'metadata': metadata or {}
+            }
+            total = sum(entry['size'] for entry in index['entries'].values())
+            for old_key in sorted(index['entries'], key=lambda k: index['entries'][k]['last_used']):
+                if total <= self.max_bytes:
+                    break
+                if old_key == key:
+                    continue
+                total -= index['entries'][old_key]['size']
+                self.remove_entry(index, old_key)
+                index['metrics']['evictions'] += 1
+            self.write_index(index)
+        finally:
+            self.release()
+
+    def stats(self):
+        """Entry count, total size and cumulative hit/miss/eviction metrics."""
+        self.acquire()
+        try:
+            index = self.read_index()
+        finally:
+            self.release()
+        metrics = index['metrics']
+        lookups = metrics['hits'] + metrics['misses']
+        return {
+            "entries": len(index['entries']),
+            "size_bytes": sum(entry['size'] for entry in index['entries'].values()),
+            "max_bytes": self.max_bytes,
+            "hit_rate": metrics['hits'] / lookups if lookups else 0.0,
+            **metrics
+        }
+
+    def clear(self):
+        """Removes every cached file and resets the metrics."""
+        self.acquire()
+        try:
+            index = self.read_index()
+            for key in list(index['entries']):
+                self.remove_entry(index, key)
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+        finally:
+            self.release()
+
+
+def cache_cli(cache, label):
+    """The `stats` / `clear` command line shared by the caches; prints one JSON line."""
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    if command == 'stats':
+        print(json.dumps({"status": "success", "cache": cache.stats()}))
+    elif command == 'clear':
+        cache.clear()
+        print(json.dumps({"status": "success", "message": f"{label} cleared."}))
+    else:
+        print(json.dumps({"status": "error", "message": f"Unknown command '{command}' (use stats or clear)."}),
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    cache_cli(ImageryCache(), "Imagery cache")
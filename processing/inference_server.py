@@ -0,0 +1,182 @@
+# processing/inference_server.py
+#
+# Long-lived U-Net inference daemon. The SiameseUNet checkpoint is loaded once and
+# jobs are accepted over HTTP (TCP or a Unix domain socket) using the same JSON
+# contract as `unet_inference.py`:
+#
+#   POST /infer   {"t1_path": "...", "t2_path": "...", ["tile_size": 512, ...]}
+#                 ->  unet_inference response JSON
+#   POST /infer_batch  {"pairs": [{"t1_path": "...", "t2_path": "...", "id": "..."}, ...]}
+#                 ->  JSON array with one response per pair
+#   GET  /health  ->  {"status": "success", ...}
+#
+# Point unet_inference.py at it with UNET_INFERENCE_SERVER=http://127.0.0.1:8765
+# (or unix:///path/to.sock) and existing callers switch over without changes.
+
+import os
+import sys
+import json
+import argparse
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import unet_inference
+import stage_metrics
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Optional request fields forwarded to unet_inference.run_inference
+JOB_OPTIONS = ('tile_size', 'tile_overlap', 'tile_batch_size', 'visualizations')
+
+
+class InferenceService:
+    """Keeps the model warm and runs jobs through it one at a time."""
+    def __init__(self, output_dir=unet_inference.OUTPUT_DIR, backend='torch', fuse=True, int8=False,
+                 model_path=None):
+        self.model = unet_inference.load_backend(backend, fuse=fuse, int8=int8, model_path=model_path)
+        self.device = self.model.device
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.jobs_completed = 0
+
+    def infer(self, job):
+        t1_path = job.get('t1_path')
+        t2_path = job.get('t2_path')
+        if not t1_path or not t2_path:
+            return {"status": "error", "message": "Missing request fields (t1_path, t2_path)."}
+
+        options = {key: job[key] for key in JOB_OPTIONS if job.get(key) is not None}
+
+        # A single forward pass already uses every core, so jobs are serialized.
+        with self.lock, stage_metrics.collect() as metrics:
+            try:
+                response = unet_inference.run_inference(self.model, self.device, t1_path, t2_path,
+                                                        output_dir=self.output_dir, **options)
+            except Exception as e:
+                return {"status": "error", "message": f"Processing Error: {e}", "metrics": metrics.as_dict()}
+            self.jobs_completed += 1
+            response['metrics'] = metrics.as_dict()
+            return response
+
+    def infer_batch(self, job):
+        pairs = job.get('pairs')
+        if not isinstance(pairs, list):
+            return {"status": "error", "message": "Missing request field (pairs)."}
+
+        options = {key: job[key] for key in JOB_OPTIONS if job.get(key) is not None}
+
+        with self.lock, stage_metrics.collect() as metrics:
+            try:
+                responses = unet_inference.run_batch_inference(self.model, self.device, pairs,
+                                                               output_dir=self.output_dir, **options)
+            except Exception as e:
+                return {"status": "error", "message": f"Processing Error: {e}", "metrics": metrics.as_dict()}
+            self.jobs_completed += len(pairs)
+            batch_metrics = metrics.as_dict()
+            for response in responses:
+                response['metrics'] = batch_metrics
+            return responses
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """Maps HTTP requests onto the InferenceService attached to the server."""
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(404, {"status": "error", "message": f"Unknown endpoint '{self.path}'."})
+            return
+        service = self.server.service
+        self.send_json(200, {
+            "status": "success",
+            "backend": service.model.name,
+            "device": str(service.device or 'cpu'),
+            "jobs_completed": service.jobs_completed
+        })
+
+    def do_POST(self):
+        if self.path not in ('/infer', '/infer_batch'):
+            self.send_json(404, {"status": "error", "message": f"Unknown endpoint '{self.path}'."})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = json.loads(self.rfile.read(length).decode('utf-8'))
+        except (ValueError, UnicodeDecodeError) as e:
+            self.send_json(400, {"status": "error", "message": f"Invalid JSON request: {e}"})
+            return
+
+        if self.path == '/infer_batch':
+            # Per-pair failures are reported inside the array; only request-level errors are objects
+            response = self.server.service.infer_batch(job)
+            self.send_json(500 if isinstance(response, dict) else 200, response)
+        else:
+            response = self.server.service.infer(job)
+            self.send_json(200 if response.get('status') == 'success' else 500, response)
+
+    def send_json(self, code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix domain socket peers have no (host, port) address.
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        print(f"[inference_server] {self.address_string()} {format % args}", file=sys.stderr)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP server bound to a Unix domain socket."""
+    daemon_threads = True
+
+
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """Binds an HTTP server for the service on TCP host:port, or on socket_path when given."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # Stale socket left behind by a previous run
+        server = ThreadingUnixHTTPServer(socket_path, InferenceRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), InferenceRequestHandler)
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm-model SiameseUNet inference server.")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="TCP interface to bind (default: 127.0.0.1).")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="TCP port to bind (default: 8765).")
+    parser.add_argument('--socket', dest='socket_path', help="Listen on this Unix domain socket instead of TCP.")
+    parser.add_argument('--backend', choices=unet_inference.BACKENDS, default='torch',
+                        help="Runtime for the network (torchscript/onnxruntime need unet_export.py first).")
+    parser.add_argument('--model', help="Model file for the backend (default: the file under models/).")
+    parser.add_argument('--no-fuse', dest='fuse', action='store_false',
+                        help="Serve the checkpoint as-is instead of the BatchNorm-folded model.")
+    parser.add_argument('--int8', action='store_true', help="Serve the INT8 CPU model created by unet_quantize.py.")
+    args = parser.parse_args()
+
+    try:
+        service = InferenceService(backend=args.backend, fuse=args.fuse, int8=args.int8, model_path=args.model)
+        server = create_server(service, args.host, args.port, args.socket_path)
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": f"Could not start inference server: {e}"}), file=sys.stderr)
+        sys.exit(1)
+
+    address = f"unix://{args.socket_path}" if args.socket_path else f"http://{args.host}:{args.port}"
+    print(f"Inference server ready on {address} (backend: {service.model.name})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket_path and os.path.exists(args.socket_path):
+            os.remove(args.socket_path)
+
+
+if __name__ == '__main__':
+    main()
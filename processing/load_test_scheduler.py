@@ -0,0 +1,306 @@
+# processing/load_test_scheduler.py
+#
+# Offline load test of the monitoring scheduler. A throwaway task store is filled with
+# synthetic AOIs, and monitoring_scheduler.monitor_aois() checks all of them once per
+# simulated cycle, the cycles monitoring_interval_days apart. Downloads run through
+# fake_earth_engine.py (a local Earth Engine and Drive serving synthetic GeoTIFFs) and
+# the detectors run for real on the downloaded pairs.
+#
+#   python load_test_scheduler.py --aois 100 --cycles 3 --time-scale 0.05 [--output report.json]
+#
+# Every cycle reports its duration, AOIs per hour, the queueing delay of the AOIs (from
+# the start of the cycle until a worker picks them up), their processing time and the
+# CPU time, peak RSS and I/O of the scheduler and its download subprocesses. Per-stage
+# metrics accumulate in stage_metrics.prom in the work directory. Latencies are real
+# seconds multiplied by --time-scale; scale the durations back to plan capacity.
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+from datetime import datetime, timedelta
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import stage_metrics
+import monitoring_scheduler
+import fake_earth_engine
+from task_store import TaskStore
+from baseline_cache import BaselineFeatureCache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_DOWNLOAD_SCRIPT = os.path.join(BASE_DIR, 'fake_earth_engine.py')
+UNET_MODES = ('auto', 'model', 'untrained', 'off')
+
+# Synthetic AOIs: squares of AOI_SIZE_DEGREES on a grid starting at GRID_ORIGIN (lon, lat)
+GRID_ORIGIN = (72.0, 18.0)
+GRID_COLUMNS = 100
+AOI_SIZE_DEGREES = 0.05
+MONITORING_INTERVAL_DAYS = 5
+THRESHOLD = 0.1
+
+
+def synthetic_task(index, interval_days=MONITORING_INTERVAL_DAYS):
+    """Monitoring task of the index-th AOI of the grid."""
+    row, column = divmod(index, GRID_COLUMNS)
+    west = GRID_ORIGIN[0] + column * AOI_SIZE_DEGREES * 2
+    south = GRID_ORIGIN[1] + row * AOI_SIZE_DEGREES * 2
+    east, north = west + AOI_SIZE_DEGREES, south + AOI_SIZE_DEGREES
+    return {
+        'aoi_id': f'load-test-{index:05d}',
+        'geojson': {'type': 'Polygon',
+                    'coordinates': [[[west, south], [east, south], [east, north], [west, north], [west, south]]]},
+        'monitoring_interval_days': interval_days,
+        'threshold': THRESHOLD
+    }
+
+
+def quantiles(values):
+    """p50/p90/p99/max of a list of seconds, None when it is empty."""
+    if not values:
+        return None
+    values = sorted(values)
+    return {"p50": round(stage_metrics.quantile(values, 0.5), 3),
+            "p90": round(stage_metrics.quantile(values, 0.9), 3),
+            "p99": round(stage_metrics.quantile(values, 0.99), 3),
+            "max": round(values[-1], 3)}
+
+
+def children_usage():
+    """(CPU seconds, peak RSS bytes) of the finished child processes; RSS is the largest child so far."""
+    if resource is None:
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    peak = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return usage.ru_utime + usage.ru_stime, peak
+
+
+class AoiTimings:
+    """Wraps monitoring_scheduler.process_aoi to record when each AOI starts and finishes."""
+    def __init__(self, process_aoi):
+        self.process_aoi = process_aoi
+        self.records = []
+        self.lock = threading.Lock()
+        self.cycle_started = None
+
+    def __call__(self, task, current_date, *args, **kwargs):
+        started = time.monotonic()
+        checked = False
+        try:
+            checked = self.process_aoi(task, current_date, *args, **kwargs)
+            return checked
+        finally:
+            with self.lock:
+                self.records.append({"queued_s": started - self.cycle_started,
+                                     "duration_s": time.monotonic() - started, "checked": bool(checked)})
+
+    def start_cycle(self):
+        with self.lock:
+            self.records = []
+            self.cycle_started = time.monotonic()
+
+    def cycle_records(self):
+        with self.lock:
+            return list(self.records)
+
+
+def setup_unet(mode):
+    """
+    Prepares the scheduler's U-Net detector and returns the mode used. 'auto' runs the
+    trained model when it exists, an untrained network when only torch is available and
+    no U-Net otherwise.
+    """
+    if mode == 'auto':
+        try:
+            import torch  # noqa: F401
+        except ImportError:
+            mode = 'off'
+        else:
+            mode = 'model' if os.path.exists(monitoring_scheduler.unet_inference.MODEL_PATH) else 'untrained'
+
+    if mode == 'untrained':
+        # Same cost as the trained network
+        from siamese_unet import SiameseUNet, fuse_for_inference
+        unet_inference = monitoring_scheduler.unet_inference
+        device = unet_inference.get_device()
+        model = fuse_for_inference(SiameseUNet(in_channels=3, out_channels=1).to(device).eval())
+        monitoring_scheduler.unet_model = unet_inference.TorchBackend(model, device)
+    elif mode == 'off':
+        monitoring_scheduler.run_unet_detector = lambda *args, **kwargs: {"status": "skipped",
+                                                                         "percentage_change": 0.0}
+    return mode
+
+
+def run_load_test(aois, cycles, work_dir, fake_config, aoi_workers=monitoring_scheduler.AOI_WORKERS,
+                  detector_workers=monitoring_scheduler.DETECTOR_WORKERS, interval_days=MONITORING_INTERVAL_DAYS,
+                  unet='auto', transport='auto', imagery_cache=False, incremental=False, log_path=None):
+    """
+    Runs `cycles` simulated monitoring cycles over `aois` synthetic AOIs and returns the report.
+    The scheduler's task store, caches, downloads and metrics file all live in work_dir.
+    """
+    store = TaskStore(os.path.join(work_dir, 'tasks.db'), legacy_path=None)
+    store.clear()
+    for index in range(aois):
+        store.add_task(synthetic_task(index, interval_days))
+
+    # Downloads go through the fake Earth Engine in a subprocess, like gee_drive_download.py
+    os.environ[fake_earth_engine.CONFIG_ENV] = json.dumps(dict(fake_config, work_dir=work_dir))
+    os.environ['GEE_IMAGERY_CACHE'] = '1' if imagery_cache else '0'
+    os.environ['GEE_TRANSPORT'] = transport
+    monitoring_scheduler.GEE_DOWNLOAD_SCRIPT = FAKE_DOWNLOAD_SCRIPT
+    monitoring_scheduler.task_store = store
+    monitoring_scheduler.incremental = incremental
+    monitoring_scheduler.baseline_cache = BaselineFeatureCache(os.path.join(work_dir, 'baseline_features'))
+    monitoring_scheduler.metrics_file = os.path.join(work_dir, 'stage_metrics.prom')
+    unet = setup_unet(unet)
+    timings = monitoring_scheduler.process_aoi = AoiTimings(monitoring_scheduler.process_aoi)
+    monitoring_scheduler.start_worker_pools(aoi_workers, detector_workers)
+
+    # New tasks come due within minutes of now; the first cycle runs a day later, at noon
+    first_date = (datetime.now() + timedelta(days=1)).replace(hour=12, minute=0, second=0, microsecond=0)
+    log = open(log_path or os.devnull, 'a')
+    reports = []
+    try:
+        for cycle in range(cycles):
+            current_date = first_date + timedelta(days=cycle * interval_days)
+            start = stage_metrics.snapshot()
+            start_children = children_usage()
+            timings.start_cycle()
+            # The scheduler reports every AOI on stdout/stderr
+            with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+                due = monitoring_scheduler.monitor_aois(current_date)
+            end = stage_metrics.snapshot()
+            end_children = children_usage()
+
+            records = timings.cycle_records()
+            duration = end.wall - start.wall
+            checked = sum(record['checked'] for record in records)
+            report = {
+                "cycle": cycle,
+                "simulated_date": current_date.strftime('%Y-%m-%d'),
+                "due": due,
+                "checked": checked,
+                "failed": len(records) - checked,
+                "duration_s": round(duration, 3),
+                "aois_per_hour": round(len(records) / duration * 3600, 1) if duration > 0 else None,
+                "queue_delay_s": quantiles([record['queued_s'] for record in records]),
+                "aoi_duration_s": quantiles([record['duration_s'] for record in records]),
+                "cpu_s": round(end.cpu - start.cpu, 3),
+                "child_cpu_s": (round(end_children[0] - start_children[0], 3)
+                                if start_children[0] is not None else None),
+                "peak_rss_bytes": end.peak_rss,
+                "child_peak_rss_bytes": end_children[1],
+                "read_bytes": stage_metrics.delta(end.read_bytes, start.read_bytes),
+                "written_bytes": stage_metrics.delta(end.written_bytes, start.written_bytes)
+            }
+            reports.append(report)
+            print(f"Cycle {cycle} ({report['simulated_date']}): {report['checked']}/{due} AOIs checked in "
+                  f"{report['duration_s']}s, {report['aois_per_hour']} AOIs/hour", file=sys.stderr)
+    finally:
+        log.close()
+        monitoring_scheduler.aoi_pool.shutdown()
+        monitoring_scheduler.detector_pool.shutdown()
+
+    total_duration = sum(report['duration_s'] for report in reports)
+    total_aois = sum(report['checked'] + report['failed'] for report in reports)
+    return {
+        "status": "success",
+        "aois": aois,
+        "aoi_workers": aoi_workers,
+        "detector_workers": detector_workers,
+        "transport": transport,
+        "unet": unet,
+        "fake_earth_engine": fake_config,
+        "cycles": reports,
+        "summary": {
+            "cycles": len(reports),
+            "duration_s": round(total_duration, 3),
+            "aois_per_hour": round(total_aois / total_duration * 3600, 1) if total_duration > 0 else None,
+            "checked": sum(report['checked'] for report in reports),
+            "failed": sum(report['failed'] for report in reports),
+            "slowest_cycle_s": max((report['duration_s'] for report in reports), default=None)
+        },
+        "metrics_file": monitoring_scheduler.metrics_file
+    }
+
+
+def parse_range(value):
+    """'30,120' -> [30.0, 120.0]; a single number is a fixed value."""
+    bounds = [float(bound) for bound in value.split(',')]
+    if len(bounds) == 1:
+        bounds *= 2
+    if len(bounds) != 2 or bounds[0] > bounds[1] or bounds[0] < 0:
+        raise argparse.ArgumentTypeError(f"Expected 'min,max' seconds, got '{value}'.")
+    return bounds
+
+
+if __name__ == '__main__':
+    defaults = fake_earth_engine.DEFAULT_CONFIG
+    parser = argparse.ArgumentParser(description="Load test of the monitoring scheduler against a local "
+                                                 "Earth Engine and Drive stand-in.")
+    parser.add_argument('--aois', type=int, default=100, help="Number of synthetic AOIs (default: 100).")
+    parser.add_argument('--cycles', type=int, default=3, help="Simulated monitoring cycles (default: 3).")
+    parser.add_argument('--interval-days', type=float, default=MONITORING_INTERVAL_DAYS,
+                        help=f"Monitoring interval of every AOI (default: {MONITORING_INTERVAL_DAYS}).")
+    parser.add_argument('--aoi-workers', type=int, default=monitoring_scheduler.AOI_WORKERS)
+    parser.add_argument('--detector-workers', type=int, default=monitoring_scheduler.DETECTOR_WORKERS)
+    parser.add_argument('--export-latency', type=parse_range, default=defaults['export_latency_s'],
+                        help="Seconds until a Drive export completes, as 'min,max'.")
+    parser.add_argument('--direct-latency', type=parse_range, default=defaults['direct_latency_s'],
+                        help="Seconds until a direct download URL is ready, as 'min,max'.")
+    parser.add_argument('--failure-rate', type=float, default=defaults['failure_rate'],
+                        help="Fraction of exports and direct downloads that fail.")
+    parser.add_argument('--occlusion-rate', type=float, default=defaults['occlusion_rate'],
+                        help="Fraction of scenes fully occluded by clouds over their AOI.")
+    parser.add_argument('--drive-bytes-per-s', type=float, default=defaults['drive_bytes_per_s'],
+                        help="Simulated Drive download bandwidth (default: unlimited).")
+    parser.add_argument('--time-scale', type=float, default=defaults['time_scale'],
+                        help="Multiplier of every simulated latency, e.g. 0.05 to run 20 times faster.")
+    parser.add_argument('--transport', choices=('auto', 'direct', 'drive'), default='auto',
+                        help="GEE_TRANSPORT of the downloads (default: auto).")
+    parser.add_argument('--unet', choices=UNET_MODES, default='auto',
+                        help="U-Net detector: the trained model, an untrained network of the same cost, or "
+                             "none (default: auto, whichever is available).")
+    parser.add_argument('--imagery-cache', action='store_true', help="Use the imagery cache for downloads.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Keep and reuse the U-Net baseline encoder features, like the scheduler's --incremental.")
+    parser.add_argument('--seed', type=int, default=defaults['seed'], help="Seed of the synthetic scenes.")
+    parser.add_argument('--work-dir', help="Keep the task store, scenes, downloads and metrics here.")
+    parser.add_argument('--output', help="Also write the report to this JSON file.")
+    args = parser.parse_args()
+
+    fake_config = {
+        'export_latency_s': args.export_latency,
+        'direct_latency_s': args.direct_latency,
+        'failure_rate': args.failure_rate,
+        'occlusion_rate': args.occlusion_rate,
+        'drive_bytes_per_s': args.drive_bytes_per_s,
+        'time_scale': args.time_scale,
+        'seed': args.seed
+    }
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='load_test_scheduler_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        report = run_load_test(args.aois, args.cycles, work_dir, fake_config, args.aoi_workers,
+                               args.detector_workers, args.interval_days, args.unet, args.transport,
+                               args.imagery_cache, args.incremental, os.path.join(work_dir, 'scheduler.log'))
+        if not args.work_dir:
+            report['metrics_file'] = None
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        print(json.dumps(report))
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": f"Load test failed: {e}"}), file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
@@ -1,41 +1,113 @@
 # processing/monitoring_scheduler.py
+#
+# Keeps every monitoring task in a min-heap ordered by the time it next comes due and
+# sleeps until exactly that deadline. Tasks added or stopped through task_store.py are
+# announced on a local UDP port and picked up at once; the store is only rescanned as a
+# safety net every RESYNC_SECONDS. Only one scheduler can hold the port, so a second
+# start exits right away.
+#
+#   python monitoring_scheduler.py [--aoi-workers 8] [--detector-workers 2] [--once] [--incremental]
+#
+# With --incremental the U-Net keeps the T1 encoder features of each check in
+# baseline_cache.py, so a later check of the same baseline scene (mostly a retry) skips
+# the T1 encoder. It costs about 250 MB of RAM and disk per 1024x1024 baseline, so it is
+# off by default.
 
-import schedule
 import time
 import json
 import os
 from datetime import datetime, timedelta
 import subprocess
 import sys
+import heapq
+import socket
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+
+import gee_change_detection
+import unet_inference
+import change_visualization
+import stage_metrics
+from task_store import TaskStore, NOTIFY_ADDRESS
+from baseline_cache import BaselineFeatureCache, baseline_key
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MONITORING_TASKS_FILE = os.path.join(BASE_DIR, 'monitoring_tasks.json')
 GEE_DOWNLOAD_SCRIPT = os.path.join(BASE_DIR, 'gee_drive_download.py')
-GEE_CHANGE_DETECTION_SCRIPT = os.path.join(BASE_DIR, 'gee_change_detection.py')
-UNET_INFERENCE_SCRIPT = os.path.join(BASE_DIR, 'unet_inference.py')
+OUTPUT_DIR = os.path.join(BASE_DIR, 'temp_downloads')
+EXPORT_DIMENSIONS = '1024x1024'
 PYTHON_PATH = sys.executable
 
-def get_monitoring_tasks():
-    """Reads monitoring tasks from the state file."""
-    if not os.path.exists(MONITORING_TASKS_FILE):
-        return []
-    with open(MONITORING_TASKS_FILE, 'r') as f:
-        return json.load(f)
-
-def save_monitoring_tasks(tasks):
-    """Saves monitoring tasks to the state file."""
-    with open(MONITORING_TASKS_FILE, 'w') as f:
-        json.dump(tasks, f, indent=4)
-
-def run_python_script(script_path, args):
+# AOIs are processed concurrently. The AOI pool is I/O-bound (each worker mostly waits
+# on a GEE export and Drive download) and can be wide; the detectors are CPU-bound and
+# run on a small separate pool. rasterio decoding, the numpy kernels and the torch
+# forward pass all release the GIL, so threads are enough for both.
+AOI_WORKERS = 8
+DETECTOR_WORKERS = 2
+# Wall-time budget for one AOI (download plus detection). The download subprocess is
+# killed when it runs out. A detector's budget starts when it starts running, not while
+# it waits for a detector worker or the shared U-Net; one that overruns fails the AOI for
+# this cycle, and the U-Net stops at its next tile batch and releases the model.
+AOI_TIMEOUT_SECONDS = 1800
+DETECTOR_TIMEOUT_SECONDS = 600
+# A failed AOI (no cloud-free scene, export error, timeout) is retried after this long.
+# It is also the shortest time between two checks of one AOI.
+RETRY_SECONDS = 300
+# The whole queue is rebuilt from the store this often, in case a notification was lost.
+RESYNC_SECONDS = 3600
+
+aoi_pool = None
+detector_pool = None
+
+# The U-Net is loaded on first use and kept warm for every later AOI and cycle.
+unet_model = None
+unet_model_lock = threading.Lock()
+unet_inference_lock = threading.Lock()
+# Monitoring tasks (SQLite); opened on first use, which also migrates monitoring_tasks.json
+task_store = None
+# Baseline encoder features (baseline_cache.py); created on first use. With incremental
+# off (the default) every U-Net check runs from scratch.
+incremental = False
+baseline_cache = None
+# Monitoring runs rarely have their PNGs looked at, so they are only rendered when downloaded
+visualizations = 'deferred'
+# Per-stage metrics of every AOI check (scheduler stages and those reported by the download
+# script), rewritten as a Prometheus text file after each check
+stage_histograms = stage_metrics.StageHistograms()
+METRICS_FILE = os.path.join(BASE_DIR, 'stage_metrics.prom')
+metrics_file = METRICS_FILE
+metrics_file_lock = threading.Lock()
+
+def start_worker_pools(aoi_workers=AOI_WORKERS, detector_workers=DETECTOR_WORKERS):
+    """Creates the AOI and detector pools; called once before the first cycle."""
+    global aoi_pool, detector_pool
+    aoi_pool = ThreadPoolExecutor(max_workers=aoi_workers, thread_name_prefix='aoi')
+    detector_pool = ThreadPoolExecutor(max_workers=detector_workers, thread_name_prefix='detector')
+
+def get_task_store():
+    global task_store
+    if task_store is None:
+        task_store = TaskStore()
+    return task_store
+
+def get_baseline_cache():
+    """The baseline feature cache, or None when incremental runs are off."""
+    global baseline_cache
+    if incremental and baseline_cache is None:
+        baseline_cache = BaselineFeatureCache()
+    return baseline_cache if incremental else None
+
+def run_python_script(script_path, args, timeout=None):
     """Helper to run a Python script and return its JSON output."""
     try:
         command = [PYTHON_PATH, script_path] + args
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
+        result = subprocess.run(command, capture_output=True, text=True, check=True, timeout=timeout)
         # Assuming the last line is the JSON output
         last_line = result.stdout.strip().split('\n')[-1]
         return json.loads(last_line)
+    except subprocess.TimeoutExpired:
+        raise TimeoutError(f"{os.path.basename(script_path)} did not finish within {timeout} seconds.")
     except subprocess.CalledProcessError as e:
         print(f"Error running {script_path}: {e.stderr}", file=sys.stderr)
         # We need to catch this specific error and handle it gracefully
@@ -47,103 +119,404 @@ def run_python_script(script_path, args):
         print(f"Error decoding JSON from {script_path}: {e}", file=sys.stderr)
         raise
 
-def monitor_aois():
+def get_unet_model():
+    """Loads the U-Net execution backend once per scheduler process."""
+    global unet_model
+    with unet_model_lock:
+        if unet_model is None:
+            unet_model = unet_inference.load_backend()
+        return unet_model
+
+
+class DetectorRun:
     """
-    The core function that the scheduler will run.
-    It checks all AOIs and triggers processing if a new image is due.
+    One detector submitted to the detector pool. The detector calls start() when its
+    work begins, and the time budget of result() counts from there; the wait in the
+    queue before it is bounded by the caller's deadline. cancel() sets `cancelled`,
+    which the U-Net checks between tile batches.
     """
-    print(f"[{datetime.now().isoformat()}] Checking for AOIs to monitor...")
-    monitoring_tasks = get_monitoring_tasks()
+    def __init__(self, detector, *args):
+        self.started = threading.Event()
+        self.started_at = None
+        self.cancelled = threading.Event()
+        self.future = detector_pool.submit(stage_metrics.propagate(detector), *args, run=self)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.started.set()
+
+    def result(self, timeout, deadline):
+        """
+        Waits for the detector to start, then at most `timeout` seconds for its result,
+        never past `deadline` (a time.monotonic() value). Raises
+        concurrent.futures.TimeoutError when either runs out.
+        """
+        while not self.started.wait(timeout=max(0, min(1, deadline - time.monotonic()))):
+            if self.future.done():
+                return self.future.result()  # Failed or cancelled before it started
+            if time.monotonic() >= deadline:
+                raise FutureTimeoutError("The detector did not start before the deadline.")
+        end = min(self.started_at + timeout, deadline)
+        return self.future.result(timeout=max(0, end - time.monotonic()))
+
+    def cancel(self):
+        self.cancelled.set()
+        self.future.cancel()
+
+
+def run_ndvi_detector(t1_path, t2_path, threshold, run=None):
+    """Runs NDVI change detection in-process and returns its summary dict."""
+    cancelled = None
+    if run is not None:
+        run.start()
+        cancelled = run.cancelled
+    gain_pixels, loss_pixels, width, height = gee_change_detection.stream_ndvi_change(t1_path, t2_path, threshold,
+                                                                                      cancelled=cancelled)
+    return gee_change_detection.summarize_ndvi_change(gain_pixels, loss_pixels, width, height)
+
+def run_unet_detector(t1_path, t2_path, output_dir=OUTPUT_DIR, features_key=None, run=None):
+    """
+    Runs U-Net change detection in-process with the warm model and returns its response dict.
+    With the baseline key of the T1 scene and incremental runs on, stored T1 encoder
+    features are reused, and those computed by a run without them are stored.
+    With a DetectorRun, its clock starts once the shared model is free, and a cancelled
+    run stops between tiles.
+    """
+    model = get_unet_model()
+    cancelled = run.cancelled if run is not None else None
+    cache = get_baseline_cache()
+    if cache is None or not features_key or not getattr(model, 'supports_baseline', False):
+        # The model is shared, so forward passes are serialized like in inference_server.py
+        with unet_inference_lock:
+            if run is not None:
+                run.start()
+            return unet_inference.run_inference(model, model.device, t1_path, t2_path, output_dir=output_dir,
+                                                visualizations=visualizations, cancelled=cancelled)
+
+    baseline = cache.load(features_key)
+    with unet_inference_lock:
+        if run is not None:
+            run.start()
+        response, features = unet_inference.run_incremental_inference(model, model.device, t1_path, t2_path,
+                                                                      baseline=baseline, output_dir=output_dir,
+                                                                      visualizations=visualizations,
+                                                                      cancelled=cancelled)
+    if features is not None:
+        cache.save(features_key, features)
+    return response
+
+def run_detectors(t1_path, t2_path, threshold, output_dir=OUTPUT_DIR, timeout=DETECTOR_TIMEOUT_SECONDS,
+                  features_key=None, deadline=None):
+    """
+    Runs the NDVI and U-Net detectors concurrently and returns (ndvi_summary, unet_response).
+    Raises TimeoutError when a detector does not finish within `timeout` seconds of starting,
+    or when both have not finished by `deadline` (time.monotonic(); default: twice `timeout`
+    from now), which also bounds their wait for a detector worker and the shared model.
+    """
+    if deadline is None:
+        deadline = time.monotonic() + 2 * timeout
+    # Detector stages are recorded into the metrics of the AOI
+    ndvi_run = DetectorRun(run_ndvi_detector, t1_path, t2_path, threshold)
+    unet_run = DetectorRun(run_unet_detector, t1_path, t2_path, output_dir, features_key)
+    try:
+        ndvi_summary = ndvi_run.result(timeout, deadline)
+        unet_response = unet_run.result(timeout, deadline)
+    except FutureTimeoutError:
+        ndvi_run.cancel()
+        unet_run.cancel()
+        raise TimeoutError(f"Change detection did not finish within {timeout} seconds of starting "
+                           f"or before its deadline.")
+    except BaseException:
+        # Do not leave the U-Net running for an AOI that has already failed
+        unet_run.cancel()
+        raise
+    return ndvi_summary, unet_response
+
+def write_stage_metrics():
+    """Rewrites the Prometheus text file; a failed write only costs this update."""
+    if not metrics_file:
+        return
+    try:
+        with metrics_file_lock:
+            stage_histograms.write(metrics_file)
+    except OSError as e:
+        print(f"Could not write stage metrics to {metrics_file}: {e}", file=sys.stderr)
+
+def process_aoi(task, current_date, timeout=AOI_TIMEOUT_SECONDS):
+    """
+    Downloads the image pair for one due AOI, runs the detectors and records the new
+    last_checked_date in the task store. Runs on the AOI pool. The stage metrics of the
+    check, successful or not, are added to stage_histograms.
+    Returns:
+        bool: True when the AOI was checked, False when it failed and was put back for a retry.
+    """
+    with stage_metrics.collect() as metrics:
+        try:
+            return check_aoi(task, current_date, timeout)
+        finally:
+            stage_histograms.observe('monitoring_scheduler', metrics.as_dict())
+            write_stage_metrics()
+
+def check_aoi(task, current_date, timeout=AOI_TIMEOUT_SECONDS):
+    """The body of process_aoi()."""
+    aoi_id = task['aoi_id']
+    last_checked_date_str = task.get('last_checked_date')
+    threshold = task['threshold']
+    geojson_str = json.dumps(task['geojson'])
+    deadline = time.monotonic() + timeout
     
-    updated_tasks = []
+    # We need a longer date range for the new image to find a cloud-free image
+    # This is a crucial change to handle the download failure
+    # Let's search for an image in the last 7 days from today.
+    end_date = current_date.strftime('%Y-%m-%d')
+
+    # Use the last checked date for the baseline image
+    # If there's no last_checked_date, use a longer period, e.g., 30 days before the new image
+    if not last_checked_date_str:
+        baseline_start_date = (current_date - timedelta(days=37)).strftime('%Y-%m-%d')
+    else:
+        baseline_start_date = last_checked_date_str
+
+    print(f"AOI {aoi_id}: New image is due. Searching for a cloud-free image...")
     
-    if not monitoring_tasks:
-        print("No monitoring tasks found. Waiting for new tasks to be added.")
-        return # Exit the function early
-
-    for task in monitoring_tasks:
-        aoi_id = task['aoi_id']
-        last_checked_date_str = task.get('last_checked_date')
-        monitoring_interval = task['monitoring_interval_days']
-        threshold = task['threshold']
-        geojson_str = json.dumps(task['geojson'])
+    try:
+        # 1. Download images for two dates with a flexible search range, into a folder of this AOI
+        with stage_metrics.stage('download'):
+            download_result = run_python_script(GEE_DOWNLOAD_SCRIPT,
+                                                [geojson_str, baseline_start_date, end_date, EXPORT_DIMENSIONS,
+                                                 aoi_id],
+                                                timeout=timeout)
+        stage_histograms.observe('gee_drive_download', download_result.get('metrics'))
+
+        if download_result.get('status') != 'success':
+            # This check is now redundant since the error is caught by the try/except block.
+            # It's good practice to leave it, but the raised exception will handle the failure.
+            raise Exception(f"Download failed: {download_result.get('message')}")
+        
+        t1_path = download_result['t1_path']
+        t2_path = download_result['t2_path']
+        # The T1 scene id identifies the baseline pixels, and with them its stored encoder features
+        t1_scene_id = (download_result.get('scenes') or [{}])[0].get('scene_id')
+        features_key = (baseline_key(task['geojson'], t1_scene_id, EXPORT_DIMENSIONS, unet_inference.MODEL_PATH)
+                        if t1_scene_id else None)
         
-        # Determine the date for the new image and the baseline image
-        current_date = datetime.now()
+        # 2. Run change detection in parallel on the detector pool, within what is left of the
+        # budget; the wait for a detector worker and for the shared U-Net counts against it too
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"AOI did not finish within {timeout} seconds.")
+        output_dir = download_result.get('temp_dir', OUTPUT_DIR)
+        with stage_metrics.stage('detect'):
+            ndvi_summary, unet_result = run_detectors(t1_path, t2_path, threshold, output_dir=output_dir,
+                                                      timeout=min(DETECTOR_TIMEOUT_SECONDS, remaining),
+                                                      features_key=features_key, deadline=deadline)
+        # The backend serves (and renders deferred) PNGs by their path under temp_downloads
+        for field in ('change_overlay_png', 'change_only_png'):
+            if unet_result.get(field):
+                unet_result[field] = os.path.relpath(os.path.join(output_dir, unet_result[field]), OUTPUT_DIR)
         
-        # We need a longer date range for the new image to find a cloud-free image
-        # This is a crucial change to handle the download failure
-        # Let's search for an image in the last 7 days from today.
-        end_date = current_date.strftime('%Y-%m-%d')
-        start_date = (current_date - timedelta(days=7)).strftime('%Y-%m-%d')
-
-        # Use the last checked date for the baseline image
-        # If there's no last_checked_date, use a longer period, e.g., 30 days before the new image
-        if not last_checked_date_str:
-            baseline_start_date = (current_date - timedelta(days=37)).strftime('%Y-%m-%d')
-            baseline_end_date = (current_date - timedelta(days=30)).strftime('%Y-%m-%d')
+        # 3. Combine results and check against threshold
+        ndvi_change = ndvi_summary['percentage_change']
+        unet_change = unet_result['percentage_change']
+        combined_change = (ndvi_change + unet_change) / 2
+
+        if combined_change > (threshold * 100):
+            print(f"ALERT! Significant change detected for AOI {aoi_id}: {combined_change:.2f}% (Threshold: {threshold*100:.2f}%)")
+            if unet_result.get('change_overlay_png'):
+                print(f"AOI {aoi_id}: U-Net change maps: {unet_result['change_overlay_png']}, "
+                      f"{unet_result['change_only_png']}")
         else:
-            baseline_start_date = last_checked_date_str
-            baseline_end_date = last_checked_date_str
+            print(f"AOI {aoi_id}: No significant change detected. Combined change: {combined_change:.2f}%")
 
-        if not last_checked_date_str or (current_date > datetime.strptime(last_checked_date_str, '%Y-%m-%d') + timedelta(days=monitoring_interval)):
-            print(f"AOI {aoi_id}: New image is due. Searching for a cloud-free image...")
-            
-            try:
-                # 1. Download images for two dates with a flexible search range
-                download_result = run_python_script(GEE_DOWNLOAD_SCRIPT, [geojson_str, baseline_start_date, end_date])
+        # 4. Update the last checked date right away (a no-op if the task was stopped meanwhile)
+        get_task_store().update_task(aoi_id, last_checked_date=end_date)
+        return True
+    
+    except Exception as e:
+        # We specifically check for the download failure and skip this task for now.
+        # In either case the last_checked_date is not updated; the task is retried after RETRY_SECONDS.
+        if "Failed to download images" in str(e):
+            print(f"AOI {aoi_id}: Skipping monitoring for now. Could not find a cloud-free image in the recent date range.", file=sys.stderr)
+        else:
+            print(f"AOI {aoi_id}: Failed to process. Error: {e}", file=sys.stderr)
+        get_task_store().update_task(aoi_id, next_due_at=time.time() + RETRY_SECONDS)
+        return False
 
-                if download_result.get('status') != 'success':
-                    # This check is now redundant since the error is caught by the try/except block.
-                    # It's good practice to leave it, but the raised exception will handle the failure.
-                    raise Exception(f"Download failed: {download_result.get('message')}")
-                
-                t1_path = download_result['t1_path']
-                t2_path = download_result['t2_path']
-                
-                # 2. Run change detection scripts in parallel
-                ndvi_result = run_python_script(GEE_CHANGE_DETECTION_SCRIPT, [t1_path, t2_path, str(threshold)])
-                unet_result = run_python_script(UNET_INFERENCE_SCRIPT, [t1_path, t2_path])
-                
-                # 3. Combine results and check against threshold
-                ndvi_change = ndvi_result['summary']['percentage_change']
-                unet_change = unet_result['percentage_change']
-                combined_change = (ndvi_change + unet_change) / 2
-
-                if combined_change > (threshold * 100):
-                    print(f"ALERT! Significant change detected for AOI {aoi_id}: {combined_change:.2f}% (Threshold: {threshold*100:.2f}%)")
-                else:
-                    print(f"AOI {aoi_id}: No significant change detected. Combined change: {combined_change:.2f}%")
-
-                # 4. Update the last checked date
-                task['last_checked_date'] = end_date
-                updated_tasks.append(task)
-            
-            except Exception as e:
-                # This is the new, more robust error handling
-                # We specifically check for the download failure and skip this task for now
-                if "Failed to download images" in str(e):
-                    print(f"AOI {aoi_id}: Skipping monitoring for now. Could not find a cloud-free image in the recent date range.", file=sys.stderr)
-                    # Do not update the last_checked_date so it's retried on the next run
-                    updated_tasks.append(task)
-                else:
-                    # For all other errors, we still report them and add the task back to the list
-                    print(f"AOI {aoi_id}: Failed to process. Error: {e}", file=sys.stderr)
-                    updated_tasks.append(task)
-        
+class MonitoringScheduler:
+    """
+    Event-driven scheduler over the task store. `queue` is a min-heap of
+    (next_due_at, aoi_id); `due_at` holds the current due time of every queued AOI, so a
+    rescheduled or removed task just leaves a stale heap entry that is skipped when popped.
+    AOIs being processed are in `running` and are queued again once they finish.
+    """
+    def __init__(self, store, notify_address=NOTIFY_ADDRESS):
+        self.store = store
+        self.notify_address = notify_address
+        self.queue = []
+        self.due_at = {}
+        self.running = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def push(self, aoi_id, due_at):
+        with self.lock:
+            if aoi_id in self.running:
+                return  # Queued again from the store when it finishes
+            self.due_at[aoi_id] = due_at
+            heapq.heappush(self.queue, (due_at, aoi_id))
+        self.wakeup.set()
+
+    def resync(self):
+        """Rebuilds the queue from the store."""
+        schedule = self.store.schedule()
+        with self.lock:
+            self.due_at = {aoi_id: due_at for aoi_id, due_at in schedule if aoi_id not in self.running}
+            self.queue = [(due_at, aoi_id) for aoi_id, due_at in self.due_at.items()]
+            heapq.heapify(self.queue)
+        self.wakeup.set()
+        print(f"[{datetime.now().isoformat()}] {len(schedule)} monitoring tasks scheduled.")
+
+    def handle_change(self, change):
+        """Applies one notification sent by task_store.notify_scheduler."""
+        op = change.get('op')
+        if op == 'add':
+            task = self.store.get_task(change['aoi_id'])
+            if task is not None:
+                self.push(task['aoi_id'], task['next_due_at'])
+        elif op == 'remove':
+            with self.lock:
+                self.due_at.pop(change['aoi_id'], None)
+        elif op == 'clear':
+            with self.lock:
+                self.due_at.clear()
+                self.queue = []
+            cache = get_baseline_cache()
+            if cache is not None:
+                cache.clear()
         else:
-            updated_tasks.append(task)
+            self.resync()
 
-    save_monitoring_tasks(updated_tasks)
-    print(f"Finished checking monitoring tasks. Next check in {monitoring_interval} days.")
+    def listen(self, sock):
+        """Receives change notifications; runs on its own daemon thread."""
+        while True:
+            data, _ = sock.recvfrom(65536)
+            try:
+                self.handle_change(json.loads(data.decode('utf-8')))
+            except Exception as e:
+                print(f"Ignoring scheduler notification {data[:200]!r}: {e}", file=sys.stderr)
+
+    def pop_due(self, now):
+        """Takes every task due by `now` off the queue. Returns (due AOI ids, next deadline or None)."""
+        due_ids = []
+        with self.lock:
+            while self.queue and self.queue[0][0] <= now:
+                due_at, aoi_id = heapq.heappop(self.queue)
+                if self.due_at.get(aoi_id) != due_at:
+                    continue  # Stale entry of a rescheduled or removed task
+                del self.due_at[aoi_id]
+                self.running.add(aoi_id)
+                due_ids.append(aoi_id)
+            return due_ids, (self.queue[0][0] if self.queue else None)
+
+    def run_task(self, aoi_id):
+        """Processes one due AOI on the AOI pool and queues its next check."""
+        try:
+            task = self.store.get_task(aoi_id)
+            if task is not None:
+                process_aoi(task, datetime.now())
+        except Exception as e:
+            print(f"AOI {aoi_id}: Failed to process. Error: {e}", file=sys.stderr)
+        finally:
+            with self.lock:
+                self.running.discard(aoi_id)
+            task = self.store.get_task(aoi_id)
+            if task is not None:  # Not stopped in the meantime
+                self.push(aoi_id, max(task['next_due_at'], time.time() + RETRY_SECONDS))
+
+    def run(self):
+        """Sleeps until the next deadline or notification and dispatches due AOIs; never returns."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind(self.notify_address)
+        except OSError:
+            sock.close()
+            print(f"Another monitoring scheduler is already listening on {self.notify_address[0]}:"
+                  f"{self.notify_address[1]}; exiting.")
+            return
+        threading.Thread(target=self.listen, args=(sock,), name='notifications', daemon=True).start()
+
+        self.resync()
+        next_resync = time.monotonic() + RESYNC_SECONDS
+        while True:
+            # Cleared before looking at the queue, so a change arriving meanwhile cuts the wait short
+            self.wakeup.clear()
+            now = time.time()
+            due_ids, next_due_at = self.pop_due(now)
+            for aoi_id in due_ids:
+                print(f"[{datetime.now().isoformat()}] AOI {aoi_id} is due.")
+                aoi_pool.submit(self.run_task, aoi_id)
+
+            timeout = next_resync - time.monotonic()
+            if next_due_at is not None:
+                timeout = min(timeout, next_due_at - now)
+            self.wakeup.wait(max(timeout, 0))
+            if time.monotonic() >= next_resync:
+                self.resync()
+                next_resync = time.monotonic() + RESYNC_SECONDS
+
+def monitor_aois(current_date=None):
+    """
+    Checks every due AOI once and waits for them (--once).
+    It loads only the due AOIs from the task store and processes them on the AOI pool.
+    `current_date` (default: now) is the date the check runs at; load tests simulate cycles with it.
+    Returns the number of AOIs that were due.
+    """
+    print(f"[{datetime.now().isoformat()}] Checking for AOIs to monitor...")
+    current_date = current_date or datetime.now()
+    due_tasks = get_task_store().due_tasks(current_date.timestamp())
+    
+    if not due_tasks:
+        print("No monitoring tasks are due. Waiting for new tasks to be added.")
+        return 0 # Exit the function early
+
+    if aoi_pool is None:
+        start_worker_pools()
+
+    futures = [aoi_pool.submit(process_aoi, task, current_date) for task in due_tasks]
+    for future in as_completed(futures):
+        future.result()  # process_aoi reports its own failures
+
+    print(f"Finished checking monitoring tasks ({len(due_tasks)} AOIs were due).")
+    return len(due_tasks)
 
 if __name__ == "__main__":
-    print("Starting monitoring scheduler...")
-    schedule.every(5).minutes.do(monitor_aois)
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    parser = argparse.ArgumentParser(description="Event-driven change monitoring for the AOIs in the task store.")
+    parser.add_argument('--aoi-workers', type=int, default=AOI_WORKERS,
+                        help=f"AOIs downloaded and processed at the same time (default: {AOI_WORKERS}).")
+    parser.add_argument('--detector-workers', type=int, default=DETECTOR_WORKERS,
+                        help=f"Detector runs at the same time across all AOIs (default: {DETECTOR_WORKERS}).")
+    parser.add_argument('--once', action='store_true',
+                        help="Check the AOIs that are due right now and exit.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Keep the U-Net baseline encoder features and reuse them when a check selects "
+                             "the same baseline scene (about 250 MB per 1024x1024 baseline).")
+    parser.add_argument('--metrics-file', default=METRICS_FILE,
+                        help="Prometheus text file with per-stage metrics, e.g. in the node_exporter textfile "
+                             "collector directory ('' disables it).")
+    parser.add_argument('--visualizations', choices=change_visualization.VISUALIZATION_MODES, default=visualizations,
+                        help=f"When the U-Net PNGs are rendered (default: {visualizations}, on first download).")
+    args = parser.parse_args()
+
+    incremental = args.incremental
+    visualizations = args.visualizations
+    metrics_file = args.metrics_file
+
+    start_worker_pools(args.aoi_workers, args.detector_workers)
+    if args.once:
+        monitor_aois()
+    else:
+        print("Starting monitoring scheduler...")
+        MonitoringScheduler(get_task_store()).run()
 
 
 
@@ -0,0 +1,252 @@
+# processing/pair_analysis.py
+#
+# Runs every selected detector on one T1/T2 pair in a single process. Both GeoTIFFs
+# are opened once and each band is decoded once; NDVI, CVA and the U-Net then work
+# on views of the same in-memory arrays. Prints the combined summary the backend
+# used to assemble from three separate script runs:
+#
+#   python pair_analysis.py t1.tif t2.tif 0.2 --methods vegetation,structural,cva
+#
+# The continuous maps behind each summary are kept in change_map_cache.py, so running
+# the same pair again with another threshold or method mix skips decoding and inference.
+
+import os
+import sys
+import json
+import argparse
+import stage_metrics
+import rasterio
+import numpy as np
+
+import gee_change_detection
+import cva_change_detection
+import unet_inference
+import change_map_cache
+import change_visualization
+
+# Detection method names used by the backend controller
+METHODS = ('vegetation', 'structural', 'cva')
+
+# Model file behind each U-Net execution backend, part of the logit map cache key
+BACKEND_MODEL_PATHS = {
+    'torch': unet_inference.MODEL_PATH,
+    'torch-int8': unet_inference.QUANTIZED_MODEL_PATH,
+    'torchscript': unet_inference.TORCHSCRIPT_MODEL_PATH,
+    'onnxruntime': unet_inference.ONNX_MODEL_PATH
+}
+
+
+def read_pair(t1_path, t2_path):
+    """
+    Opens both rasters once and decodes every band a single time.
+    Returns:
+        tuple: ((bands, H, W) T1 array, (bands, H, W) T2 array, crs, transform) of T2.
+    """
+    if not os.path.exists(t1_path) or not os.path.exists(t2_path):
+        raise FileNotFoundError(f"One or both input images not found. "
+                                f"Please check the paths: '{t1_path}' and '{t2_path}'.")
+
+    with rasterio.open(t1_path) as src_t1, rasterio.open(t2_path) as src_t2:
+        if (src_t1.height, src_t1.width) != (src_t2.height, src_t2.width):
+            raise ValueError("Input images must have the same dimensions.")
+        if src_t1.count != src_t2.count:
+            raise ValueError(f"Input images have different band counts ({src_t1.count} and {src_t2.count}).")
+        return src_t1.read(), src_t2.read(), src_t2.crs, src_t2.transform
+
+
+def ndvi_difference_map(t1, t2):
+    """NDVI(t2) - NDVI(t1) from the B4/B8 views of the decoded pair."""
+    red, nir = gee_change_detection.RED_BAND - 1, gee_change_detection.NIR_BAND - 1
+    if t1.shape[0] <= max(red, nir):
+        raise ValueError(f"Expected B4 and B8 at bands {red + 1} and {nir + 1} ({t1.shape[0]} bands).")
+    return gee_change_detection.ndvi_difference(t1[red], t1[nir], t2[red], t2[nir])
+
+
+def summarize_ndvi(difference, threshold):
+    """NDVI gain/loss summary of a difference map for one threshold."""
+    gain_pixels, loss_pixels = gee_change_detection.count_ndvi_difference(difference, threshold)
+    height, width = difference.shape
+    return gee_change_detection.summarize_ndvi_change(gain_pixels, loss_pixels, width, height)
+
+
+def analyze_ndvi(t1, t2, threshold):
+    """NDVI gain/loss summary from the B4/B8 views of the decoded pair."""
+    return summarize_ndvi(ndvi_difference_map(t1, t2), threshold)
+
+
+def cva_magnitude_map(t1, t2, bands=gee_change_detection.CVA_BANDS):
+    """CVA magnitude over the selected bands of the decoded pair."""
+    missing = [band for band in bands if not 1 <= band <= t1.shape[0]]
+    if missing:
+        raise ValueError(f"Band(s) {missing} not found ({t1.shape[0]} bands).")
+    return cva_change_detection.cva_magnitude([t1[band - 1] for band in bands],
+                                              [t2[band - 1] for band in bands])
+
+
+def summarize_cva(magnitude, threshold, bands=gee_change_detection.CVA_BANDS):
+    """CVA summary of a magnitude map for one threshold."""
+    height, width = magnitude.shape
+    return cva_change_detection.summarize_cva_change(int(np.count_nonzero(magnitude > threshold)),
+                                                     bands, width, height)
+
+
+def analyze_cva(t1, t2, threshold, bands=gee_change_detection.CVA_BANDS):
+    """CVA summary from views of the selected bands of the decoded pair."""
+    return summarize_cva(cva_magnitude_map(t1, t2, bands), threshold, bands)
+
+
+def unet_logit_map(model, t1, t2, tile_size=None, tile_overlap=unet_inference.DEFAULT_TILE_OVERLAP,
+                   tile_batch_size=None):
+    """U-Net change logits of the decoded pair; the network reads its tiles straight from the arrays."""
+    height, width = t1.shape[1:]
+    return unet_inference.predict_change_logits(model, model.device, t1, t2, height, width,
+                                                tile_size=tile_size, overlap=tile_overlap,
+                                                batch_size=tile_batch_size)
+
+
+def summarize_unet(logits, t2_path, crs, transform, output_dir=unet_inference.OUTPUT_DIR, t2_rgb=None,
+                   visualizations='sync'):
+    """Thresholds U-Net logits, writes the mask and PNGs, and returns the U-Net summary."""
+    os.makedirs(output_dir, exist_ok=True)
+    response = unet_inference.save_change_outputs(logits, t2_path, crs, transform, output_dir, t2_rgb=t2_rgb,
+                                                  visualizations=visualizations)
+    return {key: response[key] for key in ('message', 'percentage_change', 'total_change_pixels',
+                                           'change_mask_path', 'change_overlay_png', 'change_only_png')}
+
+
+def analyze_unet(model, t1, t2, t2_path, crs, transform, output_dir=unet_inference.OUTPUT_DIR, tile_size=None,
+                 tile_overlap=unet_inference.DEFAULT_TILE_OVERLAP, tile_batch_size=None):
+    """U-Net summary for the decoded pair; the network reads its tiles straight from the arrays."""
+    logits = unet_logit_map(model, t1, t2, tile_size, tile_overlap, tile_batch_size)
+    return summarize_unet(logits, t2_path, crs, transform, output_dir, t2_rgb=t2[:3])
+
+
+def combine_summaries(response):
+    """Mean percentage change over the detectors that ran, as used for alerting."""
+    changes = [response[key]['percentage_change'] for key in ('ndvi_summary', 'unet_summary', 'cva_summary')
+               if response.get(key)]
+    return sum(changes) / len(changes) if changes else 0.0
+
+
+def map_cache_key(method, hashes, backend, unet_options):
+    """Change map cache key of one method's map; everything but the threshold goes in."""
+    if method == 'vegetation':
+        return change_map_cache.map_key('ndvi_difference', hashes,
+                                        bands=[gee_change_detection.RED_BAND, gee_change_detection.NIR_BAND])
+    if method == 'cva':
+        return change_map_cache.map_key('cva_magnitude', hashes, bands=gee_change_detection.CVA_BANDS)
+    return change_map_cache.map_key('unet_logits', hashes, backend=backend,
+                                    model=change_map_cache.checkpoint_fingerprint(BACKEND_MODEL_PATHS.get(backend)),
+                                    tile_size=unet_options.get('tile_size'),
+                                    tile_overlap=unet_options.get('tile_overlap', unet_inference.DEFAULT_TILE_OVERLAP))
+
+
+def analyze_pair(t1_path, t2_path, threshold, methods=METHODS, model=None, output_dir=unet_inference.OUTPUT_DIR,
+                 backend='torch', map_cache=None, visualizations='sync', **unet_options):
+    """
+    Runs the selected detectors on one pair from a single decode of each raster and
+    returns the combined JSON-serializable response. `model` is an already loaded
+    execution backend for the U-Net; the `backend` one is loaded on demand when omitted.
+    With a ChangeMapCache the NDVI difference, CVA magnitude and U-Net logit maps are
+    looked up by the hashes of both rasters first; when all are cached, the pair is
+    only thresholded and the rasters are not decoded. `visualizations` selects when the
+    U-Net PNGs are rendered (see unet_inference.save_change_outputs).
+    """
+    unknown = [method for method in methods if method not in METHODS]
+    if unknown:
+        raise ValueError(f"Unknown detection method(s) {unknown}. Choose from: {', '.join(METHODS)}.")
+    if model is not None:
+        backend = model.name
+
+    maps, keys = {}, {}
+    if map_cache is not None:
+        with stage_metrics.stage('map_cache_lookup'):
+            hashes = change_map_cache.pair_hashes(t1_path, t2_path)
+            for method in methods:
+                keys[method] = map_cache_key(method, hashes, backend, unet_options)
+                maps[method] = map_cache.load(keys[method])
+
+    t2 = None
+    missing = [method for method in METHODS if method in methods and maps.get(method) is None]
+    if missing:
+        with stage_metrics.stage('decode'):
+            t1, t2, crs, transform = read_pair(t1_path, t2_path)
+        for method in missing:
+            if method == 'vegetation':
+                with stage_metrics.stage('ndvi'):
+                    maps[method] = ndvi_difference_map(t1, t2)
+            elif method == 'cva':
+                with stage_metrics.stage('cva'):
+                    maps[method] = cva_magnitude_map(t1, t2)
+            else:
+                if model is None:
+                    model = unet_inference.load_inference_model(backend)
+                maps[method] = unet_logit_map(model, t1, t2, **unet_options)
+            if map_cache is not None:
+                with stage_metrics.stage('map_cache_store'):
+                    map_cache.save(keys[method], maps[method], {'method': method})
+    elif 'structural' in methods:
+        # The U-Net outputs are georeferenced like T2
+        with rasterio.open(t2_path) as src_t2:
+            crs, transform = src_t2.crs, src_t2.transform
+
+    response = {
+        "status": "success",
+        "message": "Change detection tasks completed.",
+        "ndvi_summary": None,
+        "unet_summary": None,
+        "cva_summary": None
+    }
+    if 'vegetation' in methods:
+        response['ndvi_summary'] = summarize_ndvi(maps['vegetation'], threshold)
+    if 'cva' in methods:
+        response['cva_summary'] = summarize_cva(maps['cva'], threshold)
+    if 'structural' in methods:
+        response['unet_summary'] = summarize_unet(maps['structural'], t2_path, crs, transform, output_dir,
+                                                  t2_rgb=t2[:3] if t2 is not None else None,
+                                                  visualizations=visualizations)
+
+    response['combined_change'] = combine_summaries(response)
+    if map_cache is not None:
+        response['map_cache'] = {"hits": map_cache.session_hits, "misses": map_cache.session_misses}
+    return response
+
+
+def main(t1_path, t2_path, threshold, methods=METHODS, backend='torch', use_map_cache=True, visualizations='sync',
+         **unet_options):
+    metrics = stage_metrics.StageMetrics()
+    metrics.record_import()
+    try:
+        # The model is only loaded when a U-Net map is not cached
+        map_cache = change_map_cache.ChangeMapCache() if use_map_cache else None
+        with stage_metrics.collect(metrics):
+            response = analyze_pair(t1_path, t2_path, threshold, methods, backend=backend, map_cache=map_cache,
+                                    visualizations=visualizations, **unet_options)
+        response['metrics'] = metrics.as_dict()
+        print(json.dumps(response))
+    except Exception as e:
+        response = {"status": "error", "message": f"Processing Error: {e}", "metrics": metrics.as_dict()}
+        print(json.dumps(response), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run NDVI, CVA and U-Net change detection on one decoded pair.")
+    parser.add_argument('t1_path')
+    parser.add_argument('t2_path')
+    parser.add_argument('threshold', type=float)
+    parser.add_argument('--methods', default=','.join(METHODS),
+                        help=f"Comma-separated detection methods (default: {','.join(METHODS)}).")
+    parser.add_argument('--backend', choices=unet_inference.BACKENDS, default='torch',
+                        help="Runtime for the U-Net; torchscript/onnxruntime need unet_export.py first.")
+    parser.add_argument('--tile-size', type=int, default=None,
+                        help="Run sliding-window U-Net inference with this tile size.")
+    parser.add_argument('--no-map-cache', dest='use_map_cache', action='store_false',
+                        help="Recompute every change map instead of reusing cached ones.")
+    parser.add_argument('--visualizations', choices=change_visualization.VISUALIZATION_MODES, default='sync',
+                        help="Render the U-Net PNGs now, on a background thread, or on first download (deferred).")
+    args = parser.parse_args()
+
+    main(args.t1_path, args.t2_path, args.threshold, [method for method in args.methods.split(',') if method],
+         backend=args.backend, use_map_cache=args.use_map_cache, visualizations=args.visualizations,
+         tile_size=args.tile_size)
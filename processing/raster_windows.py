@@ -0,0 +1,18 @@
+# processing/raster_windows.py
+#
+# Processing windows shared by the streaming detectors (gee_change_detection.py and
+# cva_change_detection.py): full-width strips aligned to the block rows of a dataset.
+
+from rasterio.windows import Window
+
+# Target size of one processing window. Windows are whole rows of blocks, so scenes
+# are streamed in strips of roughly this many pixels per band.
+WINDOW_TARGET_PIXELS = 1 << 20
+
+
+def strip_windows(src):
+    """Splits a dataset into full-width strips aligned to its block rows."""
+    block_height = src.block_shapes[0][0]
+    rows_per_strip = max(block_height, (WINDOW_TARGET_PIXELS // max(src.width, 1)) // block_height * block_height)
+    return [Window(0, row, src.width, min(rows_per_strip, src.height - row))
+            for row in range(0, src.height, rows_per_strip)]
@@ -0,0 +1,291 @@
+# processing/siamese_unet.py
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+# ==============================================================================
+# 1. MODEL ARCHITECTURE
+# ==============================================================================
+
+class ConvBlock(nn.Module):
+    """A simple convolutional block with Conv2d, BatchNorm2d, and ReLU activation."""
+    def __init__(self, in_channels, out_channels):
+        super(ConvBlock, self).__init__()
+        self.conv = nn.Sequential(
+            nn.Conv2d(in_channels, out_channels, kernel_size=3, padding=1),
+            nn.BatchNorm2d(out_channels),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(out_channels, out_channels, kernel_size=3, padding=1),
+            nn.BatchNorm2d(out_channels),
+            nn.ReLU(inplace=True)
+        )
+    def forward(self, x):
+        return self.conv(x)
+
+class SiameseUNet(nn.Module):
+    """A Siamese U-Net for change detection."""
+    def __init__(self, in_channels=3, out_channels=1):
+        super(SiameseUNet, self).__init__()
+        # Encoder for Image 1
+        self.enc1_conv1 = ConvBlock(in_channels, 64)
+        self.enc1_maxpool1 = nn.MaxPool2d(kernel_size=2, stride=2)
+        self.enc1_conv2 = ConvBlock(64, 128)
+        self.enc1_maxpool2 = nn.MaxPool2d(kernel_size=2, stride=2)
+        self.enc1_conv3 = ConvBlock(128, 256)
+        self.enc1_maxpool3 = nn.MaxPool2d(kernel_size=2, stride=2)
+        self.enc1_conv4 = ConvBlock(256, 512)
+        self.enc1_maxpool4 = nn.MaxPool2d(kernel_size=2, stride=2)
+
+        # Encoder for Image 2
+        self.enc2_conv1 = ConvBlock(in_channels, 64)
+        self.enc2_maxpool1 = nn.MaxPool2d(kernel_size=2, stride=2)
+        self.enc2_conv2 = ConvBlock(64, 128)
+        self.enc2_maxpool2 = nn.MaxPool2d(kernel_size=2, stride=2)
+        self.enc2_conv3 = ConvBlock(128, 256)
+        self.enc2_maxpool3 = nn.MaxPool2d(kernel_size=2, stride=2)
+        self.enc2_conv4 = ConvBlock(256, 512)
+        self.enc2_maxpool4 = nn.MaxPool2d(kernel_size=2, stride=2)
+
+        self.bottleneck = ConvBlock(512 * 2, 1024)
+
+        # Decoder
+        self.upconv4 = nn.ConvTranspose2d(1024, 512, kernel_size=2, stride=2)
+        self.dec_conv4 = ConvBlock(512 + 512 + 512, 512)
+
+        self.upconv3 = nn.ConvTranspose2d(512, 256, kernel_size=2, stride=2)
+        self.dec_conv3 = ConvBlock(256 + 256 + 256, 256)
+
+        self.upconv2 = nn.ConvTranspose2d(256, 128, kernel_size=2, stride=2)
+        self.dec_conv2 = ConvBlock(128 + 128 + 128, 128)
+
+        self.upconv1 = nn.ConvTranspose2d(128, 64, kernel_size=2, stride=2)
+        self.dec_conv1 = ConvBlock(64 + 64 + 64, 64)
+
+        self.final_conv = nn.Conv2d(64, out_channels, kernel_size=1)
+
+    def encode_t1(self, x1):
+        """Skip features [s1_1, s1_2, s1_3, s1_4] of the encoder for image 1 (the baseline)."""
+        s1_1 = self.enc1_conv1(x1)
+        e1_1 = self.enc1_maxpool1(s1_1)
+        s1_2 = self.enc1_conv2(e1_1)
+        e1_2 = self.enc1_maxpool2(s1_2)
+        s1_3 = self.enc1_conv3(e1_2)
+        e1_3 = self.enc1_maxpool3(s1_3)
+        s1_4 = self.enc1_conv4(e1_3)
+        return [s1_1, s1_2, s1_3, s1_4]
+
+    def encode_t2(self, x2):
+        """Skip features [s2_1, s2_2, s2_3, s2_4] of the encoder for image 2."""
+        s2_1 = self.enc2_conv1(x2)
+        e2_1 = self.enc2_maxpool1(s2_1)
+        s2_2 = self.enc2_conv2(e2_1)
+        e2_2 = self.enc2_maxpool2(s2_2)
+        s2_3 = self.enc2_conv3(e2_2)
+        e2_3 = self.enc2_maxpool3(s2_3)
+        s2_4 = self.enc2_conv4(e2_3)
+        return [s2_1, s2_2, s2_3, s2_4]
+
+    def decode(self, t1_skips, t2_skips):
+        """Bottleneck and decoder over the skip features of both encoders."""
+        s1_1, s1_2, s1_3, s1_4 = t1_skips
+        s2_1, s2_2, s2_3, s2_4 = t2_skips
+        e1_4 = self.enc1_maxpool4(s1_4)
+        e2_4 = self.enc2_maxpool4(s2_4)
+
+        # Bottleneck (Feature Fusion)
+        fused_bottleneck = self.bottleneck(torch.cat([e1_4, e2_4], dim=1))
+
+        # Decoder with fused skip connections
+        d4 = self.upconv4(fused_bottleneck)
+        d4 = torch.cat([d4, s1_4, s2_4], dim=1)
+        d4 = self.dec_conv4(d4)
+
+        d3 = self.upconv3(d4)
+        d3 = torch.cat([d3, s1_3, s2_3], dim=1)
+        d3 = self.dec_conv3(d3)
+
+        d2 = self.upconv2(d3)
+        d2 = torch.cat([d2, s1_2, s2_2], dim=1)
+        d2 = self.dec_conv2(d2)
+
+        d1 = self.upconv1(d2)
+        d1 = torch.cat([d1, s1_1, s2_1], dim=1)
+        d1 = self.dec_conv1(d1)
+
+        # Final output
+        output = self.final_conv(d1)
+        return output
+
+    def forward(self, x1, x2):
+        return self.decode(self.encode_t1(x1), self.encode_t2(x2))
+
+    def forward_with_baseline(self, t1_skips, x2):
+        """forward() with the image 1 features from encode_t1 given; only encoder 2 and the decoder run."""
+        return self.decode(t1_skips, self.encode_t2(x2))
+
+
+# ==============================================================================
+# 2. INFERENCE-OPTIMIZED MODEL
+# ==============================================================================
+
+# Maximum absolute logit difference accepted between a fused model and its source.
+FUSION_TOLERANCE = 1e-3
+
+
+def fold_conv_bn(conv, bn):
+    """Returns a Conv2d whose weights and bias absorb the BatchNorm2d running statistics."""
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+
+    folded = nn.Conv2d(conv.in_channels, conv.out_channels, conv.kernel_size,
+                       stride=conv.stride, padding=conv.padding, groups=conv.groups, bias=True)
+    folded.weight.data.copy_(conv.weight * scale.reshape(-1, 1, 1, 1))
+    folded.bias.data.copy_((bias - bn.running_mean) * scale + bn.bias)
+    return folded
+
+
+def fold_conv_block(block):
+    """Folds both Conv2d -> BatchNorm2d pairs of a ConvBlock, leaving Conv2d -> ReLU twice."""
+    conv1, bn1, _, conv2, bn2, _ = block.conv
+    return nn.Sequential(
+        fold_conv_bn(conv1, bn1), nn.ReLU(inplace=True),
+        fold_conv_bn(conv2, bn2), nn.ReLU(inplace=True)
+    )
+
+
+def stack_conv_pair(conv_a, conv_b):
+    """
+    Combines two same-shaped convolutions into one grouped convolution (groups=2) that
+    reads [input_a, input_b] stacked along channels and writes [output_a, output_b].
+    """
+    stacked = nn.Conv2d(conv_a.in_channels * 2, conv_a.out_channels * 2, conv_a.kernel_size,
+                        stride=conv_a.stride, padding=conv_a.padding, groups=2, bias=True)
+    stacked.weight.data.copy_(torch.cat([conv_a.weight, conv_b.weight], dim=0))
+    stacked.bias.data.copy_(torch.cat([conv_a.bias, conv_b.bias], dim=0))
+    return stacked
+
+
+def run_stacked_half(block, x, half):
+    """
+    Runs one branch of a stack_encoder_blocks() block on its own input: half 0 (image 1)
+    or half 1 (image 2) of the filters of each grouped convolution.
+    """
+    for conv in (block[0], block[2]):
+        out_channels = conv.out_channels // 2
+        weight = conv.weight[half * out_channels:(half + 1) * out_channels]
+        bias = conv.bias[half * out_channels:(half + 1) * out_channels]
+        x = F.relu(F.conv2d(x, weight, bias, stride=conv.stride, padding=conv.padding))
+    return x
+
+
+def stack_encoder_blocks(block_a, block_b):
+    """Folds two ConvBlocks and runs them side by side as grouped convolutions."""
+    folded_a, folded_b = fold_conv_block(block_a), fold_conv_block(block_b)
+    return nn.Sequential(
+        stack_conv_pair(folded_a[0], folded_b[0]), nn.ReLU(inplace=True),
+        stack_conv_pair(folded_a[2], folded_b[2]), nn.ReLU(inplace=True)
+    )
+
+
+class FusedSiameseUNet(nn.Module):
+    """
+    Inference-only SiameseUNet built from a trained one by fuse_for_inference().
+    BatchNorm is folded into the convolutions and the two encoders run as a single
+    stacked encoder: T1 and T2 are concatenated along channels and every encoder
+    convolution is a groups=2 convolution. The stacked skip features are already laid
+    out as [encoder 1, encoder 2], which is exactly what the bottleneck and the decoder
+    concatenate in SiameseUNet.forward.
+    """
+    def __init__(self, model):
+        super(FusedSiameseUNet, self).__init__()
+        self.enc_conv1 = stack_encoder_blocks(model.enc1_conv1, model.enc2_conv1)
+        self.enc_conv2 = stack_encoder_blocks(model.enc1_conv2, model.enc2_conv2)
+        self.enc_conv3 = stack_encoder_blocks(model.enc1_conv3, model.enc2_conv3)
+        self.enc_conv4 = stack_encoder_blocks(model.enc1_conv4, model.enc2_conv4)
+        self.maxpool = nn.MaxPool2d(kernel_size=2, stride=2)
+
+        self.bottleneck = fold_conv_block(model.bottleneck)
+
+        self.upconv4 = model.upconv4
+        self.dec_conv4 = fold_conv_block(model.dec_conv4)
+        self.upconv3 = model.upconv3
+        self.dec_conv3 = fold_conv_block(model.dec_conv3)
+        self.upconv2 = model.upconv2
+        self.dec_conv2 = fold_conv_block(model.dec_conv2)
+        self.upconv1 = model.upconv1
+        self.dec_conv1 = fold_conv_block(model.dec_conv1)
+
+        self.final_conv = model.final_conv
+
+    def encode_half(self, x, half):
+        """Skip features of one branch of the stacked encoder (half 0: image 1, half 1: image 2)."""
+        skips = []
+        for level, block in enumerate((self.enc_conv1, self.enc_conv2, self.enc_conv3, self.enc_conv4)):
+            if level:
+                x = self.maxpool(x)
+            x = run_stacked_half(block, x, half)
+            skips.append(x)
+        return skips
+
+    def encode_t1(self, x1):
+        return self.encode_half(x1, 0)
+
+    def forward_with_baseline(self, t1_skips, x2):
+        """forward() with the image 1 features from encode_t1 given; only encoder 2 and the decoder run."""
+        t2_skips = self.encode_half(x2, 1)
+        return self.decode(*[torch.cat([s1, s2], dim=1) for s1, s2 in zip(t1_skips, t2_skips)])
+
+    def forward(self, x1, x2):
+        # Stacked encoder: channels [0, C) belong to image 1, [C, 2C) to image 2
+        s_1 = self.enc_conv1(torch.cat([x1, x2], dim=1))
+        s_2 = self.enc_conv2(self.maxpool(s_1))
+        s_3 = self.enc_conv3(self.maxpool(s_2))
+        s_4 = self.enc_conv4(self.maxpool(s_3))
+        return self.decode(s_1, s_2, s_3, s_4)
+
+    def decode(self, s_1, s_2, s_3, s_4):
+        """Bottleneck and decoder over the stacked [image 1, image 2] skip features."""
+        fused_bottleneck = self.bottleneck(self.maxpool(s_4))
+
+        d4 = self.dec_conv4(torch.cat([self.upconv4(fused_bottleneck), s_4], dim=1))
+        d3 = self.dec_conv3(torch.cat([self.upconv3(d4), s_3], dim=1))
+        d2 = self.dec_conv2(torch.cat([self.upconv2(d3), s_2], dim=1))
+        d1 = self.dec_conv1(torch.cat([self.upconv1(d2), s_1], dim=1))
+
+        return self.final_conv(d1)
+
+
+def verify_fused_model(model, fused, size=64, tolerance=FUSION_TOLERANCE):
+    """
+    Runs both models on the same random pair and returns the maximum absolute logit
+    difference. Raises ValueError when it exceeds the tolerance.
+    """
+    device = next(model.parameters()).device
+    generator = torch.Generator().manual_seed(0)
+    x1 = (torch.rand(1, 3, size, size, generator=generator) * 2 - 1).to(device)
+    x2 = (torch.rand(1, 3, size, size, generator=generator) * 2 - 1).to(device)
+    with torch.no_grad():
+        difference = (model(x1, x2) - fused(x1, x2)).abs().max().item()
+    if difference > tolerance:
+        raise ValueError(f"Fused model deviates from the checkpoint by {difference:.2e} "
+                         f"(tolerance {tolerance:.0e}).")
+    return difference
+
+
+def fuse_for_inference(model, verify=False):
+    """
+    One-time "compile for inference" transform: folds BatchNorm into the convolutions
+    and stacks the two encoders into one. The source model must be in eval mode, since
+    the running statistics are baked into the weights. The equivalence within
+    FUSION_TOLERANCE is covered by tests/test_siamese_unet.py; verify=True additionally
+    checks the result against the source with verify_fused_model before returning it.
+    """
+    if model.training:
+        raise ValueError("fuse_for_inference requires a model in eval mode.")
+    with torch.no_grad():
+        fused = FusedSiameseUNet(model)
+    fused.eval()
+    if verify:
+        verify_fused_model(model, fused)
+    return fused
@@ -0,0 +1,267 @@
+# processing/stage_metrics.py
+#
+# Lightweight per-stage instrumentation for the processing scripts. A StageMetrics
+# records wall time, CPU time, peak RSS and bytes read/written for each named stage
+# (import, model_load, decode, forward, png_encode, mask_write, export_wait, ...) and
+# becomes the "metrics" block of a script's JSON response:
+#
+#     with stage_metrics.collect() as metrics:
+#         with stage_metrics.stage('decode'):
+#             ...
+#         response['metrics'] = metrics.as_dict()
+#
+# stage() records into the collector of the current context and is a no-op outside
+# collect(), so library code is instrumented unconditionally. CPU time, peak RSS and
+# I/O are process-wide counters: stages that run at the same time in one process (the
+# scheduler's AOI threads) include each other's work. I/O counts every read/write
+# system call of the process (/proc/self/io rchar/wchar), so network downloads count
+# as reads; it is None where /proc is not available.
+#
+# The scheduler folds the metrics of every AOI into StageHistograms and writes them
+# as a Prometheus text file (node_exporter textfile collector format).
+
+import os
+import sys
+import time
+import tempfile
+import threading
+import contextvars
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Upper bounds in seconds of the stage duration histogram buckets
+WALL_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# Observations per (script, stage) kept for the recent quantiles
+ROLLING_WINDOW = 500
+QUANTILES = (0.5, 0.9, 0.99)
+
+Snapshot = namedtuple('Snapshot', ['wall', 'cpu', 'peak_rss', 'read_bytes', 'written_bytes'])
+
+# The StageMetrics that stage() records into; set by collect()
+current = contextvars.ContextVar('stage_metrics', default=None)
+
+
+def peak_rss_bytes():
+    """High-water mark of this process's resident set size, or None when it is not reported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def io_counters():
+    """(bytes read, bytes written) by this process so far, or (None, None) without /proc/self/io."""
+    try:
+        with open('/proc/self/io', 'rb') as f:
+            fields = dict(line.split(b':', 1) for line in f.read().splitlines() if b':' in line)
+        return int(fields[b'rchar']), int(fields[b'wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def snapshot():
+    read_bytes, written_bytes = io_counters()
+    return Snapshot(time.perf_counter(), time.process_time(), peak_rss_bytes(), read_bytes, written_bytes)
+
+
+# Taken when the module is first imported; scripts import it before numpy, rasterio and
+# torch, so the 'import' stage covers the heavy imports.
+IMPORT_SNAPSHOT = snapshot()
+
+
+def delta(end, start):
+    return None if end is None or start is None else end - start
+
+
+class StageMetrics:
+    """Per-stage totals of one run. Repeated stages (e.g. 'forward' per batch) accumulate."""
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.started = snapshot()
+
+    def add(self, name, start, end):
+        with self.lock:
+            entry = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_bytes": None,
+                                                  "read_bytes": 0, "written_bytes": 0})
+            entry["calls"] += 1
+            entry["wall_s"] += end.wall - start.wall
+            entry["cpu_s"] += end.cpu - start.cpu
+            if end.peak_rss is not None:
+                entry["peak_rss_bytes"] = max(entry["peak_rss_bytes"] or 0, end.peak_rss)
+            for key in ("read_bytes", "written_bytes"):
+                value = delta(getattr(end, key), getattr(start, key))
+                entry[key] = None if value is None or entry[key] is None else entry[key] + value
+
+    def record_import(self):
+        """
+        Adds the 'import' stage: from the first import of this module until now. Scripts
+        import stage_metrics before numpy and rasterio, so the stage covers those imports.
+        """
+        self.add('import', IMPORT_SNAPSHOT, snapshot())
+
+    def as_dict(self):
+        """JSON-serializable metrics block: every stage plus totals since the collector was created."""
+        end = snapshot()
+        with self.lock:
+            stages = {name: dict(entry, wall_s=round(entry["wall_s"], 4), cpu_s=round(entry["cpu_s"], 4))
+                      for name, entry in self.stages.items()}
+        return {
+            "stages": stages,
+            "wall_s": round(end.wall - self.started.wall, 4),
+            "cpu_s": round(end.cpu - self.started.cpu, 4),
+            "peak_rss_bytes": end.peak_rss,
+            "read_bytes": delta(end.read_bytes, self.started.read_bytes),
+            "written_bytes": delta(end.written_bytes, self.started.written_bytes)
+        }
+
+
+@contextmanager
+def collect(metrics=None):
+    """Makes `metrics` (a new StageMetrics by default) the collector of the current context."""
+    metrics = metrics if metrics is not None else StageMetrics()
+    token = current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Records the enclosed block as stage `name` of the current collector, if any."""
+    metrics = current.get()
+    if metrics is None:
+        yield
+        return
+    start = snapshot()
+    try:
+        yield
+    finally:
+        metrics.add(name, start, snapshot())
+
+
+def propagate(fn):
+    """
+    Wraps fn so it records into the current collector when run on another thread
+    (thread pools do not inherit context variables).
+    """
+    metrics = current.get()
+    if metrics is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with collect(metrics):
+            return fn(*args, **kwargs)
+    return run
+
+
+def quantile(sorted_values, q):
+    """Nearest-rank quantile of an ascending list."""
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))]
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class StageHistograms:
+    """
+    Aggregates metrics blocks by (script, stage): cumulative wall time histograms and
+    CPU/I/O counters since start, plus wall time quantiles and peak RSS over the last
+    `window` observations. Thread-safe.
+    """
+    def __init__(self, window=ROLLING_WINDOW, buckets=WALL_BUCKETS):
+        self.window = window
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, script, metrics):
+        """Adds every stage of a metrics block (as returned by StageMetrics.as_dict) to the histograms."""
+        if not metrics:
+            return
+        with self.lock:
+            for name, entry in metrics.get("stages", {}).items():
+                series = self.series.get((script, name))
+                if series is None:
+                    series = self.series[(script, name)] = {
+                        "bucket_counts": [0] * len(self.buckets), "count": 0, "wall_sum": 0.0, "cpu_sum": 0.0,
+                        "read_bytes": 0, "written_bytes": 0, "recent": deque(maxlen=self.window)
+                    }
+                wall = entry["wall_s"]
+                for index, bound in enumerate(self.buckets):
+                    if wall <= bound:
+                        series["bucket_counts"][index] += 1
+                series["count"] += 1
+                series["wall_sum"] += wall
+                series["cpu_sum"] += entry["cpu_s"]
+                series["read_bytes"] += entry.get("read_bytes") or 0
+                series["written_bytes"] += entry.get("written_bytes") or 0
+                series["recent"].append((wall, entry.get("peak_rss_bytes")))
+
+    def to_prometheus(self):
+        """The histograms in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            items = sorted(self.series.items())
+
+            lines += ['# HELP processing_stage_wall_seconds Wall time of processing stages.',
+                      '# TYPE processing_stage_wall_seconds histogram']
+            for (script, name), series in items:
+                labels = f'script="{escape_label(script)}",stage="{escape_label(name)}"'
+                for bound, count in zip(self.buckets, series["bucket_counts"]):
+                    lines.append(f'processing_stage_wall_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'processing_stage_wall_seconds_bucket{{{labels},le="+Inf"}} {series["count"]}')
+                lines.append(f'processing_stage_wall_seconds_sum{{{labels}}} {series["wall_sum"]:.6f}')
+                lines.append(f'processing_stage_wall_seconds_count{{{labels}}} {series["count"]}')
+
+            lines += [f'# HELP processing_stage_recent_wall_seconds Wall time quantiles of the last '
+                      f'{self.window} runs of each stage.',
+                      '# TYPE processing_stage_recent_wall_seconds gauge']
+            for (script, name), series in items:
+                labels = f'script="{escape_label(script)}",stage="{escape_label(name)}"'
+                walls = sorted(wall for wall, _ in series["recent"])
+                for q in QUANTILES:
+                    lines.append(f'processing_stage_recent_wall_seconds{{{labels},quantile="{q}"}} '
+                                 f'{quantile(walls, q):.6f}')
+
+            counters = (('cpu_seconds_total', 'cpu_sum', 'CPU time of the process during each stage.'),
+                        ('read_bytes_total', 'read_bytes', 'Bytes read by the process during each stage.'),
+                        ('written_bytes_total', 'written_bytes', 'Bytes written by the process during each stage.'))
+            for metric, key, help_text in counters:
+                lines += [f'# HELP processing_stage_{metric} {help_text}',
+                          f'# TYPE processing_stage_{metric} counter']
+                for (script, name), series in items:
+                    labels = f'script="{escape_label(script)}",stage="{escape_label(name)}"'
+                    value = round(series[key], 6) if isinstance(series[key], float) else series[key]
+                    lines.append(f'processing_stage_{metric}{{{labels}}} {value}')
+
+            lines += [f'# HELP processing_stage_recent_peak_rss_bytes Highest peak RSS of the process at the end '
+                      f'of the last {self.window} runs of each stage.',
+                      '# TYPE processing_stage_recent_peak_rss_bytes gauge']
+            for (script, name), series in items:
+                peaks = [peak for _, peak in series["recent"] if peak is not None]
+                if peaks:
+                    labels = f'script="{escape_label(script)}",stage="{escape_label(name)}"'
+                    lines.append(f'processing_stage_recent_peak_rss_bytes{{{labels}}} {max(peaks)}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Writes the text file atomically, so a collector never reads a partial file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.prom.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.to_prometheus())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
@@ -0,0 +1,125 @@
+# processing/startup_check.py
+#
+# Startup checks of the command-line entry points the backend spawns: each case runs
+# a script in a fresh interpreter on a path that never needs the heavy libraries
+# (argument errors, --help, jobs forwarded to an inference server) and records its
+# wall time and the HEAVY_MODULES it imported. Run through `benchmark.py startup` and
+# tests/test_startup.py; this module itself only imports the standard library.
+
+import os
+import sys
+import json
+import time
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Argument errors, --help and jobs forwarded to an inference server must finish
+# within this budget (best of STARTUP_REPEATS fresh interpreters), without importing any
+# of HEAVY_MODULES. Measured at 0.1-0.15 s on a single-core VM.
+STARTUP_BUDGET_SECONDS = 0.5
+STARTUP_REPEATS = 5
+HEAVY_MODULES = ('numpy', 'rasterio', 'PIL', 'matplotlib', 'torch', 'torchvision', 'onnxruntime', 'ee',
+                 'googleapiclient', 'google.oauth2', 'google_auth_oauthlib')
+# Runs a script as __main__ and writes the HEAVY_MODULES it loaded on the last line of stderr
+STARTUP_PROBE = """
+import os, sys, json, runpy
+heavy, script = json.loads(sys.argv[1]), sys.argv[2]
+sys.argv = sys.argv[2:]
+sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+try:
+    runpy.run_path(script, run_name='__main__')
+finally:
+    sys.stderr.write('\\n' + json.dumps([name for name in heavy if name in sys.modules]) + '\\n')
+"""
+# What the stand-in inference server answers to every job
+CANNED_INFERENCE_RESPONSE = {
+    "status": "success",
+    "percentage_change": 0.0,
+    "total_change_pixels": 0,
+    "change_mask_path": "unet_change_mask.tif",
+    "change_overlay_png": "unet_change_overlay.png",
+    "change_only_png": "unet_change_only.png"
+}
+
+
+class CannedInferenceHandler(BaseHTTPRequestHandler):
+    """Answers every job like an inference_server.py that finished it instantly."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps(CANNED_INFERENCE_RESPONSE).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def startup_cases(work_dir, server_address):
+    """(name, script, arguments, extra environment) of every startup case."""
+    t1_path, t2_path = os.path.join(work_dir, 't1.tif'), os.path.join(work_dir, 't2.tif')
+    for path in (t1_path, t2_path):
+        open(path, 'wb').close()
+    missing = os.path.join(work_dir, 'missing.tif')
+    aoi = json.dumps({"type": "Polygon", "coordinates": [[[77.0, 28.0], [77.1, 28.0], [77.1, 28.1], [77.0, 28.0]]]})
+    return [
+        ('unet_inference_no_arguments', 'unet_inference.py', [], {}),
+        ('unet_inference_missing_files', 'unet_inference.py', [missing, missing], {}),
+        ('unet_inference_help', 'unet_inference.py', ['--help'], {}),
+        ('unet_inference_missing_pairs', 'unet_inference.py', [f'--pairs={missing}.json'], {}),
+        ('unet_inference_remote', 'unet_inference.py', [t1_path, t2_path],
+         {'UNET_INFERENCE_SERVER': server_address}),
+        ('gee_drive_download_no_arguments', 'gee_drive_download.py', [], {}),
+        ('gee_drive_download_bad_date', 'gee_drive_download.py', [aoi, '2024-13-01', '2024-02-01'], {}),
+        ('change_visualization_no_arguments', 'change_visualization.py', [], {}),
+        ('task_store_unknown_command', 'task_store.py', ['bogus'], {}),
+        ('task_store_remove_without_id', 'task_store.py', ['remove'], {}),
+    ]
+
+
+def time_startup(script, arguments, env, repeats=STARTUP_REPEATS):
+    """Best wall time of `repeats` fresh interpreters running the script, and the heavy modules it loaded."""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, '-c', STARTUP_PROBE, json.dumps(HEAVY_MODULES),
+               os.path.join(base_dir, script)] + arguments
+    env = dict(os.environ, **env)
+    # Only the remote case may reach an inference server, not one configured in the caller's environment
+    env.setdefault('UNET_INFERENCE_SERVER', '')
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=base_dir, env=env, capture_output=True, text=True)
+        timings.append(time.perf_counter() - start)
+    lines = result.stderr.strip().splitlines()
+    try:
+        loaded = json.loads(lines[-1])
+    except (IndexError, ValueError):
+        raise RuntimeError(f"{script} {' '.join(arguments)} did not finish: {result.stderr.strip()[-500:]}")
+    return {"wall_s": round(min(timings), 4), "median_wall_s": round(statistics.median(timings), 4),
+            "exit_code": result.returncode, "heavy_modules": loaded}
+
+
+def check_startup(budget=STARTUP_BUDGET_SECONDS, repeats=STARTUP_REPEATS):
+    """Times every startup case against the budget; returns the per-case results."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CannedInferenceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    work_dir = tempfile.mkdtemp(prefix='startup_')
+    try:
+        results = []
+        for name, script, arguments, env in startup_cases(work_dir, f"http://127.0.0.1:{server.server_port}"):
+            result = dict(case=name, **time_startup(script, arguments, env, repeats))
+            result["over_budget"] = result["wall_s"] > budget
+            result["violation"] = result["over_budget"] or bool(result["heavy_modules"])
+            results.append(result)
+        return results
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,38 @@
+# processing/synthetic_scenes.py
+#
+# Deterministic synthetic texture shaped like the gee_drive_download.py exports: 4-band
+# (B4, B3, B2, B8) uint8 scenes with optional changed patches in T2. Shared by the
+# benchmarks and the fake Earth Engine of the load tests.
+
+import numpy as np
+
+BAND_COUNT = 4
+# (B4, B3, B2, B8) of the changed T2 patches: a bright, vegetation-free surface such as new construction
+CHANGED_PIXEL = (200, 190, 180, 60)
+
+
+def synthetic_block(window, seed, changed):
+    """
+    Texture of one window: smooth per-band fields plus noise, deterministic for the
+    seed and window position. Inside `changed` rectangles the T2 pixels are replaced.
+    Returns (t1, t2) as (BAND_COUNT, h, w) uint8 arrays.
+    """
+    rng = np.random.default_rng([seed, window.row_off, window.col_off])
+    rows = np.arange(window.row_off, window.row_off + window.height, dtype=np.float32)[:, None]
+    cols = np.arange(window.col_off, window.col_off + window.width, dtype=np.float32)[None, :]
+    t1 = np.empty((BAND_COUNT, window.height, window.width), dtype=np.uint8)
+    t2 = np.empty_like(t1)
+    for band in range(BAND_COUNT):
+        field = 110 + 50 * np.sin(cols / (31 + 7 * band)) * np.cos(rows / (47 + 5 * band))
+        noise = rng.normal(0, 8, field.shape).astype(np.float32)
+        t1[band] = np.clip(field + noise, 0, 255)
+        t2[band] = np.clip(field + rng.normal(0, 8, field.shape).astype(np.float32), 0, 255)
+
+    for y, x, height, width in changed:
+        top, bottom = max(y, window.row_off), min(y + height, window.row_off + window.height)
+        left, right = max(x, window.col_off), min(x + width, window.col_off + window.width)
+        if top < bottom and left < right:
+            rows_slice = slice(top - window.row_off, bottom - window.row_off)
+            cols_slice = slice(left - window.col_off, right - window.col_off)
+            t2[:, rows_slice, cols_slice] = np.array(CHANGED_PIXEL, dtype=np.uint8)[:, None, None]
+    return t1, t2
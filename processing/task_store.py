@@ -0,0 +1,233 @@
+# processing/task_store.py
+#
+# Transactional store for monitoring tasks, shared by the scheduler and the Node
+# backend. Tasks live in a SQLite database in WAL mode with an index on the time
+# each task next comes due, so the scheduler only ever loads due tasks and every
+# change is a single-row transaction. The old monitoring_tasks.json is imported
+# once and renamed to monitoring_tasks.json.migrated.
+#
+# The backend manages tasks through the command line:
+#
+#   python task_store.py add '{"aoi_id": "...", "geojson": {...}, ...}'
+#   python task_store.py remove <aoi_id>
+#   python task_store.py clear
+#   python task_store.py list
+#
+# Every change made through the command line is announced to a running
+# monitoring_scheduler.py with a UDP datagram on NOTIFY_ADDRESS, so the scheduler
+# picks it up without rescanning the store.
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+from contextlib import closing
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TASK_DB_FILE = os.path.join(BASE_DIR, 'monitoring_tasks.db')
+LEGACY_TASKS_FILE = os.path.join(BASE_DIR, 'monitoring_tasks.json')
+DATE_FORMAT = '%Y-%m-%d'
+BUSY_TIMEOUT_MS = 5000
+SECONDS_PER_DAY = 24 * 60 * 60
+# Due times are spread by a stable per-AOI offset, so AOIs created or checked at the
+# same time do not all come due in the same second. New tasks are spread over the first
+# few minutes, recurring checks (whose last_checked_date has day resolution) over an hour.
+FIRST_CHECK_SPREAD_SECONDS = 300
+RECURRING_SPREAD_SECONDS = 3600
+# Where monitoring_scheduler.py listens for change notifications
+NOTIFY_ADDRESS = ('127.0.0.1', 8766)
+
+# Task fields with their own column; anything else is kept in the `extra` JSON column.
+COLUMNS = ('aoi_id', 'geojson', 'monitoring_interval_days', 'threshold', 'last_checked_date',
+           'email_recipient', 'next_due_at')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    aoi_id TEXT PRIMARY KEY,
+    geojson TEXT NOT NULL,
+    monitoring_interval_days REAL NOT NULL,
+    threshold REAL NOT NULL,
+    last_checked_date TEXT,
+    email_recipient TEXT,
+    next_due_at REAL NOT NULL,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS tasks_next_due_at ON tasks (next_due_at);
+'''
+
+
+def spread_offset(aoi_id, spread_seconds):
+    """Stable offset in [0, spread_seconds) derived from the AOI id."""
+    digest = hashlib.sha1(aoi_id.encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) % max(int(spread_seconds), 1)
+
+
+def next_due_timestamp(task, now=None):
+    """
+    When a task next comes due: shortly after it is created when it was never checked,
+    otherwise once monitoring_interval_days have passed since last_checked_date. Both are
+    spread by a per-AOI offset.
+    """
+    last_checked_date = task.get('last_checked_date')
+    if not last_checked_date:
+        now = time.time() if now is None else now
+        return now + spread_offset(task['aoi_id'], FIRST_CHECK_SPREAD_SECONDS)
+    checked_at = datetime.strptime(last_checked_date, DATE_FORMAT).timestamp()
+    return (checked_at + float(task['monitoring_interval_days']) * SECONDS_PER_DAY
+            + spread_offset(task['aoi_id'], RECURRING_SPREAD_SECONDS))
+
+
+def notify_scheduler(change, address=NOTIFY_ADDRESS):
+    """Announces a task change to a running scheduler; silently does nothing when none listens."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(json.dumps(change).encode('utf-8'), address)
+    except OSError:
+        pass
+
+
+def task_to_row(task, next_due_at):
+    extra = {key: value for key, value in task.items() if key not in COLUMNS}
+    return (task['aoi_id'], json.dumps(task['geojson']), float(task['monitoring_interval_days']),
+            float(task['threshold']), task.get('last_checked_date'), task.get('email_recipient'),
+            next_due_at, json.dumps(extra))
+
+
+def row_to_task(row):
+    task = json.loads(row['extra'])
+    task.update({
+        'aoi_id': row['aoi_id'],
+        'geojson': json.loads(row['geojson']),
+        'monitoring_interval_days': row['monitoring_interval_days'],
+        'threshold': row['threshold'],
+        'last_checked_date': row['last_checked_date'],
+        'email_recipient': row['email_recipient'],
+        'next_due_at': row['next_due_at']
+    })
+    return task
+
+
+class TaskStore:
+    """
+    Monitoring tasks in SQLite. Every call opens its own short-lived connection, so one
+    store can be used from any thread, and WAL mode lets the backend write while the
+    scheduler reads.
+    """
+    def __init__(self, db_path=TASK_DB_FILE, legacy_path=LEGACY_TASKS_FILE):
+        self.db_path = db_path
+        with closing(self.connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+        if legacy_path:
+            self.migrate_json(legacy_path)
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def migrate_json(self, legacy_path):
+        """Imports the tasks of a monitoring_tasks.json once, then renames the file out of the way."""
+        if not os.path.exists(legacy_path):
+            return 0
+        with open(legacy_path, 'r') as f:
+            tasks = json.load(f)
+        with closing(self.connect()) as conn, conn:
+            conn.executemany('INSERT OR IGNORE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             [task_to_row(task, next_due_timestamp(task)) for task in tasks])
+        os.replace(legacy_path, legacy_path + '.migrated')
+        return len(tasks)
+
+    def add_task(self, task):
+        """Inserts or replaces a task; it comes due according to its last_checked_date."""
+        with closing(self.connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         task_to_row(task, task.get('next_due_at') or next_due_timestamp(task)))
+
+    def remove_task(self, aoi_id):
+        with closing(self.connect()) as conn, conn:
+            return conn.execute('DELETE FROM tasks WHERE aoi_id = ?', (aoi_id,)).rowcount > 0
+
+    def clear(self):
+        with closing(self.connect()) as conn, conn:
+            conn.execute('DELETE FROM tasks')
+
+    def get_task(self, aoi_id):
+        with closing(self.connect()) as conn:
+            row = conn.execute('SELECT * FROM tasks WHERE aoi_id = ?', (aoi_id,)).fetchone()
+        return row_to_task(row) if row else None
+
+    def list_tasks(self):
+        with closing(self.connect()) as conn:
+            return [row_to_task(row) for row in conn.execute('SELECT * FROM tasks ORDER BY next_due_at')]
+
+    def count(self):
+        with closing(self.connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+
+    def schedule(self):
+        """(aoi_id, next_due_at) of every task; all the scheduler needs to build its queue."""
+        with closing(self.connect()) as conn:
+            return [tuple(row) for row in conn.execute('SELECT aoi_id, next_due_at FROM tasks')]
+
+    def due_tasks(self, now=None):
+        """Tasks whose next_due_at has passed, read through the next-due index."""
+        now = time.time() if now is None else now
+        with closing(self.connect()) as conn:
+            rows = conn.execute('SELECT * FROM tasks WHERE next_due_at <= ? ORDER BY next_due_at', (now,))
+            return [row_to_task(row) for row in rows]
+
+    def update_task(self, aoi_id, **fields):
+        """
+        Updates fields of one task in a single transaction and recomputes its next due time.
+        Returns False when the task was removed in the meantime.
+        """
+        with closing(self.connect()) as conn, conn:
+            row = conn.execute('SELECT * FROM tasks WHERE aoi_id = ?', (aoi_id,)).fetchone()
+            if row is None:
+                return False
+            task = row_to_task(row)
+            task.update(fields)
+            next_due_at = fields.get('next_due_at') or next_due_timestamp(task)
+            conn.execute('INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         task_to_row(task, next_due_at))
+            return True
+
+
+def main(argv):
+    command = argv[0] if argv else 'list'
+    if command not in ('add', 'remove', 'clear', 'list') or (command in ('add', 'remove') and len(argv) < 2):
+        # Rejected before the store is opened (and the legacy file migrated)
+        response = {"status": "error", "message": "Usage: task_store.py add <task_json> | remove <aoi_id> | clear | list"}
+        print(json.dumps(response), file=sys.stderr)
+        sys.exit(1)
+
+    store = TaskStore()
+    if command == 'add':
+        task = json.loads(argv[1])
+        store.add_task(task)
+        notify_scheduler({"op": "add", "aoi_id": task['aoi_id']})
+        response = {"status": "success", "aoi_id": task['aoi_id'], "task_count": store.count()}
+    elif command == 'remove':
+        removed = store.remove_task(argv[1])
+        notify_scheduler({"op": "remove", "aoi_id": argv[1]})
+        response = {"status": "success", "removed": removed, "task_count": store.count()}
+    elif command == 'clear':
+        store.clear()
+        notify_scheduler({"op": "clear"})
+        response = {"status": "success", "task_count": 0}
+    else:
+        response = {"status": "success", "tasks": store.list_tasks()}
+    print(json.dumps(response))
+
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv[1:])
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": f"Task store error: {e}"}), file=sys.stderr)
+        sys.exit(1)
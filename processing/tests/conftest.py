@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+# The processing scripts import each other as top-level modules
+PROCESSING_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROCESSING_DIR not in sys.path:
+    sys.path.insert(0, PROCESSING_DIR)
+
+
+@pytest.fixture(scope='session')
+def unet_models():
+    """An eval-mode SiameseUNet with non-trivial BatchNorm statistics and its fused copy."""
+    torch = pytest.importorskip('torch')
+    from siamese_unet import SiameseUNet, fuse_for_inference
+
+    torch.manual_seed(0)
+    model = SiameseUNet(in_channels=3, out_channels=1)
+    with torch.no_grad():
+        for module in model.modules():
+            if isinstance(module, torch.nn.BatchNorm2d):
+                module.running_mean.uniform_(-0.5, 0.5)
+                module.running_var.uniform_(0.5, 2.0)
+                module.weight.uniform_(0.5, 1.5)
+                module.bias.uniform_(-0.2, 0.2)
+    model.eval()
+    return model, fuse_for_inference(model)
+
+
+@pytest.fixture
+def random_scenes():
+    """random_scenes(count, height, width, seed) -> `count` random uint8 (3, H, W) scenes."""
+    np = pytest.importorskip('numpy')
+
+    def generate(count, height, width, seed):
+        rng = np.random.default_rng(seed)
+        return [rng.integers(0, 256, (3, height, width), dtype=np.uint8) for _ in range(count)]
+    return generate
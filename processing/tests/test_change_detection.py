@@ -0,0 +1,86 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+rasterio = pytest.importorskip('rasterio')
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+import raster_windows
+import gee_change_detection
+import cva_change_detection
+from synthetic_scenes import BAND_COUNT, synthetic_block
+
+HEIGHT, WIDTH = 150, 200
+NDVI_THRESHOLD = 0.2
+CVA_THRESHOLD = 40
+
+
+@pytest.fixture
+def pair(tmp_path, monkeypatch):
+    """A tiled synthetic pair with changed patches, streamed in several strips."""
+    monkeypatch.setattr(raster_windows, 'WINDOW_TARGET_PIXELS', WIDTH * 32)
+    t1, t2 = synthetic_block(Window(0, 0, WIDTH, HEIGHT), seed=7, changed=[(20, 30, 40, 50), (100, 120, 30, 60)])
+    paths = []
+    for name, pixels in (('t1.tif', t1), ('t2.tif', t2)):
+        path = str(tmp_path / name)
+        with rasterio.open(path, 'w', driver='GTiff', width=WIDTH, height=HEIGHT, count=BAND_COUNT, dtype='uint8',
+                           crs='EPSG:32643', transform=from_origin(500000, 2000000, 10, 10),
+                           tiled=True, blockxsize=32, blockysize=32) as dst:
+            dst.write(pixels)
+        paths.append(path)
+    return paths
+
+
+def full_scene_ndvi(path):
+    # The float64 full-scene kernel the streaming version replaced
+    with rasterio.open(path) as src:
+        red = src.read(gee_change_detection.RED_BAND).astype(float)
+        nir = src.read(gee_change_detection.NIR_BAND).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (nir - red) / (nir + red)
+
+
+def full_scene_cva(t1_path, t2_path, bands):
+    with rasterio.open(t1_path) as src_t1, rasterio.open(t2_path) as src_t2:
+        t1 = np.stack([src_t1.read(band) for band in bands], axis=-1).astype(float)
+        t2 = np.stack([src_t2.read(band) for band in bands], axis=-1).astype(float)
+    return np.sqrt(np.sum((t2 - t1) ** 2, axis=-1))
+
+
+def test_windows_cover_the_scene_in_several_strips(pair):
+    with rasterio.open(pair[0]) as src:
+        windows = raster_windows.strip_windows(src)
+    assert len(windows) > 1
+    assert sum(window.height for window in windows) == HEIGHT
+
+
+def test_streamed_ndvi_counts_match_full_scene(pair):
+    difference = full_scene_ndvi(pair[1]) - full_scene_ndvi(pair[0])
+    expected_gain = int(np.sum(difference > NDVI_THRESHOLD))
+    expected_loss = int(np.sum(difference < -NDVI_THRESHOLD))
+    assert expected_gain + expected_loss > 0
+
+    gain, loss, width, height = gee_change_detection.stream_ndvi_change(*pair, NDVI_THRESHOLD)
+    assert (gain, loss, width, height) == (expected_gain, expected_loss, WIDTH, HEIGHT)
+    summary = gee_change_detection.summarize_ndvi_change(gain, loss, width, height)
+    assert summary['gain_area_ha'] == expected_gain * 100 / 10000
+    assert summary['loss_area_ha'] == expected_loss * 100 / 10000
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_streamed_cva_counts_match_full_scene(pair, workers):
+    bands = gee_change_detection.CVA_BANDS
+    expected = int(np.sum(full_scene_cva(*pair, bands) > CVA_THRESHOLD))
+    assert expected > 0
+
+    change_pixels, _, _, width, height = cva_change_detection.count_cva_changes(*pair, bands, CVA_THRESHOLD,
+                                                                                 workers)
+    assert (change_pixels, width, height) == (expected, WIDTH, HEIGHT)
+
+
+def test_calculate_cva_matches_full_scene(pair):
+    bands = gee_change_detection.CVA_BANDS
+    t1_bands = cva_change_detection.read_bands(pair[0], bands)[0]
+    t2_bands = cva_change_detection.read_bands(pair[1], bands)[0]
+    magnitude = cva_change_detection.calculate_cva(t1_bands, t2_bands)
+    assert np.allclose(magnitude, full_scene_cva(*pair, bands), atol=1e-3)
@@ -0,0 +1,54 @@
+import os
+import sys
+import json
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('rasterio')
+
+import stage_metrics
+import fake_earth_engine
+
+AOI = {"type": "Polygon", "coordinates": [[[77.0, 28.0], [77.02, 28.0], [77.02, 28.02], [77.0, 28.02],
+                                           [77.0, 28.0]]]}
+
+
+@pytest.fixture
+def fake_download(tmp_path, monkeypatch):
+    """
+    Returns a function that installs fake_earth_engine (no latency, failed exports or
+    clouds unless overridden) and returns gee_drive_download configured to use it.
+    """
+    def install(**overrides):
+        config = dict(fake_earth_engine.DEFAULT_CONFIG, work_dir=str(tmp_path), export_latency_s=[0, 0],
+                      direct_latency_s=[0, 0], failure_rate=0, occlusion_rate=0, time_scale=0.01)
+        config.update(overrides)
+        for name in ('ee', 'googleapiclient', 'googleapiclient.discovery', 'googleapiclient.http',
+                     'gee_drive_download'):
+            monkeypatch.delitem(sys.modules, name, raising=False)
+        fake_earth_engine.install(config)
+        import gee_drive_download
+        fake_earth_engine.configure_download(gee_drive_download, config)
+        return gee_drive_download
+    return install
+
+
+def download(module, transport='auto'):
+    with stage_metrics.collect() as metrics:
+        response = module.download_pair(json.dumps(AOI), '2024-01-01', '2024-03-01', '256x256', job_id='test',
+                                        use_cache=False, transport=transport)
+    return response, metrics.as_dict()['stages']
+
+
+def test_direct_download(fake_download):
+    response, stages = download(fake_download())
+    assert response['transport'] == 'direct'
+    assert os.path.exists(response['t1_path']) and os.path.exists(response['t2_path'])
+    assert 'direct_download' in stages and 'export_start' not in stages
+
+
+def test_failed_direct_download_falls_back_to_drive(fake_download):
+    response, stages = download(fake_download(direct_failure_rate=1))
+    assert os.path.exists(response['t1_path']) and os.path.exists(response['t2_path'])
+    assert stages['direct_download']['calls'] == 2
+    assert 'export_start' in stages and 'drive_download' in stages
@@ -0,0 +1,36 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+np = pytest.importorskip('numpy')
+
+import unet_inference
+from siamese_unet import SiameseUNet, FusedSiameseUNet, FUSION_TOLERANCE, fuse_for_inference
+
+
+def test_fuse_requires_eval_mode():
+    with pytest.raises(ValueError):
+        fuse_for_inference(SiameseUNet(in_channels=3, out_channels=1).train())
+
+
+def test_fused_forward_matches_checkpoint(unet_models):
+    model, fused = unet_models
+    assert isinstance(fused, FusedSiameseUNet)
+    generator = torch.Generator().manual_seed(1)
+    # Non-square; the network itself needs multiples of 16
+    x1 = torch.rand(2, 3, 48, 80, generator=generator) * 2 - 1
+    x2 = torch.rand(2, 3, 48, 80, generator=generator) * 2 - 1
+    with torch.no_grad():
+        difference = (model(x1, x2) - fused(x1, x2)).abs().max().item()
+    assert difference <= FUSION_TOLERANCE
+
+
+@pytest.mark.parametrize('height, width', [(50, 90), (77, 45)])
+def test_fused_scene_logits_match_checkpoint(unet_models, random_scenes, height, width):
+    # Scenes that are not a multiple of 16 go through the tiled, edge-padded path
+    model, fused = unet_models
+    t1, t2 = random_scenes(2, height, width, seed=height)
+    device = torch.device('cpu')
+    expected = unet_inference.predict_change_logits(model, device, t1, t2, height, width, tile_size=32, overlap=8)
+    actual = unet_inference.predict_change_logits(fused, device, t1, t2, height, width, tile_size=32, overlap=8)
+    assert actual.shape == (height, width)
+    assert np.abs(actual - expected).max() <= FUSION_TOLERANCE
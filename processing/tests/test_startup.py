@@ -0,0 +1,19 @@
+import pytest
+
+from startup_check import STARTUP_BUDGET_SECONDS, startup_cases, time_startup
+
+# The argument-error and --help cases of the entry points the backend spawns most often
+CASES = ('unet_inference_no_arguments', 'unet_inference_missing_files', 'unet_inference_help',
+         'unet_inference_missing_pairs', 'gee_drive_download_no_arguments', 'gee_drive_download_bad_date',
+         'task_store_unknown_command', 'task_store_remove_without_id')
+
+
+@pytest.mark.parametrize('name', CASES)
+def test_entry_point_starts_fast_without_heavy_imports(tmp_path, name):
+    cases = {case[0]: case[1:] for case in startup_cases(str(tmp_path), server_address=None)}
+    script, arguments, env = cases[name]
+    result = time_startup(script, arguments, env, repeats=3)
+    assert result['exit_code'] == (0 if name.endswith('_help') else 1)
+    # HEAVY_MODULES: torch, rasterio, numpy, ee and the other large libraries
+    assert result['heavy_modules'] == []
+    assert result['wall_s'] <= STARTUP_BUDGET_SECONDS
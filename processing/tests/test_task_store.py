@@ -0,0 +1,78 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import task_store
+from task_store import TaskStore, spread_offset, FIRST_CHECK_SPREAD_SECONDS, RECURRING_SPREAD_SECONDS
+
+DAY = task_store.SECONDS_PER_DAY
+
+
+def make_task(aoi_id, **fields):
+    task = {'aoi_id': aoi_id, 'geojson': {'type': 'Point', 'coordinates': [77.0, 28.0]},
+            'monitoring_interval_days': 7, 'threshold': 0.2, 'last_checked_date': None,
+            'email_recipient': 'ops@example.com'}
+    task.update(fields)
+    return task
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TaskStore(str(tmp_path / 'tasks.db'), legacy_path=None)
+
+
+def test_migrates_legacy_json_once(tmp_path):
+    legacy_path = tmp_path / 'monitoring_tasks.json'
+    legacy_path.write_text(json.dumps([make_task('aoi-1', last_checked_date='2024-01-01', note='kept'),
+                                       make_task('aoi-2')]))
+    store = TaskStore(str(tmp_path / 'tasks.db'), legacy_path=str(legacy_path))
+
+    assert not legacy_path.exists()
+    assert (tmp_path / 'monitoring_tasks.json.migrated').exists()
+    assert store.count() == 2
+    migrated = store.get_task('aoi-1')
+    assert migrated['last_checked_date'] == '2024-01-01'
+    assert migrated['note'] == 'kept'  # Unknown fields survive in the extra column
+    # Opening the store again does not import anything twice
+    assert TaskStore(str(tmp_path / 'tasks.db'), legacy_path=str(legacy_path)).count() == 2
+
+
+def test_add_task_replaces_an_existing_task(store):
+    store.add_task(make_task('aoi-1', threshold=0.2))
+    store.add_task(make_task('aoi-1', threshold=0.5))
+    assert store.count() == 1
+    assert store.get_task('aoi-1')['threshold'] == 0.5
+
+
+def test_update_task_recomputes_next_due_at(store):
+    store.add_task(make_task('aoi-1'))
+    assert store.update_task('aoi-1', last_checked_date='2024-03-01')
+
+    checked_at = datetime.strptime('2024-03-01', task_store.DATE_FORMAT).timestamp()
+    expected = checked_at + 7 * DAY + spread_offset('aoi-1', RECURRING_SPREAD_SECONDS)
+    assert store.get_task('aoi-1')['next_due_at'] == pytest.approx(expected)
+    assert not store.update_task('missing', last_checked_date='2024-03-01')
+
+
+def test_due_tasks_follow_the_spread_offset(store):
+    now = 1_700_000_000.0
+    for index in range(20):
+        store.add_task(make_task(f'aoi-{index}', next_due_at=now + spread_offset(f'aoi-{index}',
+                                                                                 FIRST_CHECK_SPREAD_SECONDS)))
+    offsets = {f'aoi-{index}': spread_offset(f'aoi-{index}', FIRST_CHECK_SPREAD_SECONDS) for index in range(20)}
+    assert all(0 <= offset < FIRST_CHECK_SPREAD_SECONDS for offset in offsets.values())
+    assert len(set(offsets.values())) > 1  # Spread, not all due in the same second
+
+    halfway = now + FIRST_CHECK_SPREAD_SECONDS / 2
+    due = store.due_tasks(halfway)
+    assert {task['aoi_id'] for task in due} == {aoi_id for aoi_id, offset in offsets.items() if now + offset <= halfway}
+    assert [task['next_due_at'] for task in due] == sorted(task['next_due_at'] for task in due)
+    assert len(store.due_tasks(now + FIRST_CHECK_SPREAD_SECONDS)) == 20
+
+
+def test_new_tasks_come_due_within_the_first_check_spread(store):
+    before = task_store.time.time()
+    store.add_task(make_task('aoi-1'))
+    due_at = store.get_task('aoi-1')['next_due_at']
+    assert before <= due_at < task_store.time.time() + FIRST_CHECK_SPREAD_SECONDS
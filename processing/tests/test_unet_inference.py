@@ -0,0 +1,44 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+np = pytest.importorskip('numpy')
+
+import unet_inference
+
+HEIGHT, WIDTH = 70, 90
+TILING = dict(tile_size=32, overlap=8)
+
+
+def test_fresh_incremental_run_matches_full_run(unet_models, random_scenes):
+    model = unet_models[0]
+    t1, t2 = random_scenes(2, HEIGHT, WIDTH, seed=1)
+    device = torch.device('cpu')
+    expected = unet_inference.predict_change_logits(model, device, t1, t2, HEIGHT, WIDTH, **TILING)
+    logits, reused, features = unet_inference.predict_change_logits_incremental(
+        model, device, t1, t2, HEIGHT, WIDTH, **TILING)
+    assert not reused
+    assert np.abs(logits - expected).max() <= 1e-5
+    assert all(level.dtype == np.dtype(unet_inference.BASELINE_FEATURE_DTYPE) for level in features)
+
+
+def test_stored_baseline_stays_within_tolerance(unet_models, random_scenes):
+    model = unet_models[0]
+    # A retry of the same baseline scene, here against a new T2 scene
+    t1, t2, t2_retry = random_scenes(3, HEIGHT, WIDTH, seed=2)
+    device = torch.device('cpu')
+    _, _, baseline = unet_inference.predict_change_logits_incremental(model, device, t1, t2, HEIGHT, WIDTH, **TILING)
+    logits, reused, features = unet_inference.predict_change_logits_incremental(
+        model, device, None, t2_retry, HEIGHT, WIDTH, baseline=baseline, **TILING)
+    expected = unet_inference.predict_change_logits(model, device, t1, t2_retry, HEIGHT, WIDTH, **TILING)
+    assert reused and features is None
+    assert np.abs(logits - expected).max() <= unet_inference.BASELINE_LOGIT_TOLERANCE
+    disagree = (logits > 0) != (expected > 0)
+    assert np.all(np.abs(expected[disagree]) <= unet_inference.BASELINE_LOGIT_TOLERANCE)
+
+
+def test_features_over_the_limit_are_not_kept(unet_models, random_scenes):
+    model = unet_models[0]
+    t1, t2 = random_scenes(2, HEIGHT, WIDTH, seed=3)
+    _, reused, features = unet_inference.predict_change_logits_incremental(
+        model, torch.device('cpu'), t1, t2, HEIGHT, WIDTH, max_feature_bytes=1024, **TILING)
+    assert not reused and features is None
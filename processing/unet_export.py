@@ -0,0 +1,103 @@
+# processing/unet_export.py
+#
+# Exports the inference-optimized SiameseUNet as a traced TorchScript graph and/or
+# an ONNX graph with dynamic batch and spatial dimensions, for the `torchscript`
+# and `onnxruntime` backends of unet_inference.py:
+#
+#   python unet_export.py --format all
+#   python unet_inference.py t1.tif t2.tif --compare-backends
+
+import os
+import sys
+import json
+import argparse
+import warnings
+import numpy as np
+import torch
+
+import unet_inference
+
+ONNX_OPSET = 17
+# Tracing size; any multiple of 16 works at run time. The second size checks that
+# the exported graph really accepts other spatial dimensions.
+EXPORT_SIZE = 64
+CHECK_SIZE = (96, 128)
+EXPORT_TOLERANCE = 1e-3
+
+
+def example_inputs(height, width, batch=1):
+    generator = torch.Generator().manual_seed(0)
+    return (torch.rand(batch, 3, height, width, generator=generator) * 2 - 1,
+            torch.rand(batch, 3, height, width, generator=generator) * 2 - 1)
+
+
+def export_torchscript(model, output_path):
+    """Traces the model to TorchScript and saves it."""
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # torch.jit is deprecated upstream but still supported
+        traced = torch.jit.freeze(torch.jit.trace(model, example_inputs(EXPORT_SIZE, EXPORT_SIZE)).eval())
+        torch.jit.save(traced, output_path)
+
+
+def export_onnx(model, output_path):
+    """Exports the model to ONNX with dynamic batch, height and width."""
+    dynamic_axes = {name: {0: 'batch', 2: 'height', 3: 'width'} for name in ('t1', 't2', 'logits')}
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        torch.onnx.export(model, example_inputs(EXPORT_SIZE, EXPORT_SIZE), output_path,
+                          input_names=['t1', 't2'], output_names=['logits'],
+                          dynamic_axes=dynamic_axes, opset_version=ONNX_OPSET, dynamo=False)
+
+
+def check_export(model, backend):
+    """Largest logit difference between the eager model and an exported backend at CHECK_SIZE."""
+    x1, x2 = example_inputs(*CHECK_SIZE, batch=2)
+    with torch.no_grad():
+        expected = model(x1, x2).numpy()
+    actual = backend.predict(x1.numpy(), x2.numpy())
+    difference = float(np.abs(expected - actual).max())
+    if difference > EXPORT_TOLERANCE:
+        raise ValueError(f"{backend.name} export deviates from the eager model by {difference:.2e}.")
+    return difference
+
+
+def main(formats, model_path=unet_inference.MODEL_PATH, torchscript_path=unet_inference.TORCHSCRIPT_MODEL_PATH,
+         onnx_path=unet_inference.ONNX_MODEL_PATH):
+    try:
+        device = torch.device('cpu')
+        model = unet_inference.load_model(device, model_path, fuse=True)
+        exports = {}
+
+        if 'torchscript' in formats:
+            export_torchscript(model, torchscript_path)
+            backend = unet_inference.TorchBackend(unet_inference.load_torchscript_model(device, torchscript_path),
+                                                  device, name='torchscript')
+            exports['torchscript'] = {"path": torchscript_path, "max_logit_difference": check_export(model, backend)}
+
+        if 'onnx' in formats:
+            export_onnx(model, onnx_path)
+            entry = {"path": onnx_path}
+            try:
+                entry["max_logit_difference"] = check_export(model, unet_inference.OnnxRuntimeBackend(onnx_path))
+            except ImportError:
+                entry["max_logit_difference"] = None  # onnxruntime not installed; exported but unchecked
+            exports['onnx'] = entry
+
+        print(json.dumps({"status": "success", "message": "Model exported.", "exports": exports}))
+
+    except Exception as e:
+        response = {"status": "error", "message": f"Export Error: {e}"}
+        print(json.dumps(response), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the SiameseUNet to TorchScript and/or ONNX.")
+    parser.add_argument('--format', choices=('torchscript', 'onnx', 'all'), default='all')
+    parser.add_argument('--model', default=unet_inference.MODEL_PATH, help="Checkpoint to export.")
+    parser.add_argument('--torchscript-output', default=unet_inference.TORCHSCRIPT_MODEL_PATH)
+    parser.add_argument('--onnx-output', default=unet_inference.ONNX_MODEL_PATH)
+    args = parser.parse_args()
+
+    formats = ('torchscript', 'onnx') if args.format == 'all' else (args.format,)
+    main(formats, args.model, args.torchscript_output, args.onnx_output)
@@ -1,264 +1,944 @@
-# # unet_inference.py
-# unet_inference.py
+# processing/unet_inference.py
 
 import os
 import sys
 import json
-import torch
-import torch.nn as nn
-import numpy as np
-import rasterio
-from PIL import Image
-import torchvision.transforms as transforms
-import matplotlib.pyplot as plt
+import time
+import socket
+import argparse
+import http.client
+import urllib.parse
+import stage_metrics
+import change_visualization
+
+# numpy, rasterio and torch (and the model definition in siamese_unet) are imported
+# inside the functions that need them: workers using the ONNX Runtime backend never
+# load torch, and the command line validates its arguments, reports errors and
+# forwards jobs to an inference server without loading any of them.
+
 
 # ==============================================================================
-# 1. MODEL ARCHITECTURE
-# (Copied from your original scripts - no changes needed here)
+# 1. MODEL LOADING
 # ==============================================================================
 
-class ConvBlock(nn.Module):
-    """A simple convolutional block with Conv2d, BatchNorm2d, and ReLU activation."""
-    def __init__(self, in_channels, out_channels):
-        super(ConvBlock, self).__init__()
-        self.conv = nn.Sequential(
-            nn.Conv2d(in_channels, out_channels, kernel_size=3, padding=1),
-            nn.BatchNorm2d(out_channels),
-            nn.ReLU(inplace=True),
-            nn.Conv2d(out_channels, out_channels, kernel_size=3, padding=1),
-            nn.BatchNorm2d(out_channels),
-            nn.ReLU(inplace=True)
-        )
-    def forward(self, x):
-        return self.conv(x)
-
-class SiameseUNet(nn.Module):
-    """A Siamese U-Net for change detection."""
-    def __init__(self, in_channels=3, out_channels=1):
-        super(SiameseUNet, self).__init__()
-        # Encoder for Image 1
-        self.enc1_conv1 = ConvBlock(in_channels, 64)
-        self.enc1_maxpool1 = nn.MaxPool2d(kernel_size=2, stride=2)
-        self.enc1_conv2 = ConvBlock(64, 128)
-        self.enc1_maxpool2 = nn.MaxPool2d(kernel_size=2, stride=2)
-        self.enc1_conv3 = ConvBlock(128, 256)
-        self.enc1_maxpool3 = nn.MaxPool2d(kernel_size=2, stride=2)
-        self.enc1_conv4 = ConvBlock(256, 512)
-        self.enc1_maxpool4 = nn.MaxPool2d(kernel_size=2, stride=2)
-
-        # Encoder for Image 2
-        self.enc2_conv1 = ConvBlock(in_channels, 64)
-        self.enc2_maxpool1 = nn.MaxPool2d(kernel_size=2, stride=2)
-        self.enc2_conv2 = ConvBlock(64, 128)
-        self.enc2_maxpool2 = nn.MaxPool2d(kernel_size=2, stride=2)
-        self.enc2_conv3 = ConvBlock(128, 256)
-        self.enc2_maxpool3 = nn.MaxPool2d(kernel_size=2, stride=2)
-        self.enc2_conv4 = ConvBlock(256, 512)
-        self.enc2_maxpool4 = nn.MaxPool2d(kernel_size=2, stride=2)
-
-        self.bottleneck = ConvBlock(512 * 2, 1024)
-
-        # Decoder
-        self.upconv4 = nn.ConvTranspose2d(1024, 512, kernel_size=2, stride=2)
-        self.dec_conv4 = ConvBlock(512 + 512 + 512, 512)
-
-        self.upconv3 = nn.ConvTranspose2d(512, 256, kernel_size=2, stride=2)
-        self.dec_conv3 = ConvBlock(256 + 256 + 256, 256)
-
-        self.upconv2 = nn.ConvTranspose2d(256, 128, kernel_size=2, stride=2)
-        self.dec_conv2 = ConvBlock(128 + 128 + 128, 128)
-
-        self.upconv1 = nn.ConvTranspose2d(128, 64, kernel_size=2, stride=2)
-        self.dec_conv1 = ConvBlock(64 + 64 + 64, 64)
-
-        self.final_conv = nn.Conv2d(64, out_channels, kernel_size=1)
-
-    def forward(self, x1, x2):
-        # Encoder 1
-        s1_1 = self.enc1_conv1(x1)
-        e1_1 = self.enc1_maxpool1(s1_1)
-        s1_2 = self.enc1_conv2(e1_1)
-        e1_2 = self.enc1_maxpool2(s1_2)
-        s1_3 = self.enc1_conv3(e1_2)
-        e1_3 = self.enc1_maxpool3(s1_3)
-        s1_4 = self.enc1_conv4(e1_3)
-        e1_4 = self.enc1_maxpool4(s1_4)
-
-        # Encoder 2
-        s2_1 = self.enc2_conv1(x2)
-        e2_1 = self.enc2_maxpool1(s2_1)
-        s2_2 = self.enc2_conv2(e2_1)
-        e2_2 = self.enc2_maxpool2(s2_2)
-        s2_3 = self.enc2_conv3(e2_2)
-        e2_3 = self.enc2_maxpool3(s2_3)
-        s2_4 = self.enc2_conv4(e2_3)
-        e2_4 = self.enc2_maxpool4(s2_4)
-
-        # Bottleneck (Feature Fusion)
-        fused_bottleneck = self.bottleneck(torch.cat([e1_4, e2_4], dim=1))
-
-        # Decoder with fused skip connections
-        d4 = self.upconv4(fused_bottleneck)
-        d4 = torch.cat([d4, s1_4, s2_4], dim=1)
-        d4 = self.dec_conv4(d4)
-
-        d3 = self.upconv3(d4)
-        d3 = torch.cat([d3, s1_3, s2_3], dim=1)
-        d3 = self.dec_conv3(d3)
-
-        d2 = self.upconv2(d3)
-        d2 = torch.cat([d2, s1_2, s2_2], dim=1)
-        d2 = self.dec_conv2(d2)
-
-        d1 = self.upconv1(d2)
-        d1 = torch.cat([d1, s1_1, s2_1], dim=1)
-        d1 = self.dec_conv1(d1)
-
-        # Final output
-        output = self.final_conv(d1)
-        return output
-
-def create_and_save_visualizations(original_t2, change_mask, output_dir, t2_filename):
-    """
-    Creates and saves a blended image and a change-only image as PNGs.
-    """
-    # Create the base filename without extension
-    base_filename = os.path.splitext(t2_filename)[0]
-    
-    # 1. Blended Image (T2 with red overlay)
-    blended_filename = f"{base_filename}_change_overlay.png"
-    blended_path = os.path.join(output_dir, blended_filename)
-    
-    overlay = np.zeros_like(original_t2)
-    overlay[change_mask == 1] = [255, 0, 0] # Red color for changes
-    
-    blended_image = Image.fromarray((original_t2 * 0.7 + overlay * 0.3).astype(np.uint8))
-    blended_image.save(blended_path)
-    
-    # 2. Change-Only Image
-    change_only_filename = f"{base_filename}_changes_only.png"
-    change_only_path = os.path.join(output_dir, change_only_filename)
-    
-    change_only_image = np.zeros_like(original_t2)
-    change_only_image[change_mask == 1] = [255, 0, 0]
-    Image.fromarray(change_only_image.astype(np.uint8)).save(change_only_path)
-    
-    return blended_filename, change_only_filename
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, 'models', 'siamese_unet_levir_cd.pth')
+# INT8 TorchScript model produced by unet_quantize.py (opt-in, CPU only)
+QUANTIZED_MODEL_PATH = os.path.join(BASE_DIR, 'models', 'siamese_unet_levir_cd_int8.pt')
+QUANTIZATION_BACKEND = 'x86'
+# Graph exports written by unet_export.py
+TORCHSCRIPT_MODEL_PATH = os.path.join(BASE_DIR, 'models', 'siamese_unet_levir_cd.torchscript.pt')
+ONNX_MODEL_PATH = os.path.join(BASE_DIR, 'models', 'siamese_unet_levir_cd.onnx')
+OUTPUT_DIR = os.path.join(BASE_DIR, 'temp_downloads')
+
+# When this environment variable points at a running inference_server.py
+# (e.g. "http://127.0.0.1:8765" or "unix:///tmp/unet_inference.sock"), jobs are
+# forwarded to its warm model instead of loading the checkpoint in this process.
+INFERENCE_SERVER_ENV = 'UNET_INFERENCE_SERVER'
+# Errors meaning no server is listening, so the job runs locally instead. A server that
+# is reachable but slow (a timeout) may still be running the job and is not bypassed.
+SERVER_UNAVAILABLE_ERRORS = (ConnectionRefusedError, FileNotFoundError)
+REMOTE_TIMEOUT_SECONDS = 600
+
+
+def get_device():
+    """Returns the CUDA device when available, otherwise the CPU."""
+    import torch
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def load_model(device, model_path=MODEL_PATH, fuse=True):
+    """
+    Builds the SiameseUNet and loads the trained checkpoint onto the given device.
+    With fuse=True (the default) the model is compiled for inference by
+    siamese_unet.fuse_for_inference: BatchNorm folded into the convolutions and
+    the two encoders stacked into one.
+    """
+    import torch
+    from siamese_unet import SiameseUNet, fuse_for_inference
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found at '{model_path}'.")
+
+    model = SiameseUNet(in_channels=3, out_channels=1)
+    model.load_state_dict(torch.load(model_path, map_location=device))
+    model.to(device)
+    model.eval()
+    if fuse:
+        model = fuse_for_inference(model)
+    return model
+
+
+def load_quantized_model(model_path=QUANTIZED_MODEL_PATH):
+    """Loads the INT8 TorchScript model written by unet_quantize.py. It always runs on the CPU."""
+    import torch
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Quantized model not found at '{model_path}'. "
+                                f"Create it with unet_quantize.py first.")
+    torch.backends.quantized.engine = QUANTIZATION_BACKEND
+    model = torch.jit.load(model_path, map_location='cpu')
+    model.eval()
+    return model
+
+
+def load_torchscript_model(device, model_path=TORCHSCRIPT_MODEL_PATH):
+    """Loads the traced TorchScript graph written by unet_export.py onto the given device."""
+    import torch
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"TorchScript model not found at '{model_path}'. "
+                                f"Create it with unet_export.py first.")
+    model = torch.jit.load(model_path, map_location=device)
+    model.eval()
+    return model
+
+
+# ==============================================================================
+# 2. EXECUTION BACKENDS
+# Every backend takes float32 (N, 3, H, W) numpy batches and returns (N, 1, H, W)
+# numpy logits, so the tiling code below does not care what runs the network.
+# ==============================================================================
+
+BACKENDS = ('torch', 'torchscript', 'onnxruntime')
+# Baseline encoder features kept for a later run are stored at half precision; a run
+# encodes its own baseline in float32, like run_inference. A run from stored features
+# differs from a fresh run by at most BASELINE_LOGIT_TOLERANCE per logit, so the two
+# masks can only disagree on pixels whose logit is that close to 0
+# (tests/test_unet_inference.py).
+BASELINE_FEATURE_DTYPE = 'float16'
+BASELINE_LOGIT_TOLERANCE = 1e-2
+# The skip features of a scene are 120 values per pixel (64 + 128/4 + 256/16 + 512/64),
+# about 250 MB at half precision for a 1024x1024 export. Larger scenes are not kept.
+MAX_BASELINE_FEATURE_BYTES = 256 * 1024 ** 2
+
+
+class TorchBackend:
+    """Runs an eager or TorchScript module on a torch device."""
+    def __init__(self, model, device, name='torch'):
+        self.model = model
+        self.device = device
+        self.name = name
+
+    def predict(self, batch_t1, batch_t2):
+        import torch
+        with torch.no_grad():
+            output = self.model(torch.from_numpy(batch_t1).to(self.device),
+                                torch.from_numpy(batch_t2).to(self.device))
+        return output.cpu().numpy()
+
+    @property
+    def supports_baseline(self):
+        """Whether the model can run from cached T1 encoder features (eager models only)."""
+        return hasattr(self.model, 'forward_with_baseline')
+
+    def encode_baseline(self, batch_t1):
+        """T1 encoder skip features of a batch as float32 arrays, one per level."""
+        import torch
+        with torch.no_grad():
+            skips = self.model.encode_t1(torch.from_numpy(batch_t1).to(self.device))
+        return [skip.cpu().numpy() for skip in skips]
+
+    def predict_with_baseline(self, t1_skips, batch_t2):
+        """Like predict(), with the T1 encoder replaced by features from encode_baseline()."""
+        import torch
+        with torch.no_grad():
+            skips = [torch.from_numpy(skip).to(self.device).float() for skip in t1_skips]
+            output = self.model.forward_with_baseline(skips, torch.from_numpy(batch_t2).to(self.device))
+        return output.cpu().numpy()
+
+
+class OnnxRuntimeBackend:
+    """Runs the ONNX graph written by unet_export.py with ONNX Runtime on the CPU."""
+    name = 'onnxruntime'
+    device = None
+
+    def __init__(self, model_path=ONNX_MODEL_PATH, threads=None):
+        import onnxruntime
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model not found at '{model_path}'. "
+                                    f"Create it with unet_export.py first.")
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+
+    def predict(self, batch_t1, batch_t2):
+        return self.session.run(None, {'t1': batch_t1, 't2': batch_t2})[0]
+
+
+def as_backend(model, device):
+    """Wraps a torch module in a TorchBackend; backends are returned unchanged."""
+    if hasattr(model, 'predict'):
+        return model
+    return TorchBackend(model, device)
+
+
+def load_backend(name='torch', fuse=True, int8=False, model_path=None):
+    """
+    Loads the model for one execution backend:
+      torch        eager PyTorch (BatchNorm-folded unless fuse=False, INT8 with int8=True)
+      torchscript  traced graph from unet_export.py
+      onnxruntime  ONNX graph from unet_export.py, without importing torch
+    model_path overrides the backend's default model file.
+    """
+    with stage_metrics.stage('model_load'):
+        return load_backend_model(name, fuse, int8, model_path)
+
+
+def load_backend_model(name, fuse, int8, model_path):
+    if name == 'torch':
+        if int8:
+            import torch
+            return TorchBackend(load_quantized_model(model_path or QUANTIZED_MODEL_PATH), torch.device('cpu'),
+                                name='torch-int8')
+        device = get_device()
+        return TorchBackend(load_model(device, model_path or MODEL_PATH, fuse=fuse), device)
+    if name == 'torchscript':
+        device = get_device()
+        return TorchBackend(load_torchscript_model(device, model_path or TORCHSCRIPT_MODEL_PATH), device,
+                            name='torchscript')
+    if name == 'onnxruntime':
+        return OnnxRuntimeBackend(model_path or ONNX_MODEL_PATH)
+    raise ValueError(f"Unknown backend '{name}'. Choose one of: {', '.join(BACKENDS)}.")
+
+
+# ==============================================================================
+# 3. TILED INFERENCE
+# ==============================================================================
+
+# Scenes up to this size are pushed through the network in one piece, exactly like
+# the 1024x1024 exports from gee_drive_download.py. Anything larger is tiled.
+MAX_UNTILED_SIZE = 1024
+DEFAULT_TILE_SIZE = 512
+DEFAULT_TILE_OVERLAP = 64
+# The encoder pools four times, so network inputs must be a multiple of 16 pixels.
+SIZE_MULTIPLE = 16
 
+# Batch sizing: peak fp32 forward-pass memory per input pixel of one sample (measured
+# on CPU), the share of currently free memory a batch may use, and the bounds.
+ACTIVATION_BYTES_PER_PIXEL = 3500
+MEMORY_BUDGET_FRACTION = 0.5
+MAX_BATCH_SIZE = 16
+FALLBACK_BATCH_SIZE = 4
 
-def main(t1_path, t2_path):
+
+def normalize_rgb(rgb):
+    """
+    Converts a (3, H, W) uint8 array into the float32 network input.
+    Equivalent to transforms.ToTensor() followed by Normalize(mean=0.5, std=0.5).
+    """
+    import numpy as np
+    return rgb.astype(np.float32) / 127.5 - 1.0
+
+
+def read_rgb_window(source, y, x, height, width):
+    """
+    Reads the RGB bands of a window from a (bands, H, W) array, an open rasterio
+    dataset, or a GeoTIFF path (opened just for this read).
+    """
+    import numpy as np
+    import rasterio
+    from rasterio.windows import Window
+
+    if isinstance(source, np.ndarray):
+        return source[:3, y:y + height, x:x + width]
+    if isinstance(source, str):
+        with rasterio.open(source) as src:
+            return src.read([1, 2, 3], window=Window(x, y, width, height))
+    return source.read([1, 2, 3], window=Window(x, y, width, height))
+
+
+def tile_origins(length, tile_size, overlap):
+    """Start offsets of overlapping tiles along one axis; the last tile ends at the edge."""
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    origins = list(range(0, length - tile_size, stride))
+    origins.append(length - tile_size)
+    return origins
+
+
+def blend_ramp(tile_size, overlap):
+    """1-D blending weights that fade linearly to the tile edges across the overlap."""
+    import numpy as np
+    ramp = np.ones(tile_size, dtype=np.float32)
+    if overlap > 0:
+        edge = np.arange(1, overlap + 1, dtype=np.float32) / (overlap + 1)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = np.minimum(ramp[-overlap:], edge[::-1])
+    return ramp
+
+
+def fill_tile(batch, i, source, y, x, height, width):
+    """Reads one normalized tile into batch[i], edge-padding tiles that overhang the scene."""
+    import numpy as np
+    tile_h, tile_w = batch.shape[2:]
+    h, w = min(tile_h, height - y), min(tile_w, width - x)
+    batch[i, :, :h, :w] = normalize_rgb(read_rgb_window(source, y, x, h, w))
+    if h < tile_h or w < tile_w:
+        # Scene smaller than a tile: pad by edge replication.
+        batch[i] = np.pad(batch[i, :, :h, :w], ((0, 0), (0, tile_h - h), (0, tile_w - w)), mode='edge')
+
+
+def blend_weights(height, width, tile_shape, origins, ramps):
+    """
+    Total blend weight at each pixel. The weights are separable and the tiles form a
+    grid, so it is the outer product of the per-axis sums.
+    """
+    import numpy as np
+    weights = []
+    for length, tile_length, axis_origins, ramp in zip((height, width), tile_shape, origins, ramps):
+        weight = np.zeros(length, dtype=np.float32)
+        for origin in axis_origins:
+            weight[origin:origin + tile_length] += ramp[:min(tile_length, length - origin)]
+        weights.append(weight)
+    return np.outer(*weights)
+
+
+def resolve_tiling(height, width, tile_size=None, overlap=DEFAULT_TILE_OVERLAP):
+    """
+    Picks the tile size and overlap for a scene. Without an explicit tile_size the
+    scene is processed as one tile when it fits, and tiled otherwise.
+    """
+    if tile_size is None:
+        fits = max(height, width) <= MAX_UNTILED_SIZE
+        aligned = height % SIZE_MULTIPLE == 0 and width % SIZE_MULTIPLE == 0
+        if fits and aligned:
+            return (height, width), 0
+        tile_size = DEFAULT_TILE_SIZE
+
+    if tile_size % SIZE_MULTIPLE != 0:
+        raise ValueError(f"Tile size must be a multiple of {SIZE_MULTIPLE}, got {tile_size}.")
+    if not 0 <= overlap < tile_size // 2:
+        raise ValueError(f"Tile overlap must be between 0 and half the tile size, got {overlap}.")
+    return (tile_size, tile_size), overlap
+
+
+def available_memory_bytes(device):
+    """Free memory on the device (None means the CPU), or None when the platform does not report it."""
+    if device is not None and device.type == 'cuda':
+        import torch
+        free_bytes, _ = torch.cuda.mem_get_info(device)
+        return free_bytes
     try:
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-        MODEL_PATH = os.path.join(BASE_DIR, 'models', 'siamese_unet_levir_cd.pth')
-        OUTPUT_DIR = os.path.join(BASE_DIR, 'temp_downloads')
-        
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        
-        if not os.path.exists(MODEL_PATH):
-            response = {"status": "error", "message": f"Model file not found at '{MODEL_PATH}'."}
+        # MemAvailable counts reclaimable page cache, unlike the free page count below
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class InferenceCancelled(Exception):
+    """Raised between tile batches once the caller's `cancelled` event is set."""
+
+
+def check_cancelled(cancelled):
+    if cancelled is not None and cancelled.is_set():
+        raise InferenceCancelled("Inference was cancelled.")
+
+
+def estimate_batch_size(tile_height, tile_width, device):
+    """Largest batch of tiles whose forward pass fits in the memory budget."""
+    available = available_memory_bytes(device)
+    if available is None:
+        return FALLBACK_BATCH_SIZE
+    per_sample = tile_height * tile_width * ACTIVATION_BYTES_PER_PIXEL
+    return int(max(1, min(MAX_BATCH_SIZE, available * MEMORY_BUDGET_FRACTION // per_sample)))
+
+
+def iter_change_logits(model, device, scenes, tile_size=None, overlap=DEFAULT_TILE_OVERLAP, batch_size=None,
+                       cancelled=None):
+    """
+    Runs the network over one or more scenes and yields (scene_index, logits) as each
+    scene completes, where logits is the (H, W) float32 change-logit map.
+
+    `scenes` is a list of (source_t1, source_t2, height, width) tuples; see
+    read_rgb_window for the accepted sources. Tiles of every scene that share a tile
+    shape are read on demand and pushed through the model together, and overlapping
+    tiles are blended with linear ramps. Network memory is therefore bounded by the
+    tile and batch size (sized to free memory unless given), not by the scene size or
+    the number of scenes. `model` may be a torch module or an execution backend.
+    `cancelled` is an optional threading.Event; once it is set, InferenceCancelled is
+    raised before the next batch.
+    """
+    import numpy as np
+
+    backend = as_backend(model, device)
+    plans = []
+    for source_t1, source_t2, height, width in scenes:
+        tile_shape, scene_overlap = resolve_tiling(height, width, tile_size, overlap)
+        origins_y = tile_origins(height, tile_shape[0], scene_overlap)
+        origins_x = tile_origins(width, tile_shape[1], scene_overlap)
+        plans.append({
+            'sources': (source_t1, source_t2),
+            'shape': (height, width),
+            'tile_shape': tile_shape,
+            'ramps': (blend_ramp(tile_shape[0], scene_overlap), blend_ramp(tile_shape[1], scene_overlap)),
+            'origins': (origins_y, origins_x),
+            'remaining': len(origins_y) * len(origins_x),
+            'logits': None
+        })
+
+    # Tiles can only share a batch when they have the same shape
+    groups = {}
+    for index, plan in enumerate(plans):
+        groups.setdefault(plan['tile_shape'], []).append(index)
+
+    for (tile_h, tile_w), indices in groups.items():
+        tiles = [(index, y, x) for index in indices
+                 for y in plans[index]['origins'][0] for x in plans[index]['origins'][1]]
+        size = batch_size or estimate_batch_size(tile_h, tile_w, backend.device)
+        batch_t1 = np.zeros((size, 3, tile_h, tile_w), dtype=np.float32)
+        batch_t2 = np.zeros((size, 3, tile_h, tile_w), dtype=np.float32)
+
+        for start in range(0, len(tiles), size):
+            check_cancelled(cancelled)
+            batch_tiles = tiles[start:start + size]
+            with stage_metrics.stage('decode'):
+                for i, (index, y, x) in enumerate(batch_tiles):
+                    height, width = plans[index]['shape']
+                    for batch, source in zip((batch_t1, batch_t2), plans[index]['sources']):
+                        fill_tile(batch, i, source, y, x, height, width)
+
+            count = len(batch_tiles)
+            with stage_metrics.stage('forward'):
+                output = backend.predict(batch_t1[:count], batch_t2[:count])[:, 0]
+
+            for i, (index, y, x) in enumerate(batch_tiles):
+                plan = plans[index]
+                height, width = plan['shape']
+                ramp_y, ramp_x = plan['ramps']
+                if plan['logits'] is None:
+                    plan['logits'] = np.zeros((height, width), dtype=np.float32)
+                h, w = min(tile_h, height - y), min(tile_w, width - x)
+                plan['logits'][y:y + h, x:x + w] += output[i, :h, :w] * np.outer(ramp_y[:h], ramp_x[:w])
+
+                plan['remaining'] -= 1
+                if plan['remaining'] == 0:
+                    logits = plan['logits']
+                    logits /= blend_weights(height, width, plan['tile_shape'], plan['origins'], plan['ramps'])
+                    plan['logits'] = None
+                    yield index, logits
+
+
+def predict_change_logits(model, device, source_t1, source_t2, height, width, tile_size=None,
+                          overlap=DEFAULT_TILE_OVERLAP, batch_size=None, cancelled=None):
+    """Returns the (H, W) float32 change logits for a single scene (see iter_change_logits)."""
+    scenes = [(source_t1, source_t2, height, width)]
+    for _, logits in iter_change_logits(model, device, scenes, tile_size, overlap, batch_size, cancelled):
+        return logits
+
+
+def predict_change_logits_incremental(model, device, source_t1, source_t2, height, width, baseline=None,
+                                      tile_size=None, overlap=DEFAULT_TILE_OVERLAP, batch_size=None,
+                                      cancelled=None, max_feature_bytes=MAX_BASELINE_FEATURE_BYTES):
+    """
+    Single-scene predict_change_logits() for monitoring, where a later check may select
+    the same T1 scene again. `baseline` holds T1 encoder features returned by an earlier
+    call (one (tiles, C, h, w) array per encoder level); when it matches the tiling,
+    source_t1 is not read at all and the T1 encoder is skipped. Otherwise the features
+    the T1 encoder computes anyway are kept, unless they would exceed max_feature_bytes.
+    Returns:
+        tuple: ((H, W) float32 logits, whether `baseline` was used, the BASELINE_FEATURE_DTYPE
+               T1 features to store, or None when `baseline` was used or they were too large).
+    """
+    import numpy as np
+
+    backend = as_backend(model, device)
+    if not getattr(backend, 'supports_baseline', False):
+        raise ValueError(f"The {backend.name} backend cannot run from cached baseline features.")
+
+    tile_shape, scene_overlap = resolve_tiling(height, width, tile_size, overlap)
+    origins = (tile_origins(height, tile_shape[0], scene_overlap), tile_origins(width, tile_shape[1], scene_overlap))
+    ramps = (blend_ramp(tile_shape[0], scene_overlap), blend_ramp(tile_shape[1], scene_overlap))
+    tiles = [(y, x) for y in origins[0] for x in origins[1]]
+    if baseline is not None and (baseline[0].shape[0] != len(tiles) or baseline[0].shape[2:] != tile_shape):
+        baseline = None  # Cached for a different tiling
+
+    size = batch_size or estimate_batch_size(*tile_shape, backend.device)
+    batch_t1 = np.zeros((size, 3) + tile_shape, dtype=np.float32)
+    batch_t2 = np.zeros((size, 3) + tile_shape, dtype=np.float32)
+    logits = np.zeros((height, width), dtype=np.float32)
+    features = [] if baseline is None else None
+
+    for start in range(0, len(tiles), size):
+        check_cancelled(cancelled)
+        batch_tiles = tiles[start:start + size]
+        count = len(batch_tiles)
+        with stage_metrics.stage('decode'):
+            for i, (y, x) in enumerate(batch_tiles):
+                fill_tile(batch_t2, i, source_t2, y, x, height, width)
+                if baseline is None:
+                    fill_tile(batch_t1, i, source_t1, y, x, height, width)
+        if baseline is None:
+            with stage_metrics.stage('encode_baseline'):
+                t1_skips = backend.encode_baseline(batch_t1[:count])
+            if features is not None:
+                features.append([skip.astype(BASELINE_FEATURE_DTYPE) for skip in t1_skips])
+                tile_bytes = sum(level.nbytes for level in features[0]) / len(features[0][0])
+                if tile_bytes * len(tiles) > max_feature_bytes:
+                    features = None  # Too large to keep; this run continues without collecting
+        else:
+            t1_skips = [level[start:start + count] for level in baseline]
+
+        with stage_metrics.stage('forward'):
+            output = backend.predict_with_baseline(t1_skips, batch_t2[:count])[:, 0]
+        for i, (y, x) in enumerate(batch_tiles):
+            h, w = min(tile_shape[0], height - y), min(tile_shape[1], width - x)
+            logits[y:y + h, x:x + w] += output[i, :h, :w] * np.outer(ramps[0][:h], ramps[1][:w])
+
+    logits /= blend_weights(height, width, tile_shape, origins, ramps)
+    if features is not None:
+        features = [np.concatenate(levels) for levels in zip(*features)]
+    return logits, baseline is not None, features
+
+
+def check_pair_exists(t1_path, t2_path):
+    if not os.path.exists(t1_path) or not os.path.exists(t2_path):
+        raise FileNotFoundError(f"Error: One or both input images not found. "
+                                f"Please check the paths: '{t1_path}' and '{t2_path}'.")
+
+
+def read_pair_metadata(t1_path, t2_path):
+    """Checks that both rasters exist and match, and returns (height, width, crs, transform) of T1."""
+    import rasterio
+
+    check_pair_exists(t1_path, t2_path)
+    with rasterio.open(t1_path) as src_t1, rasterio.open(t2_path) as src_t2:
+        if (src_t1.height, src_t1.width) != (src_t2.height, src_t2.width):
+            raise ValueError("Input images for U-Net inference must have the same dimensions.")
+        return src_t1.height, src_t1.width, src_t1.crs, src_t1.transform
+
+
+def save_change_outputs(logits, t2_path, crs, transform, output_dir,
+                        change_mask_filename='unet_change_mask.tif', t2_filename=None, t2_rgb=None,
+                        visualizations='sync'):
+    """
+    Thresholds the logits into the change mask, writes the mask as a Cloud-Optimized
+    GeoTIFF and the PNG visualizations to output_dir and returns the JSON response for the backend.
+    `t2_rgb` is the already decoded (3, H, W) T2 RGB array; it is read from t2_path when omitted.
+    `visualizations` is one of change_visualization.VISUALIZATION_MODES: render the PNGs
+    now, on a background thread, or only when they are first downloaded.
+    """
+    import numpy as np
+    import rasterio
+    from cog_writer import CogWriter
+
+    if visualizations not in change_visualization.VISUALIZATION_MODES:
+        raise ValueError(f"Unknown visualization mode '{visualizations}'.")
+    change_mask_path = os.path.join(output_dir, change_mask_filename)
+
+    # The mask is written as a 1-bit COG one internal tile at a time, straight from the logits
+    # (sigmoid(logit) > 0.5 is the same test as logit > 0)
+    height, width = logits.shape
+    change_pixels = 0
+    with stage_metrics.stage('mask_write'), \
+            CogWriter(change_mask_path, height, width, 1, rasterio.uint8, crs, transform, kind='mask') as dst:
+        for window in dst.block_windows():
+            tile_mask = (logits[window.toslices()] > 0).astype(np.uint8)
+            change_pixels += int(np.count_nonzero(tile_mask))
+            dst.write(tile_mask, window)
+
+    t2_filename = t2_filename or os.path.basename(t2_path)
+    if visualizations == 'deferred':
+        blended_filename, change_only_filename = change_visualization.defer_visualizations(
+            t2_path, change_mask_path, output_dir, t2_filename)
+    else:
+        if t2_rgb is None:
+            with stage_metrics.stage('decode'), rasterio.open(t2_path) as src_t2:
+                t2_rgb = src_t2.read([1, 2, 3])
+        change_mask = logits > 0
+        if visualizations == 'background':
+            (blended_filename, change_only_filename), _ = change_visualization.submit_visualizations(
+                t2_rgb, change_mask, output_dir, t2_filename)
+        else:
+            with stage_metrics.stage('png_encode'):
+                blended_filename, change_only_filename = change_visualization.save_visualizations(
+                    t2_rgb, change_mask, output_dir, t2_filename)
+
+    total_pixels = height * width
+    change_pixels_float = float(change_pixels)
+    change_percentage_float = float((change_pixels_float / total_pixels) * 100)
+
+    return {
+        "status": "success",
+        "message": "U-Net inference completed successfully.",
+        "percentage_change": change_percentage_float,
+        "total_change_pixels": int(change_pixels_float),
+        "change_mask_path": change_mask_filename, # This is the GeoTIFF
+        "change_overlay_png": blended_filename,    # New PNG for visualization
+        "change_only_png": change_only_filename    # New PNG for visualization
+    }
+
+
+def run_inference(model, device, t1_path, t2_path, output_dir=OUTPUT_DIR, tile_size=None,
+                  tile_overlap=DEFAULT_TILE_OVERLAP, tile_batch_size=None, visualizations='sync', cancelled=None):
+    """
+    Runs change detection for one image pair with an already loaded model.
+    Writes the GeoTIFF mask and PNG visualizations to output_dir and returns the
+    JSON-serializable response that is sent to the backend. Scenes larger than
+    MAX_UNTILED_SIZE (or any scene, when tile_size is given) are processed tile by tile.
+    See save_change_outputs for `visualizations` and iter_change_logits for `cancelled`.
+    """
+    import rasterio
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    height, width, crs, transform = read_pair_metadata(t1_path, t2_path)
+    with rasterio.open(t1_path) as src_t1, rasterio.open(t2_path) as src_t2:
+        logits = predict_change_logits(model, device, src_t1, src_t2, height, width,
+                                       tile_size=tile_size, overlap=tile_overlap,
+                                       batch_size=tile_batch_size, cancelled=cancelled)
+
+    return save_change_outputs(logits, t2_path, crs, transform, output_dir, visualizations=visualizations)
+
+
+def run_incremental_inference(model, device, t1_path, t2_path, baseline=None, output_dir=OUTPUT_DIR,
+                              tile_size=None, tile_overlap=DEFAULT_TILE_OVERLAP, tile_batch_size=None,
+                              visualizations='sync', cancelled=None):
+    """
+    run_inference() for monitoring: `baseline` holds stored T1 encoder features of the
+    T1 scene (see predict_change_logits_incremental). Returns (response, features),
+    where response["baseline_reused"] tells whether the T1 encoder was skipped and
+    features are the T1 features to store, or None.
+    """
+    import rasterio
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    height, width, crs, transform = read_pair_metadata(t1_path, t2_path)
+    with rasterio.open(t2_path) as src_t2:
+        logits, reused, features = predict_change_logits_incremental(
+            model, device, t1_path, src_t2, height, width, baseline=baseline, tile_size=tile_size,
+            overlap=tile_overlap, batch_size=tile_batch_size, cancelled=cancelled)
+
+    response = save_change_outputs(logits, t2_path, crs, transform, output_dir, visualizations=visualizations)
+    response['baseline_reused'] = reused
+    return response, features
+
+
+def run_batch_inference(model, device, pairs, output_dir=OUTPUT_DIR, tile_size=None,
+                        tile_overlap=DEFAULT_TILE_OVERLAP, tile_batch_size=None, visualizations='sync'):
+    """
+    Runs change detection for many image pairs, batching whole scenes (or their
+    tiles) through the model together. `pairs` is a list of {"t1_path", "t2_path",
+    optional "id"} dicts or (t1_path, t2_path) tuples. Returns one response per pair,
+    in input order; a pair that cannot be read gets an error response instead of
+    failing the batch. Output files are suffixed with the pair id (default: its index).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    responses = [None] * len(pairs)
+    scenes, jobs = [], []
+    for index, pair in enumerate(pairs):
+        if isinstance(pair, dict):
+            t1_path, t2_path, pair_id = pair.get('t1_path'), pair.get('t2_path'), pair.get('id', index)
+        else:
+            (t1_path, t2_path), pair_id = pair, index
+        try:
+            height, width, crs, transform = read_pair_metadata(t1_path, t2_path)
+        except Exception as e:
+            responses[index] = {"status": "error", "id": pair_id, "message": f"Processing Error: {e}"}
+            continue
+        scenes.append((t1_path, t2_path, height, width))
+        jobs.append((index, pair_id, t2_path, crs, transform))
+
+    for scene_index, logits in iter_change_logits(model, device, scenes, tile_size, tile_overlap, tile_batch_size):
+        index, pair_id, t2_path, crs, transform = jobs[scene_index]
+        base_filename, extension = os.path.splitext(os.path.basename(t2_path))
+        response = save_change_outputs(logits, t2_path, crs, transform, output_dir,
+                                       change_mask_filename=f"unet_change_mask_{pair_id}.tif",
+                                       t2_filename=f"{base_filename}_{pair_id}{extension}",
+                                       visualizations=visualizations)
+        response['id'] = pair_id
+        responses[index] = response
+
+    return responses
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTPConnection that talks to a server listening on a Unix domain socket."""
+    def __init__(self, socket_path, timeout=None):
+        super(UnixHTTPConnection, self).__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def post_inference_job(server_address, endpoint, job, timeout=REMOTE_TIMEOUT_SECONDS):
+    """
+    POSTs a JSON job to a running inference_server.py and returns its decoded JSON reply.
+    Raises one of SERVER_UNAVAILABLE_ERRORS when no server is listening, and a
+    RuntimeError when the server does not answer within the timeout.
+    """
+    if server_address.startswith('unix://'):
+        connection = UnixHTTPConnection(server_address[len('unix://'):], timeout=timeout)
+    else:
+        parsed = urllib.parse.urlsplit(server_address)
+        connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+
+    try:
+        connection.request('POST', endpoint, body=json.dumps(job), headers={'Content-Type': 'application/json'})
+        return json.loads(connection.getresponse().read().decode('utf-8'))
+    except socket.timeout:
+        raise RuntimeError(f"Inference server at '{server_address}' did not answer within {timeout}s; "
+                           f"not running the job locally while the server may still be working on it.")
+    finally:
+        connection.close()
+
+
+def request_remote_inference(server_address, t1_path, t2_path, options=None, timeout=REMOTE_TIMEOUT_SECONDS):
+    """
+    Sends one pair to a running inference_server.py and returns its JSON response.
+    `options` carries extra run_inference keyword arguments (e.g. tile_size).
+    """
+    job = dict(options or {}, t1_path=os.path.abspath(t1_path), t2_path=os.path.abspath(t2_path))
+    return post_inference_job(server_address, '/infer', job, timeout)
+
+
+def load_pairs(pairs_path):
+    """Reads a JSON list of pairs for batch mode from a file, or from stdin when pairs_path is '-'."""
+    if pairs_path == '-':
+        pairs = json.load(sys.stdin)
+    else:
+        with open(pairs_path, 'r') as f:
+            pairs = json.load(f)
+    if not isinstance(pairs, list):
+        raise ValueError("The pairs file must contain a JSON list.")
+    # Resolve relative paths here so a remote server sees the same files
+    resolved = []
+    for pair in pairs:
+        if isinstance(pair, dict):
+            pair = dict(pair, t1_path=os.path.abspath(pair['t1_path']), t2_path=os.path.abspath(pair['t2_path']))
+        else:
+            pair = [os.path.abspath(path) for path in pair]
+        resolved.append(pair)
+    return resolved
+
+
+def load_inference_model(backend='torch', fuse=True, int8=False):
+    """Loads the execution backend for the command-line entry points."""
+    if backend == 'torch' and not int8 and not os.path.exists(MODEL_PATH):
+        response = {"status": "error", "message": f"Model file not found at '{MODEL_PATH}'."}
+        print(json.dumps(response), file=sys.stderr)
+        sys.exit(1)
+
+    return load_backend(backend, fuse=fuse, int8=int8)
+
+
+def compare_backends(t1_path, t2_path, names=BACKENDS, tile_size=None, tile_overlap=DEFAULT_TILE_OVERLAP):
+    """
+    Runs the same pair through each backend and reports load and inference time,
+    the detected change and the largest logit difference from the first backend that
+    ran. Backends that cannot be loaded (missing export or runtime) are reported as errors.
+    """
+    import numpy as np
+
+    height, width, _, _ = read_pair_metadata(t1_path, t2_path)
+    results = []
+    reference = None
+    for name in names:
+        try:
+            start = time.perf_counter()
+            backend = load_backend(name)
+            load_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            logits = predict_change_logits(backend, backend.device, t1_path, t2_path, height, width,
+                                           tile_size=tile_size, overlap=tile_overlap)
+            inference_seconds = time.perf_counter() - start
+        except Exception as e:
+            results.append({"backend": name, "status": "error", "message": str(e)})
+            continue
+
+        if reference is None:
+            reference = logits
+        results.append({
+            "backend": name,
+            "status": "success",
+            "load_seconds": load_seconds,
+            "inference_seconds": inference_seconds,
+            "percentage_change": float(np.count_nonzero(logits > 0) / logits.size * 100),
+            "max_logit_difference": float(np.abs(logits - reference).max())
+        })
+    return results
+
+
+def main(t1_path, t2_path, tile_size=None, tile_overlap=DEFAULT_TILE_OVERLAP, tile_batch_size=None, fuse=True,
+         int8=False, backend='torch', visualizations='sync'):
+    metrics = stage_metrics.StageMetrics()
+    metrics.record_import()
+    try:
+        options = {"tile_size": tile_size, "tile_overlap": tile_overlap, "tile_batch_size": tile_batch_size,
+                   "visualizations": visualizations}
+        response = None
+        server_address = os.environ.get(INFERENCE_SERVER_ENV)
+        with stage_metrics.collect(metrics):
+            if server_address:
+                try:
+                    with stage_metrics.stage('remote_inference'):
+                        response = request_remote_inference(server_address, t1_path, t2_path, options)
+                except SERVER_UNAVAILABLE_ERRORS as e:
+                    # The server is optional; fall back to loading the model in this process.
+                    print(f"Inference server at '{server_address}' unavailable ({e}), running locally.",
+                          file=sys.stderr)
+
+            if response is None:
+                model = load_inference_model(backend, fuse, int8)
+                response = run_inference(model, model.device, t1_path, t2_path, **options)
+
+        # Stages run by an inference server are reported next to the ones of this process
+        server_metrics = response.get('metrics')
+        response['metrics'] = metrics.as_dict()
+        if server_metrics:
+            response['metrics']['server'] = server_metrics
+
+        if response.get('status') != 'success':
             print(json.dumps(response), file=sys.stderr)
             sys.exit(1)
 
-        model = SiameseUNet(in_channels=3, out_channels=1)
-        model.load_state_dict(torch.load(MODEL_PATH, map_location=device))
-        model.to(device)
-        model.eval()
-        
-        transform_inference = transforms.Compose([
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
-        ])
-
-        if not os.path.exists(t1_path) or not os.path.exists(t2_path):
-            raise FileNotFoundError(f"Error: One or both input images not found. "
-                                    f"Please check the paths: '{t1_path}' and '{t2_path}'.")
-
-        with rasterio.open(t1_path) as src_t1:
-            original_t1_array = src_t1.read()
-            t1_transform = src_t1.transform
-            t1_crs = src_t1.crs
-        
-        with rasterio.open(t2_path) as src_t2:
-            original_t2_array = src_t2.read()
-            
-        original_t1_pil = Image.fromarray(np.transpose(original_t1_array[:3], (1, 2, 0)))
-        original_t2_pil = Image.fromarray(np.transpose(original_t2_array[:3], (1, 2, 0)))
-        
-        input_t1 = transform_inference(original_t1_pil).unsqueeze(0).to(device)
-        input_t2 = transform_inference(original_t2_pil).unsqueeze(0).to(device)
+        print(f"Blended image saved to: {os.path.join(OUTPUT_DIR, response['change_overlay_png'])}")
+        print(f"Change-only image saved to: {os.path.join(OUTPUT_DIR, response['change_only_png'])}")
+        print(f"Detected change: {response['percentage_change']:.2f}%")
+        print(f"Total change pixels: {response['total_change_pixels']}")
+        print(f"Change mask saved to: {os.path.join(OUTPUT_DIR, response['change_mask_path'])}")
 
-        with torch.no_grad():
-            output = model(input_t1, input_t2)
-
-        change_mask = (torch.sigmoid(output) > 0.5).float().squeeze(0).squeeze(0).cpu().numpy()
-
-        # --- NEW: Visualization and Saving ---
-        t2_filename = os.path.basename(t2_path)
-        blended_filename, change_only_filename = create_and_save_visualizations(
-            np.array(original_t2_pil), # Pass the original T2 image array
-            change_mask, 
-            OUTPUT_DIR,
-            t2_filename
-        )
-        print(f"Blended image saved to: {os.path.join(OUTPUT_DIR, blended_filename)}")
-        print(f"Change-only image saved to: {os.path.join(OUTPUT_DIR, change_only_filename)}")
-        # --- End of New Code ---
-        
-        # --- 2.6. Save and report the results as a GeoTIFF ---
-        total_pixels = change_mask.shape[0] * change_mask.shape[1]
-        change_pixels_float = float(np.sum(change_mask))
-        change_percentage_float = float((change_pixels_float / total_pixels) * 100)
-        
-        change_mask_filename = 'unet_change_mask.tif'
-        change_mask_path = os.path.join(OUTPUT_DIR, change_mask_filename)
-
-        profile = {
-            'driver': 'GTiff',
-            'height': change_mask.shape[0],
-            'width': change_mask.shape[1],
-            'count': 1,
-            'dtype': rasterio.uint8,
-            'crs': t1_crs,
-            'transform': t1_transform,
-            'compress': 'LZW'
-        }
-        with rasterio.open(change_mask_path, 'w', **profile) as dst:
-            dst.write(change_mask.astype(rasterio.uint8), 1)
-
-        print(f"Detected change: {change_percentage_float:.2f}%")
-        print(f"Total change pixels: {int(change_pixels_float)}")
-        print(f"Change mask saved to: {change_mask_path}")
-
-        # --- 2.7. Send a JSON response to the backend ---
-        response = {
-            "status": "success",
-            "message": "U-Net inference completed successfully.",
-            "percentage_change": change_percentage_float,
-            "total_change_pixels": int(change_pixels_float),
-            "change_mask_path": change_mask_filename, # This is the GeoTIFF
-            "change_overlay_png": blended_filename,    # New PNG for visualization
-            "change_only_png": change_only_filename    # New PNG for visualization
-        }
         print(json.dumps(response))
 
+    except Exception as e:
+        response = {"status": "error", "message": f"Processing Error: {e}", "metrics": metrics.as_dict()}
+        print(json.dumps(response), file=sys.stderr)
+        sys.exit(1)
+
+
+def main_batch(pairs_path, tile_size=None, tile_overlap=DEFAULT_TILE_OVERLAP, tile_batch_size=None, fuse=True,
+               int8=False, backend='torch', visualizations='sync'):
+    """
+    Batch mode: runs every pair listed in pairs_path and prints one JSON array of responses.
+    The pairs share their decode and forward stages, so every response carries the metrics
+    of the whole batch.
+    """
+    metrics = stage_metrics.StageMetrics()
+    metrics.record_import()
+    try:
+        pairs = load_pairs(pairs_path)
+        options = {"tile_size": tile_size, "tile_overlap": tile_overlap, "tile_batch_size": tile_batch_size,
+                   "visualizations": visualizations}
+        responses = None
+        server_address = os.environ.get(INFERENCE_SERVER_ENV)
+        with stage_metrics.collect(metrics):
+            if server_address:
+                try:
+                    with stage_metrics.stage('remote_inference'):
+                        responses = post_inference_job(server_address, '/infer_batch', dict(options, pairs=pairs))
+                except SERVER_UNAVAILABLE_ERRORS as e:
+                    print(f"Inference server at '{server_address}' unavailable ({e}), running locally.",
+                          file=sys.stderr)
+
+            if responses is None:
+                model = load_inference_model(backend, fuse, int8)
+                responses = run_batch_inference(model, model.device, pairs, **options)
+
+        if isinstance(responses, dict):
+            # The server reports request-level failures as a single error object
+            responses['metrics'] = metrics.as_dict()
+            print(json.dumps(responses), file=sys.stderr)
+            sys.exit(1)
+
+        batch_metrics = metrics.as_dict()
+        for response in responses:
+            server_metrics = response.get('metrics')
+            response['metrics'] = dict(batch_metrics, server=server_metrics) if server_metrics else batch_metrics
+        print(json.dumps(responses))
+
+    except Exception as e:
+        response = {"status": "error", "message": f"Processing Error: {e}", "metrics": metrics.as_dict()}
+        print(json.dumps(response), file=sys.stderr)
+        sys.exit(1)
+
+
+def main_compare(t1_path, t2_path, names, tile_size=None, tile_overlap=DEFAULT_TILE_OVERLAP):
+    """Backend comparison mode: prints per-backend timing for one pair as JSON."""
+    try:
+        results = compare_backends(t1_path, t2_path, names, tile_size, tile_overlap)
+        print(json.dumps({"status": "success", "backends": results}))
     except Exception as e:
         response = {"status": "error", "message": f"Processing Error: {e}"}
         print(json.dumps(response), file=sys.stderr)
         sys.exit(1)
 
 
+def validate_arguments(args):
+    """
+    Checks the command line before anything heavy is imported, so a bad call fails
+    within milliseconds. Raises ValueError or FileNotFoundError.
+    """
+    if args.t1_path and args.t2_path:
+        check_pair_exists(args.t1_path, args.t2_path)
+    if args.pairs and args.pairs != '-' and not os.path.isfile(args.pairs):
+        raise FileNotFoundError(f"Pairs file not found: '{args.pairs}'.")
+    if args.tile_size is not None:
+        resolve_tiling(args.tile_size, args.tile_size, args.tile_size, args.tile_overlap)
+    if args.tile_batch_size is not None and args.tile_batch_size < 1:
+        raise ValueError(f"Tile batch size must be at least 1, got {args.tile_batch_size}.")
+
+
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
+    parser = argparse.ArgumentParser(description="SiameseUNet change detection for a T1/T2 image pair.")
+    parser.add_argument('t1_path', nargs='?')
+    parser.add_argument('t2_path', nargs='?')
+    parser.add_argument('--pairs', help="Batch mode: JSON file (or '-' for stdin) with a list of "
+                                        "{\"t1_path\", \"t2_path\", \"id\"} pairs; prints a JSON array.")
+    parser.add_argument('--tile-size', type=int, default=None,
+                        help=f"Run sliding-window inference with this tile size (default: tile only "
+                             f"scenes larger than {MAX_UNTILED_SIZE}px, using {DEFAULT_TILE_SIZE}px tiles).")
+    parser.add_argument('--tile-overlap', type=int, default=DEFAULT_TILE_OVERLAP,
+                        help="Overlap in pixels between neighbouring tiles, blended linearly.")
+    parser.add_argument('--tile-batch-size', type=int, default=None,
+                        help="Number of tiles per forward pass (default: sized to free memory).")
+    parser.add_argument('--no-fuse', dest='fuse', action='store_false',
+                        help="Run the checkpoint as-is instead of the BatchNorm-folded, stacked-encoder model.")
+    parser.add_argument('--int8', action='store_true',
+                        help="Use the INT8 CPU model created by unet_quantize.py.")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="Runtime for the network; torchscript/onnxruntime need unet_export.py first.")
+    parser.add_argument('--compare-backends', nargs='*', choices=BACKENDS, metavar='BACKEND',
+                        help="Run the pair through each backend (default: all) and print per-backend timing.")
+    parser.add_argument('--visualizations', choices=change_visualization.VISUALIZATION_MODES, default='sync',
+                        help="Render the PNGs now, on a background thread, or on first download (deferred).")
+    args = parser.parse_args()
+    try:
+        validate_arguments(args)
+    except (ValueError, OSError) as e:
+        print(json.dumps({"status": "error", "message": f"Processing Error: {e}"}), file=sys.stderr)
+        sys.exit(1)
+
+    if args.compare_backends is not None and args.t1_path and args.t2_path:
+        main_compare(args.t1_path, args.t2_path, args.compare_backends or BACKENDS,
+                     tile_size=args.tile_size, tile_overlap=args.tile_overlap)
+    elif args.pairs:
+        main_batch(args.pairs, tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+                   tile_batch_size=args.tile_batch_size, fuse=args.fuse, int8=args.int8,
+                   backend=args.backend, visualizations=args.visualizations)
+    elif not args.t1_path or not args.t2_path:
         response = {"status": "error", "message": "Missing command-line arguments (t1_path, t2_path)."}
         print(json.dumps(response), file=sys.stderr)
         sys.exit(1)
-    
-    t1_path = sys.argv[1]
-    t2_path = sys.argv[2]
-    
-    main(t1_path, t2_path)
+    else:
+        main(args.t1_path, args.t2_path, tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+             tile_batch_size=args.tile_batch_size, fuse=args.fuse, int8=args.int8,
+             backend=args.backend, visualizations=args.visualizations)
 
 
 # def main(t1_path, t2_path):
@@ -0,0 +1,182 @@
+# processing/unet_quantize.py
+#
+# Builds an INT8 SiameseUNet for CPU inference with FX graph mode static
+# quantization. Activation ranges are calibrated on sample image pairs, and the
+# report compares INT8 masks against the fp32 masks (IoU / F1) so the accuracy
+# cost can be judged before enabling it with `unet_inference.py --int8`.
+#
+#   python unet_quantize.py --calibration images/train_94.png images/train_94B.png
+#
+# Dynamic quantization is not offered: PyTorch only applies it to Linear/RNN
+# layers, and this network is all convolutions.
+
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+import numpy as np
+import torch
+import rasterio
+from PIL import Image
+
+import unet_inference
+from siamese_unet import fuse_for_inference
+
+DEFAULT_CALIBRATION_PAIRS = [
+    (os.path.join(unet_inference.BASE_DIR, 'images', 'train_94.png'),
+     os.path.join(unet_inference.BASE_DIR, 'images', 'train_94B.png'))
+]
+# Calibration runs on crops of this size to keep the observer pass cheap
+CALIBRATION_TILE_SIZE = 256
+
+
+def read_rgb_array(image_path):
+    """Reads a PNG/JPEG or GeoTIFF into a (3, H, W) uint8 array."""
+    if os.path.splitext(image_path)[1].lower() in ('.tif', '.tiff'):
+        with rasterio.open(image_path) as src:
+            return src.read([1, 2, 3])
+    with Image.open(image_path) as image:
+        return np.transpose(np.asarray(image.convert('RGB')), (2, 0, 1))
+
+
+def load_pairs(pair_paths):
+    """Loads (t1, t2) path tuples into (t1_rgb, t2_rgb) arrays, checking their shapes."""
+    pairs = []
+    for t1_path, t2_path in pair_paths:
+        t1_rgb, t2_rgb = read_rgb_array(t1_path), read_rgb_array(t2_path)
+        if t1_rgb.shape != t2_rgb.shape:
+            raise ValueError(f"Pair '{t1_path}' / '{t2_path}' has mismatched dimensions.")
+        pairs.append((t1_rgb, t2_rgb))
+    return pairs
+
+
+def iter_calibration_batches(pairs, tile_size=CALIBRATION_TILE_SIZE):
+    """Yields normalized (1, 3, tile, tile) T1/T2 tensors covering every calibration pair."""
+    for t1_rgb, t2_rgb in pairs:
+        _, height, width = t1_rgb.shape
+        for y in unet_inference.tile_origins(height, tile_size, 0):
+            for x in unet_inference.tile_origins(width, tile_size, 0):
+                window = (slice(None), slice(y, y + tile_size), slice(x, x + tile_size))
+                yield (torch.from_numpy(unet_inference.normalize_rgb(t1_rgb[window])).unsqueeze(0),
+                       torch.from_numpy(unet_inference.normalize_rgb(t2_rgb[window])).unsqueeze(0))
+
+
+def quantize_model(model, calibration_pairs, backend=unet_inference.QUANTIZATION_BACKEND):
+    """
+    Returns a statically quantized INT8 copy of an eval-mode SiameseUNet, traced to
+    TorchScript. FX fuses Conv2d/BatchNorm2d/ReLU itself, so the unfused checkpoint
+    is expected here. Observers are calibrated on calibration_pairs.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    torch.backends.quantized.engine = backend
+    batches = list(iter_calibration_batches(calibration_pairs))
+    if not batches:
+        raise ValueError("At least one calibration pair is required.")
+
+    with warnings.catch_warnings():
+        # torch.ao.quantization is deprecated in favour of torchao but still the
+        # only in-tree path for quantized convolutions.
+        warnings.simplefilter('ignore')
+        prepared = prepare_fx(model, get_default_qconfig_mapping(backend), example_inputs=batches[0])
+        with torch.no_grad():
+            for x1, x2 in batches:
+                prepared(x1, x2)
+        quantized = convert_fx(prepared)
+        with torch.no_grad():
+            traced = torch.jit.trace(quantized, batches[0])
+    return torch.jit.freeze(traced.eval())
+
+
+def mask_agreement(reference_mask, candidate_mask):
+    """IoU and F1 of the candidate change mask against the reference mask."""
+    true_positive = int(np.count_nonzero(reference_mask & candidate_mask))
+    false_positive = int(np.count_nonzero(~reference_mask & candidate_mask))
+    false_negative = int(np.count_nonzero(reference_mask & ~candidate_mask))
+    union = true_positive + false_positive + false_negative
+    # Two empty masks agree perfectly
+    iou = true_positive / union if union else 1.0
+    f1 = 2 * true_positive / (2 * true_positive + false_positive + false_negative) if union else 1.0
+    return iou, f1
+
+
+def evaluate(reference_model, quantized_model, pairs):
+    """
+    Runs both models over every pair and reports the INT8 accuracy delta (IoU / F1
+    against the fp32 masks, and the fraction of pixels that agree) plus timings.
+    """
+    device = torch.device('cpu')
+    reference_masks, quantized_masks = [], []
+    timings = {'fp32': 0.0, 'int8': 0.0}
+    for t1_rgb, t2_rgb in pairs:
+        _, height, width = t1_rgb.shape
+        for name, model, masks in (('fp32', reference_model, reference_masks),
+                                   ('int8', quantized_model, quantized_masks)):
+            start = time.perf_counter()
+            logits = unet_inference.predict_change_logits(model, device, t1_rgb, t2_rgb, height, width)
+            timings[name] += time.perf_counter() - start
+            masks.append(logits.ravel() > 0)
+
+    reference_mask = np.concatenate(reference_masks)
+    quantized_mask = np.concatenate(quantized_masks)
+    iou, f1 = mask_agreement(reference_mask, quantized_mask)
+    return {
+        "pairs_evaluated": len(pairs),
+        "iou_vs_fp32": iou,
+        "f1_vs_fp32": f1,
+        "pixel_agreement": float(np.mean(reference_mask == quantized_mask)),
+        "fp32_seconds_per_pair": timings['fp32'] / len(pairs),
+        "int8_seconds_per_pair": timings['int8'] / len(pairs),
+        "speedup": timings['fp32'] / timings['int8'] if timings['int8'] else None
+    }
+
+
+def main(calibration_paths, evaluation_paths, output_path, model_path=unet_inference.MODEL_PATH):
+    try:
+        device = torch.device('cpu')
+        model = unet_inference.load_model(device, model_path, fuse=False)
+        quantized = quantize_model(model, load_pairs(calibration_paths))
+        torch.jit.save(quantized, output_path)
+
+        report = evaluate(fuse_for_inference(model), quantized,
+                          load_pairs(evaluation_paths or calibration_paths))
+        response = {
+            "status": "success",
+            "message": "INT8 model created.",
+            "quantized_model_path": output_path,
+            "fp32_model_mb": os.path.getsize(model_path) / 2**20,
+            "int8_model_mb": os.path.getsize(output_path) / 2**20,
+            **report
+        }
+        print(json.dumps(response))
+
+    except Exception as e:
+        response = {"status": "error", "message": f"Quantization Error: {e}"}
+        print(json.dumps(response), file=sys.stderr)
+        sys.exit(1)
+
+
+def parse_pairs(values, option):
+    if len(values) % 2:
+        print(json.dumps({"status": "error", "message": f"{option} expects T1/T2 paths in pairs."}), file=sys.stderr)
+        sys.exit(1)
+    return list(zip(values[0::2], values[1::2]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create and evaluate an INT8 SiameseUNet for CPU inference.")
+    parser.add_argument('--calibration', nargs='+', metavar='PATH',
+                        help="T1 T2 [T1 T2 ...] pairs used to calibrate activation ranges "
+                             "(default: images/train_94.png images/train_94B.png).")
+    parser.add_argument('--evaluation', nargs='+', metavar='PATH',
+                        help="T1 T2 [T1 T2 ...] pairs for the IoU/F1 report (default: the calibration pairs).")
+    parser.add_argument('--model', default=unet_inference.MODEL_PATH, help="fp32 checkpoint to quantize.")
+    parser.add_argument('--output', default=unet_inference.QUANTIZED_MODEL_PATH, help="Where to write the INT8 model.")
+    args = parser.parse_args()
+
+    calibration = parse_pairs(args.calibration, '--calibration') if args.calibration else DEFAULT_CALIBRATION_PAIRS
+    evaluation = parse_pairs(args.evaluation, '--evaluation') if args.evaluation else None
+    main(calibration, evaluation, args.output, args.model)